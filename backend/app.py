@@ -11,7 +11,7 @@ from flask_limiter.util import get_remote_address
 
 from config import get_config
 from models.user import db
-from models import User, Listing, Template, OCRScan, AuditLog
+from models import User, Listing, Template, OCRScan, AuditLog, OCRResultCache
 
 # Import blueprints
 from routes.auth import auth_bp
@@ -20,11 +20,19 @@ from routes.templates import templates_bp
 from routes.ocr import ocr_bp
 from routes.export import export_bp
 from routes.admin import admin_bp
+from utils.ocr_jobs import recover_scans
+from utils.ocr_engines import preload_engines, engine_readiness
+from utils.ocr_pool import pool_readiness, start_pool
+from utils.ocr_service import service_status
+from utils.file_upload import FileTooLarge, UploadRequest
+from utils.retention import start_retention_sweeper, sweep_retention_command
 
 
 def create_app(config_name=None):
     """Application factory"""
     app = Flask(__name__)
+    # OCR upload parts are size-limited, hashed and counted while the body is parsed
+    app.request_class = UploadRequest
     
     # Load configuration
     if config_name is None:
@@ -71,6 +79,9 @@ def create_app(config_name=None):
     app.register_blueprint(export_bp, url_prefix='/api/export')
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
     
+    # CLI: flask sweep-retention
+    app.cli.add_command(sweep_retention_command)
+    
     # Health check endpoint
     @app.route('/health', methods=['GET'])
     def health_check():
@@ -80,6 +91,20 @@ def create_app(config_name=None):
             'environment': app.config['FLASK_ENV']
         }), 200
     
+    # Readiness endpoint
+    @app.route('/ready', methods=['GET'])
+    def readiness_check():
+        """Readiness endpoint: 503 until preloaded OCR engines are warm"""
+        readiness = engine_readiness()
+        # Recognition runs in the OCR pool: with OCR_PRELOAD, ready once its processes are warm
+        readiness['pool'] = pool_readiness()
+        readiness['ready'] = readiness['ready'] and readiness['pool']['ready']
+        if app.config['OCR_SERVICE_SOCKET']:
+            # PaddleOCR runs in the shared OCR daemon: ready only when it answers
+            readiness['service'] = service_status()
+            readiness['ready'] = readiness['ready'] and readiness['service']['ready']
+        return jsonify(readiness), 200 if readiness['ready'] else 503
+    
     # Root endpoint
     @app.route('/', methods=['GET'])
     def index():
@@ -89,6 +114,7 @@ def create_app(config_name=None):
             'version': '1.0.0',
             'endpoints': {
                 'health': '/health',
+                'ready': '/ready',
                 'auth': '/api/auth',
                 'listings': '/api/listings',
                 'templates': '/api/templates',
@@ -109,6 +135,14 @@ def create_app(config_name=None):
         app.logger.error(f'Internal error: {error}')
         return jsonify({'error': 'Internal server error'}), 500
     
+    @app.errorhandler(413)
+    def request_too_large_handler(error):
+        if isinstance(error, FileTooLarge):
+            return jsonify({'error': 'File size exceeds maximum allowed size',
+                            'max_file_size': app.config['MAX_FILE_SIZE']}), 413
+        return jsonify({'error': 'Request body too large',
+                        'max_request_size': app.config['MAX_CONTENT_LENGTH']}), 413
+    
     @app.errorhandler(429)
     def ratelimit_handler(error):
         return jsonify({'error': 'Rate limit exceeded'}), 429
@@ -116,14 +150,41 @@ def create_app(config_name=None):
     # Database initialization
     with app.app_context():
         db.create_all()
+        
+        # Load OCR engines now (in the gunicorn master when preloading)
+        if app.config['OCR_PRELOAD']:
+            preload_engines(warmup=app.config['OCR_PRELOAD_WARMUP'],
+                            paddle=not app.config['OCR_SERVICE_SOCKET'])
     
     return app
 
 
+def start_worker(app):
+    """
+    Start the background work of a serving process: start the OCR process
+    pool, resume OCR jobs left queued by a previous worker and start the
+    retention sweeper.
+    Called once per server process (gunicorn.conf.py post_worker_init, or
+    `python app.py`), never by create_app, so CLI commands, scripts and
+    tests do not pick up OCR jobs.
+    """
+    with app.app_context():
+        # First, before any thread starts: a preloaded worker forks the pool from itself
+        start_pool()
+        try:
+            recover_scans(app)
+        except Exception as e:
+            app.logger.error(f'OCR job recovery failed: {e}')
+        start_retention_sweeper(app)
+
+
 # Create app instance
 app = create_app()
 
 
 if __name__ == '__main__':
+    # With the reloader only the child process (WERKZEUG_RUN_MAIN) serves
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_worker(app)
     app.run(host='0.0.0.0', port=5000, debug=True)
 
@@ -44,12 +44,65 @@ class Config:
     
     # File Upload
     MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 10485760))  # 10MB
+    MAX_REQUEST_SIZE = int(os.getenv('MAX_REQUEST_SIZE', 104857600))  # 100MB, whole request body (batch uploads)
+    MAX_CONTENT_LENGTH = MAX_REQUEST_SIZE  # Flask rejects larger bodies with 413 before reading them
+    UPLOAD_FORM_OVERHEAD = 65536  # multipart headers and form fields allowed on top of MAX_FILE_SIZE
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', '/tmp/uploads')
     ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'xlsx,xls,csv,png,jpg,jpeg,pdf').split(','))
     
     # OCR
     TESSERACT_PATH = os.getenv('TESSERACT_PATH', '/usr/bin/tesseract')
     OCR_LANGUAGES = os.getenv('OCR_LANGUAGES', 'eng')
+    OCR_TESSDATA_PATH = os.getenv('OCR_TESSDATA_PATH', '')  # tesserocr language data dir (empty = default)
+    OCR_TESSERACT_POOL_SIZE = int(os.getenv('OCR_TESSERACT_POOL_SIZE', 0))  # warm tesserocr APIs (0 = CPU count)
+    OCR_PADDLE_LANG = os.getenv('OCR_PADDLE_LANG', 'en')
+    OCR_DET_LIMIT_SIDE_LEN = int(os.getenv('OCR_DET_LIMIT_SIDE_LEN', 2560))
+    OCR_DET_THRESH = float(os.getenv('OCR_DET_THRESH', 0.3))
+    OCR_DET_BOX_THRESH = float(os.getenv('OCR_DET_BOX_THRESH', 0.5))
+    OCR_PRELOAD = os.getenv('OCR_PRELOAD', 'false').lower() == 'true'  # load engines in the gunicorn master before fork
+    OCR_PRELOAD_WARMUP = os.getenv('OCR_PRELOAD_WARMUP', 'true').lower() == 'true'  # run one inference while preloading
+    OCR_TILING = os.getenv('OCR_TILING', 'true').lower() == 'true'  # tile images larger than OCR_DET_LIMIT_SIDE_LEN
+    OCR_CELL_SEGMENTATION = os.getenv('OCR_CELL_SEGMENTATION', 'true').lower() == 'true'  # OCR catalog grids cell by cell
+    OCR_CELL_GAP_LINES = float(os.getenv('OCR_CELL_GAP_LINES', 1.5))  # min gutter between cells, in text line heights
+    OCR_CELL_MIN_CELLS = int(os.getenv('OCR_CELL_MIN_CELLS', 4))  # fewer cells = not a grid, OCR the page whole
+    OCR_TILE_SIZE = int(os.getenv('OCR_TILE_SIZE', 1600))
+    OCR_TILE_OVERLAP = int(os.getenv('OCR_TILE_OVERLAP', 160))  # should exceed the tallest text line
+    OCR_TILE_MEMORY_MB = int(os.getenv('OCR_TILE_MEMORY_MB', 1024))  # caps tiles recognized at once
+    OCR_MAX_VARIANT_PIXELS = int(os.getenv('OCR_MAX_VARIANT_PIXELS', 16000000))  # skip upscales larger than this
+    OCR_DECODE_MAX_SIDE = int(os.getenv('OCR_DECODE_MAX_SIDE', 4000))  # JPEGs decode downscaled toward this long side (0 = native)
+    OCR_MAX_IMAGE_PIXELS = int(os.getenv('OCR_MAX_IMAGE_PIXELS', 50000000))  # refuse images decoding to more pixels
+    OCR_KEEP_VARIANTS = os.getenv('OCR_KEEP_VARIANTS', 'false').lower() == 'true'  # debug: save preprocessed PNGs
+    OCR_VARIANT_WORKERS = int(os.getenv('OCR_VARIANT_WORKERS', min(4, os.cpu_count() or 1)))  # pieces in the OCR pool at once, 1 = sequential
+    OCR_PIPELINE = os.getenv('OCR_PIPELINE', 'single')  # single = original image only, multi = all preprocessing variants
+    OCR_EARLY_EXIT = os.getenv('OCR_EARLY_EXIT', 'true').lower() == 'true'
+    OCR_EARLY_EXIT_CONFIDENCE = float(os.getenv('OCR_EARLY_EXIT_CONFIDENCE', 0.9))
+    OCR_EARLY_EXIT_MIN_CHARS = int(os.getenv('OCR_EARLY_EXIT_MIN_CHARS', 20))
+    OCR_VARIANT_STATS_SCOPE = os.getenv('OCR_VARIANT_STATS_SCOPE', 'deployment')  # deployment or user
+    OCR_VARIANT_STATS_TTL = int(os.getenv('OCR_VARIANT_STATS_TTL', 300))  # seconds between ranking refreshes
+    OCR_TIMING_STATS_WINDOW = int(os.getenv('OCR_TIMING_STATS_WINDOW', 1000))  # recent scans in stage timing percentiles
+    OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', 'true').lower() == 'true'
+    OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', 5000))
+    OCR_CACHE_VERSION = os.getenv('OCR_CACHE_VERSION', '1')  # bump to invalidate all cached results
+    OCR_PDF_DPI = int(os.getenv('OCR_PDF_DPI', 200))
+    OCR_PDF_MAX_PAGES = int(os.getenv('OCR_PDF_MAX_PAGES', 200))
+    OCR_PDF_TEXT_LAYER = os.getenv('OCR_PDF_TEXT_LAYER', 'true').lower() == 'true'  # read embedded text instead of OCR
+    OCR_PDF_TEXT_MIN_CHARS = int(os.getenv('OCR_PDF_TEXT_MIN_CHARS', 20))  # less text than this = image-only page
+    OCR_LAYOUT_PARSER = os.getenv('OCR_LAYOUT_PARSER', 'true').lower() == 'true'  # parse products from box geometry
+    OCR_BATCH_MAX_FILES = int(os.getenv('OCR_BATCH_MAX_FILES', 100))  # files (or zip members) per batch upload
+    OCR_BATCH_SIZE = int(os.getenv('OCR_BATCH_SIZE', 8))  # images per batched engine call
+    OCR_ASYNC_DEFAULT = os.getenv('OCR_ASYNC_DEFAULT', 'false').lower() == 'true'
+    OCR_JOB_WORKERS = int(os.getenv('OCR_JOB_WORKERS', 2))
+    OCR_JOB_STALE_SECONDS = int(os.getenv('OCR_JOB_STALE_SECONDS', 900))
+    OCR_POOL_WORKERS = int(os.getenv('OCR_POOL_WORKERS', min(2, os.cpu_count() or 1)))  # OCR processes per worker (0 = in-thread)
+    OCR_POOL_QUEUE_LIMIT = int(os.getenv('OCR_POOL_QUEUE_LIMIT', 8))  # queued + running scans before uploads get 503
+    OCR_POOL_TIMEOUT = int(os.getenv('OCR_POOL_TIMEOUT', 300))  # max seconds to wait for one recognition
+    OCR_POOL_RETRY_AFTER = int(os.getenv('OCR_POOL_RETRY_AFTER', 5))  # Retry-After estimate before any OCR has run
+    OCR_SERVICE_SOCKET = os.getenv('OCR_SERVICE_SOCKET', '')  # Unix socket of the shared OCR daemon (empty = models in each worker)
+    OCR_SERVICE_TIMEOUT = int(os.getenv('OCR_SERVICE_TIMEOUT', 120))  # max seconds to wait for the daemon per request
+    OCR_SERVICE_SHM_MIN_BYTES = int(os.getenv('OCR_SERVICE_SHM_MIN_BYTES', 262144))  # smaller images are sent inline
+    OCR_SERVICE_AUTHKEY = os.getenv('OCR_SERVICE_AUTHKEY', SECRET_KEY)  # shared secret of the API and the OCR daemon
+    OCR_PROGRESS_POLL_INTERVAL = float(os.getenv('OCR_PROGRESS_POLL_INTERVAL', 0.5))  # seconds between SSE row checks
+    OCR_PROGRESS_STREAM_TIMEOUT = int(os.getenv('OCR_PROGRESS_STREAM_TIMEOUT', 600))  # max seconds per SSE stream
     
     # Rate Limiting
     RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
@@ -74,7 +127,10 @@ class Config:
     LOG_FILE = os.getenv('LOG_FILE', 'logs/app.log')
     
     # Data Retention
-    DATA_RETENTION_DAYS = int(os.getenv('DATA_RETENTION_DAYS', 30))
+    DATA_RETENTION_DAYS = int(os.getenv('DATA_RETENTION_DAYS', 30))  # 0 = keep everything
+    RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 500))  # rows deleted per transaction
+    RETENTION_BATCH_PAUSE = float(os.getenv('RETENTION_BATCH_PAUSE', 0.1))  # seconds between batches
+    RETENTION_SWEEP_INTERVAL = float(os.getenv('RETENTION_SWEEP_INTERVAL', 0))  # hours between background sweeps (0 = off)
 
 
 class DevelopmentConfig(Config):
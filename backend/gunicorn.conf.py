@@ -0,0 +1,44 @@
+"""
+Gunicorn settings
+Bind address, worker count and worker class still come from the command line
+(Dockerfile CMD); this file starts each worker's background work (OCR job
+recovery, retention sweeper) and adds opt-in OCR engine preloading.
+
+OCR_PRELOAD=true: the master imports the app and loads/warms the OCR engines
+once, then forks the workers, which share the model pages copy-on-write.
+"""
+import gc
+import os
+import sys
+
+preload_app = os.getenv('OCR_PRELOAD', 'false').lower() == 'true'
+
+if preload_app:
+    # gevent workers patch the stdlib after fork, but the preloaded app (its
+    # locks, queues and thread pool choice) is created in the master, so patch first
+    if 'gevent' in ' '.join(sys.argv[1:] + [os.getenv('GUNICORN_CMD_ARGS', '')]):
+        from gevent import monkey
+        monkey.patch_all()
+
+
+def when_ready(server):
+    """Runs in the master after the app is loaded, before workers are forked"""
+    if preload_app:
+        # Keep the loaded models out of future collections: GC passes in the
+        # workers would otherwise write to, and so copy, the shared pages
+        gc.collect()
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    """Runs in each worker after fork (and after gevent patching)"""
+    from app import start_worker
+    from models.user import db
+
+    app = worker.wsgi
+    if preload_app:
+        with app.app_context():
+            # Database connections opened by the master must not be shared
+            db.engine.dispose(close=False)
+    # Scans interrupted by a restart are re-queued by the workers, not the master
+    start_worker(app)
@@ -6,6 +6,7 @@ from .listing import Listing
 from .template import Template
 from .ocr_scan import OCRScan
 from .audit_log import AuditLog
+from .ocr_cache import OCRResultCache
 
-__all__ = ['User', 'Listing', 'Template', 'OCRScan', 'AuditLog']
+__all__ = ['User', 'Listing', 'Template', 'OCRScan', 'AuditLog', 'OCRResultCache']
 
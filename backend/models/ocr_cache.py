@@ -0,0 +1,50 @@
+"""
+OCR result cache model, keyed by upload content hash and OCR config version
+"""
+import uuid
+from datetime import datetime
+from models.user import db
+
+
+class OCRResultCache(db.Model):
+    """Cached OCR output for an exact file, reused when the same bytes are uploaded again"""
+    
+    __tablename__ = 'ocr_result_cache'
+    __table_args__ = (
+        db.UniqueConstraint('content_hash', 'config_version', name='uq_ocr_cache_hash_version'),
+    )
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    
+    # Cache key
+    content_hash = db.Column(db.String(64), nullable=False, index=True)  # sha256 of the upload
+    config_version = db.Column(db.String(16), nullable=False)  # hash of OCR engine settings
+    
+    # Cached OCR output
+    ocr_text = db.Column(db.Text, nullable=True)
+    extracted_data = db.Column(db.JSON, nullable=True)
+    confidence_score = db.Column(db.Float, nullable=True)
+    items_extracted = db.Column(db.Integer, default=0, nullable=False)
+    method_used = db.Column(db.String(50), nullable=True)
+    
+    # LRU bookkeeping
+    hits = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def to_dict(self):
+        """Convert cache entry to dictionary"""
+        return {
+            'id': self.id,
+            'content_hash': self.content_hash,
+            'config_version': self.config_version,
+            'confidence_score': self.confidence_score,
+            'items_extracted': self.items_extracted,
+            'method_used': self.method_used,
+            'hits': self.hits,
+            'created_at': self.created_at.isoformat(),
+            'last_used_at': self.last_used_at.isoformat()
+        }
+    
+    def __repr__(self):
+        return f'<OCRResultCache {self.content_hash[:12]} v{self.config_version}>'
@@ -10,26 +10,38 @@ class OCRScan(db.Model):
     """OCR scan model for tracking image/PDF processing"""
     
     __tablename__ = 'ocr_scans'
+    __table_args__ = (
+        # Keyset pagination of a user's scan history, newest first
+        db.Index('ix_ocr_scans_user_created', 'user_id', 'created_at', 'id'),
+    )
+    
+    # Large columns left out of history listings (fetched per scan on demand)
+    DETAIL_COLUMNS = ('ocr_text', 'extracted_data', 'progress')
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.String(36), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    batch_id = db.Column(db.String(36), nullable=True, index=True)  # set for scans uploaded through /batch
     
     # File information
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=True)
     file_size = db.Column(db.Integer, nullable=True)
     file_type = db.Column(db.String(50), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # sha256 of the upload
     
     # OCR processing
     status = db.Column(db.String(20), default='pending', nullable=False)  # pending, processing, completed, failed
     ocr_text = db.Column(db.Text, nullable=True)
     extracted_data = db.Column(db.JSON, nullable=True)  # Parsed product data
+    progress = db.Column(db.JSON, nullable=True)  # stage events recorded while OCR runs
+    timings = db.Column(db.JSON, nullable=True)  # seconds per OCR stage (utils/ocr_timing)
     error_message = db.Column(db.Text, nullable=True)
     
     # Processing metadata
     processing_time = db.Column(db.Float, nullable=True)  # seconds
     items_extracted = db.Column(db.Integer, default=0, nullable=False)
     confidence_score = db.Column(db.Float, nullable=True)
+    method_used = db.Column(db.String(50), nullable=True, index=True)  # winning engine_variant, e.g. paddleocr_sharpened
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -44,16 +56,21 @@ class OCRScan(db.Model):
         return {
             'id': self.id,
             'user_id': self.user_id,
+            'batch_id': self.batch_id,
             'filename': self.filename,
             'file_size': self.file_size,
             'file_type': self.file_type,
+            'content_hash': self.content_hash,
             'status': self.status,
             'ocr_text': self.ocr_text,
             'extracted_data': self.extracted_data,
+            'progress': self.progress,
             'error_message': self.error_message,
             'processing_time': self.processing_time,
+            'timings': self.timings,
             'items_extracted': self.items_extracted,
             'confidence_score': self.confidence_score,
+            'method_used': self.method_used,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'completed_at': self.completed_at.isoformat() if self.completed_at else None
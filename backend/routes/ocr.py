@@ -3,18 +3,30 @@ OCR routes
 """
 import os
 import time
-import tempfile
+import base64
+import uuid
 import logging
+import zipfile
+import mimetypes
 from datetime import datetime
-from flask import Blueprint, request, jsonify
-from marshmallow import ValidationError
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import defer
+from flask import Blueprint, Response, request, jsonify, current_app, url_for, stream_with_context
+from marshmallow import ValidationError, EXCLUDE
+from werkzeug.datastructures import FileStorage
 from models.user import db
 from models.ocr_scan import OCRScan
 from schemas.ocr_schema import OCRScanSchema, OCRUploadSchema, OCRCorrectionSchema
 from utils.auth import token_required
-from utils.file_upload import save_upload_file, delete_upload_file
+from utils.file_upload import allowed_file, save_upload_stream, delete_upload_file, request_too_large
 from utils.audit import log_action
-from utils.ocr_processor import process_with_paddleocr, parse_product_catalog
+from utils.ocr_engines import get_engine_stats
+from utils.ocr_image import check_image_pixels
+from utils.ocr_jobs import process_scan, enqueue_scan, enqueue_batch, batch_slots
+from utils.ocr_stats import get_stage_timings, get_variant_wins
+from utils.ocr_cache import get_cached_result
+from utils.ocr_progress import stream_events
+from utils.ocr_pool import OCRPoolBusy, admit, check_capacity, release, pool_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -22,14 +34,61 @@ ocr_bp = Blueprint('ocr', __name__)
 
 ocr_scan_schema = OCRScanSchema()
 ocr_scans_schema = OCRScanSchema(many=True)
+ocr_scan_summaries_schema = OCRScanSchema(many=True, exclude=OCRScan.DETAIL_COLUMNS)
 ocr_upload_schema = OCRUploadSchema()
 ocr_correction_schema = OCRCorrectionSchema()
 
 
+def _create_scan(current_user, file, status, batch_id=None):
+    """
+    Save an upload (hashing it while it is written) and add its OCRScan to the
+    session. Same bytes already OCRed with the current engine config are
+    completed from the cache. Returns (ocr_scan, cached).
+    Images over the pixel budget raise ValueError and are not kept.
+    """
+    file_path, file_size, content_hash = save_upload_stream(file, 'ocr')
+    try:
+        # Decompression bombs are refused from the header, before anything decodes them
+        check_image_pixels(file_path)
+    except ValueError:
+        delete_upload_file(file_path)
+        raise
+
+    ocr_scan = OCRScan(
+        user_id=current_user.id,
+        batch_id=batch_id,
+        filename=file.filename,
+        file_path=file_path,
+        file_size=file_size,
+        file_type=file.content_type,
+        content_hash=content_hash,
+        status=status
+    )
+
+    start_time = time.time()
+    cached = get_cached_result(content_hash)
+    if cached is not None:
+        ocr_scan.ocr_text = cached.ocr_text
+        ocr_scan.extracted_data = cached.extracted_data
+        ocr_scan.confidence_score = cached.confidence_score
+        ocr_scan.items_extracted = cached.items_extracted
+        # method_used stays unset: no variant won this scan, so it is not counted in variant wins
+        ocr_scan.processing_time = time.time() - start_time
+        ocr_scan.status = 'completed'
+        ocr_scan.completed_at = datetime.utcnow()
+
+    db.session.add(ocr_scan)
+    return ocr_scan, cached is not None
+
+
 @ocr_bp.route('/upload', methods=['POST'])
 @token_required
 def upload_file(current_user):
     """Upload file for OCR processing"""
+    # Refuse oversized single uploads before the body is parsed
+    if request_too_large(current_app.config['MAX_FILE_SIZE'] + current_app.config['UPLOAD_FORM_OVERHEAD']):
+        return jsonify({'error': 'File size exceeds maximum allowed size'}), 413
+
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
@@ -39,60 +98,55 @@ def upload_file(current_user):
         return jsonify({'error': 'No file selected'}), 400
     
     try:
-        # Save file
-        file_path = save_upload_file(file, 'ocr')
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
-
-        # Create OCR scan record
-        ocr_scan = OCRScan(
-            user_id=current_user.id,
-            filename=file.filename,
-            file_path=file_path,
-            file_size=file_size,
-            file_type=file.content_type,
-            status='processing'
-        )
-
-        db.session.add(ocr_scan)
-        db.session.commit()
-
-        log_action(current_user.id, 'upload_ocr_file', 'ocr_scan', ocr_scan.id, 201)
-
-        # Process OCR immediately
-        try:
-            logger.info(f"Processing OCR for {file.filename} (scan_id={ocr_scan.id})")
-
-            start_time = time.time()
+        options = ocr_upload_schema.load(request.form.to_dict(), unknown=EXCLUDE)
+    except ValidationError as err:
+        return jsonify({'error': 'Validation failed', 'details': err.messages}), 400
 
-            # Process with PaddleOCR directly (receipts-ocr pattern)
-            raw_text, confidence, blocks = process_with_paddleocr(file_path)
+    run_async = options.get('run_async')
+    if run_async is None:
+        run_async = current_app.config['OCR_ASYNC_DEFAULT']
 
-            processing_time = time.time() - start_time
+    admitted = False
+    try:
+        ocr_scan, cached = _create_scan(current_user, file, 'pending' if run_async else 'processing')
 
-            # Parse products from OCR text
-            products = parse_product_catalog(raw_text)
+        # Cache hits are always served; new OCR work only while the queue has room.
+        # The slot is taken now, so concurrent uploads cannot all pass one check
+        if not cached:
+            try:
+                admit()
+                admitted = True
+            except OCRPoolBusy as busy:
+                db.session.rollback()
+                delete_upload_file(ocr_scan.file_path)
+                return _busy_response(busy)
+        db.session.commit()
 
-            # Update OCR scan with results
-            ocr_scan.ocr_text = raw_text
-            ocr_scan.extracted_data = {'products': products}
-            ocr_scan.confidence_score = confidence
-            ocr_scan.processing_time = processing_time
-            ocr_scan.items_extracted = len(products)
-            ocr_scan.status = 'completed'
-            ocr_scan.completed_at = datetime.utcnow()
+        log_action(current_user.id, 'upload_ocr_file', 'ocr_scan', ocr_scan.id, 201)
 
-            db.session.commit()
+        if cached:
+            logger.info(f"OCR cache hit for {file.filename} (scan_id={ocr_scan.id})")
+            return jsonify({
+                'message': 'File uploaded and processed successfully',
+                'cached': True,
+                'ocr_scan': ocr_scan_schema.dump(ocr_scan)
+            }), 201
 
-            logger.info(f"OCR completed: {len(products)} products extracted (confidence={confidence:.2f}, time={processing_time:.2f}s)")
+        if run_async:
+            # Hand off to the background worker pool (with the slot); poll GET /scans/<id> for status
+            enqueue_scan(ocr_scan.id)
+            admitted = False
+            return jsonify({
+                'message': 'File uploaded and queued for processing',
+                'ocr_scan': ocr_scan_schema.dump(ocr_scan),
+                'status_url': url_for('ocr.get_scan', scan_id=ocr_scan.id),
+                'events_url': url_for('ocr.stream_scan_events', scan_id=ocr_scan.id)
+            }), 202
 
+        # Process OCR immediately (recognition runs in the OCR process pool)
+        try:
+            process_scan(ocr_scan)
         except Exception as ocr_error:
-            logger.error(f"OCR processing failed: {ocr_error}", exc_info=True)
-            ocr_scan.status = 'failed'
-            ocr_scan.error_message = str(ocr_error)
-            db.session.commit()
-
             return jsonify({
                 'error': 'OCR processing failed',
                 'details': str(ocr_error),
@@ -109,27 +163,72 @@ def upload_file(current_user):
         db.session.rollback()
         logger.error(f"Upload failed: {e}", exc_info=True)
         return jsonify({'error': 'Upload failed', 'details': str(e)}), 500
+    finally:
+        # Also when the scan could not be saved after admission
+        if admitted:
+            release()
+
+
+def _busy_response(busy):
+    """Fast 503 telling the client when to retry"""
+    response = jsonify({'error': 'OCR is busy, retry later', 'queue_depth': busy.depth,
+                        'retry_after': busy.retry_after})
+    response.headers['Retry-After'] = str(busy.retry_after)
+    return response, 503
+
+
+def _encode_cursor(ocr_scan):
+    """Opaque keyset cursor: position of the last scan on a page"""
+    return base64.urlsafe_b64encode(f"{ocr_scan.created_at.isoformat()}|{ocr_scan.id}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """Return (created_at, id) from a cursor; raises ValueError when malformed"""
+    try:
+        created_at, scan_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(created_at), scan_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
 
 
 @ocr_bp.route('/scans', methods=['GET'])
 @token_required
 def get_scans(current_user):
-    """Get OCR scan history"""
-    page = request.args.get('page', 1, type=int)
+    """
+    Get OCR scan history, newest first, as summaries without ocr_text,
+    extracted_data or progress (those columns are not loaded; fetch
+    GET /scans/<id> for them). Pages are keyset paginated: pass the previous
+    page's next_cursor as ?cursor= to get the next one.
+    """
     per_page = request.args.get('per_page', 20, type=int)
     
-    per_page = min(per_page, 100)
+    per_page = max(1, min(per_page, 100))
     
-    pagination = OCRScan.query.filter_by(user_id=current_user.id).order_by(
-        OCRScan.created_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    query = OCRScan.query.filter_by(user_id=current_user.id).options(
+        *[defer(getattr(OCRScan, column)) for column in OCRScan.DETAIL_COLUMNS]
+    )
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            created_at, scan_id = _decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        query = query.filter(or_(
+            OCRScan.created_at < created_at,
+            and_(OCRScan.created_at == created_at, OCRScan.id < scan_id)
+        ))
+
+    # One extra row tells whether another page follows
+    scans = query.order_by(OCRScan.created_at.desc(), OCRScan.id.desc()).limit(per_page + 1).all()
+    has_more = len(scans) > per_page
+    scans = scans[:per_page]
     
     return jsonify({
-        'scans': ocr_scans_schema.dump(pagination.items),
-        'total': pagination.total,
-        'page': pagination.page,
-        'per_page': pagination.per_page,
-        'pages': pagination.pages
+        'scans': ocr_scan_summaries_schema.dump(scans),
+        'per_page': per_page,
+        'has_more': has_more,
+        'next_cursor': _encode_cursor(scans[-1]) if has_more else None
     }), 200
 
 
@@ -145,6 +244,42 @@ def get_scan(current_user, scan_id):
     return jsonify(ocr_scan_schema.dump(ocr_scan)), 200
 
 
+@ocr_bp.route('/scans/<scan_id>/events', methods=['GET'])
+@token_required
+def stream_scan_events(current_user, scan_id):
+    """Stream OCR progress events for a scan as Server-Sent Events"""
+    if not OCRScan.query.filter_by(id=scan_id, user_id=current_user.id).first():
+        return jsonify({'error': 'OCR scan not found'}), 404
+
+    # Resume after the last event the client saw (EventSource reconnects send it)
+    after = request.headers.get('Last-Event-ID', request.args.get('after', 0), type=int) or 0
+
+    user_id = current_user.id
+
+    def load_scan():
+        # Read the worker's latest commit, then end the transaction so the stream
+        # holds no connection (or snapshot) while it sleeps between polls
+        try:
+            ocr_scan = OCRScan.query.filter_by(id=scan_id, user_id=user_id).first()
+            if ocr_scan is not None:
+                db.session.expunge(ocr_scan)
+            return ocr_scan
+        finally:
+            db.session.rollback()
+
+    events = stream_events(
+        load_scan,
+        after,
+        poll_interval=current_app.config['OCR_PROGRESS_POLL_INTERVAL'],
+        timeout=current_app.config['OCR_PROGRESS_STREAM_TIMEOUT'],
+        sleep=time.sleep
+    )
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # stop nginx from buffering the stream
+    })
+
+
 @ocr_bp.route('/scans/<scan_id>/correct', methods=['POST'])
 @token_required
 def correct_scan(current_user, scan_id):
@@ -199,3 +334,175 @@ def delete_scan(current_user, scan_id):
         db.session.rollback()
         return jsonify({'error': 'Deletion failed', 'details': str(e)}), 500
 
+
+
+@ocr_bp.route('/engines', methods=['GET'])
+@token_required
+def get_engines(current_user):
+    """Get loaded OCR engines and the latency saved by reusing them"""
+    return jsonify(get_engine_stats()), 200
+
+
+@ocr_bp.route('/pool', methods=['GET'])
+@token_required
+def get_pool(current_user):
+    """Get OCR queue depth, wait times and rejections for this worker"""
+    return jsonify(pool_metrics()), 200
+
+
+@ocr_bp.route('/stats/variants', methods=['GET'])
+@token_required
+def get_variant_stats(current_user):
+    """Get how often each preprocessing variant won (scope=user or all)"""
+    scope = request.args.get('scope', 'user')
+    if scope not in ('user', 'all'):
+        return jsonify({'error': 'scope must be user or all'}), 400
+
+    return jsonify({
+        'scope': scope,
+        'variants': get_variant_wins(current_user.id if scope == 'user' else None)
+    }), 200
+
+
+@ocr_bp.route('/stats/timings', methods=['GET'])
+@token_required
+def get_timing_stats(current_user):
+    """Get per-stage OCR latency percentiles over recent scans (scope=user or all)"""
+    scope = request.args.get('scope', 'user')
+    if scope not in ('user', 'all'):
+        return jsonify({'error': 'scope must be user or all'}), 400
+
+    return jsonify(dict(get_stage_timings(current_user.id if scope == 'user' else None), scope=scope)), 200
+
+
+def _expand_zip(archive_file, skipped):
+    """Yield a FileStorage for every allowed member of an uploaded zip archive"""
+    max_size = current_app.config['MAX_FILE_SIZE']
+    try:
+        archive = zipfile.ZipFile(archive_file.stream)
+    except zipfile.BadZipFile:
+        raise ValueError(f'{archive_file.filename} is not a valid zip archive')
+
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+            continue
+        if not allowed_file(name):
+            skipped.append({'filename': info.filename, 'reason': 'File type not allowed'})
+            continue
+        # Check the declared size before decompressing anything
+        if info.file_size > max_size:
+            skipped.append({'filename': info.filename, 'reason': 'File size exceeds maximum allowed size'})
+            continue
+        yield FileStorage(stream=archive.open(info), filename=name,
+                          content_type=mimetypes.guess_type(name)[0])
+
+
+@ocr_bp.route('/batch', methods=['POST'])
+@token_required
+def upload_batch(current_user):
+    """
+    Upload many images (files=...) and/or zip archives for OCR.
+    Returns one batch id at once; scans are OCRed in the background in
+    batched engine calls across the worker pool.
+    """
+    files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+
+    try:
+        check_capacity()
+    except OCRPoolBusy as busy:
+        return _busy_response(busy)
+
+    max_files = current_app.config['OCR_BATCH_MAX_FILES']
+    batch_id = str(uuid.uuid4())
+    scans = []
+    skipped = []
+    admitted = 0
+
+    try:
+        for file in files:
+            members = _expand_zip(file, skipped) if file.filename.lower().endswith('.zip') else [file]
+            for member in members:
+                if len(scans) >= max_files:
+                    raise ValueError(f'Batch exceeds maximum of {max_files} files')
+                try:
+                    ocr_scan, cached = _create_scan(current_user, member, 'pending', batch_id)
+                except ValueError as e:
+                    skipped.append({'filename': member.filename, 'reason': str(e)})
+                    continue
+                scans.append(ocr_scan)
+
+        if not scans:
+            db.session.rollback()
+            return jsonify({'error': 'No processable files in batch', 'skipped': skipped}), 400
+
+        # The whole batch is admitted (one slot per chunk) or none of it
+        slots = batch_slots(sum(1 for ocr_scan in scans if ocr_scan.status == 'pending'))
+        queue_limit = current_app.config['OCR_POOL_QUEUE_LIMIT']
+        if slots > queue_limit:
+            raise ValueError(f'Batch needs {slots} OCR jobs but the queue holds {queue_limit}; upload at most '
+                             f"{queue_limit * max(current_app.config['OCR_BATCH_SIZE'], 1)} new files at once")
+        if slots:
+            admit(slots)
+            admitted = slots
+
+        db.session.commit()
+    except OCRPoolBusy as busy:
+        db.session.rollback()
+        for ocr_scan in scans:
+            delete_upload_file(ocr_scan.file_path)
+        return _busy_response(busy)
+    except ValueError as e:
+        db.session.rollback()
+        for ocr_scan in scans:
+            delete_upload_file(ocr_scan.file_path)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        release(admitted)
+        for ocr_scan in scans:
+            delete_upload_file(ocr_scan.file_path)
+        logger.error(f"Batch upload failed: {e}", exc_info=True)
+        return jsonify({'error': 'Batch upload failed', 'details': str(e)}), 500
+
+    pending_ids = [ocr_scan.id for ocr_scan in scans if ocr_scan.status == 'pending']
+    if pending_ids:
+        enqueue_batch(pending_ids)
+
+    log_action(current_user.id, 'upload_ocr_batch', 'ocr_batch', batch_id, 202,
+               metadata={'files': len(scans), 'queued': len(pending_ids), 'skipped': len(skipped)})
+
+    return jsonify({
+        'message': f'{len(scans)} files uploaded, {len(pending_ids)} queued for processing',
+        'batch_id': batch_id,
+        'status_url': url_for('ocr.get_batch', batch_id=batch_id),
+        'ocr_scans': ocr_scans_schema.dump(scans),
+        'skipped': skipped
+    }), 202
+
+
+@ocr_bp.route('/batches/<batch_id>', methods=['GET'])
+@token_required
+def get_batch(current_user, batch_id):
+    """Get status and scans of a batch upload"""
+    scans = OCRScan.query.filter_by(batch_id=batch_id, user_id=current_user.id).order_by(
+        OCRScan.created_at
+    ).all()
+
+    if not scans:
+        return jsonify({'error': 'Batch not found'}), 404
+
+    counts = {}
+    for ocr_scan in scans:
+        counts[ocr_scan.status] = counts.get(ocr_scan.status, 0) + 1
+    done = counts.get('pending', 0) + counts.get('processing', 0) == 0
+
+    return jsonify({
+        'batch_id': batch_id,
+        'status': 'completed' if done else 'processing',
+        'total': len(scans),
+        'counts': counts,
+        'ocr_scans': ocr_scans_schema.dump(scans)
+    }), 200
@@ -8,16 +8,21 @@ class OCRScanSchema(Schema):
     """OCR scan serialization schema"""
     id = fields.Str(dump_only=True)
     user_id = fields.Str(dump_only=True)
+    batch_id = fields.Str(dump_only=True)
     filename = fields.Str(required=True)
     file_size = fields.Int()
     file_type = fields.Str()
+    content_hash = fields.Str(dump_only=True)
     status = fields.Str(dump_only=True)
     ocr_text = fields.Str(dump_only=True)
     extracted_data = fields.Dict(dump_only=True)
+    progress = fields.List(fields.Dict(), dump_only=True)
     error_message = fields.Str(dump_only=True)
     processing_time = fields.Float(dump_only=True)
+    timings = fields.Dict(keys=fields.Str(), values=fields.Float(), dump_only=True)
     items_extracted = fields.Int(dump_only=True)
     confidence_score = fields.Float(dump_only=True)
+    method_used = fields.Str(dump_only=True)
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
     completed_at = fields.DateTime(dump_only=True)
@@ -27,6 +32,8 @@ class OCRUploadSchema(Schema):
     """OCR upload validation schema"""
     # File will be validated separately in the route
     process_immediately = fields.Bool(missing=True)
+    # async=true returns 202 immediately and runs OCR in the background worker pool
+    run_async = fields.Bool(data_key='async', missing=None, allow_none=True)
 
 
 class OCRCorrectionSchema(Schema):
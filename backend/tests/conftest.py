@@ -4,13 +4,15 @@ Pytest configuration and fixtures
 import pytest
 from app import create_app
 from models.user import db
-from models import User, Listing, Template, OCRScan, AuditLog
+from models import User, Listing, Template, OCRScan, AuditLog, OCRResultCache
 
 
 @pytest.fixture(scope='session')
 def app():
     """Create application for testing"""
     app = create_app('testing')
+    # Recognize in the test thread so monkeypatched engines apply
+    app.config['OCR_POOL_WORKERS'] = 0
     
     with app.app_context():
         db.create_all()
@@ -33,6 +35,7 @@ def db_session(app):
         db.session.query(Listing).delete()
         db.session.query(Template).delete()
         db.session.query(OCRScan).delete()
+        db.session.query(OCRResultCache).delete()
         db.session.query(User).delete()
         db.session.commit()
         
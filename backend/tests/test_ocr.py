@@ -0,0 +1,1551 @@
+"""
+OCR tests
+"""
+import io
+import hashlib
+import json
+import os
+import threading
+import time
+import zipfile
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from PIL import Image
+from flask import request as flask_request
+from werkzeug.datastructures import FileStorage
+from app import create_app, start_worker
+from models import OCRScan, OCRResultCache
+from models.user import db
+from routes import ocr as ocr_routes
+from utils import catalog_layout, file_upload, ocr_benchmark, ocr_cache, ocr_cells, ocr_engines, ocr_image, ocr_jobs, ocr_pool, ocr_processor, ocr_service, ocr_stats, ocr_timing, ocr_tiling, pdf_processor
+
+
+class FakePaddleOCR:
+    """Stand-in model that records how often it is constructed"""
+    instances = 0
+
+    def __init__(self, **params):
+        FakePaddleOCR.instances += 1
+        self.params = params
+        self.predictions = 0
+
+    def predict(self, image):
+        self.predictions += 1
+        return [{'rec_texts': [], 'rec_scores': [], 'dt_polys': []}]
+
+
+@pytest.fixture
+def fake_paddle(monkeypatch):
+    """Route the engine registry to FakePaddleOCR"""
+    FakePaddleOCR.instances = 0
+    monkeypatch.setattr(ocr_engines, 'PADDLE_AVAILABLE', True)
+    monkeypatch.setattr(ocr_engines, 'PaddleOCR', FakePaddleOCR, raising=False)
+    ocr_engines.shutdown_engines()
+    yield FakePaddleOCR
+    ocr_engines.shutdown_engines()
+
+
+class TestOCREngines:
+    """Test OCR engine registry"""
+
+    def test_engine_loaded_once(self, app, fake_paddle):
+        """Test the PaddleOCR model is built once and reused"""
+        with app.app_context():
+            with ocr_engines.paddle_engine() as first:
+                pass
+            with ocr_engines.paddle_engine() as second:
+                pass
+
+            assert first is second
+            assert fake_paddle.instances == 1
+            assert first.params['text_det_limit_side_len'] == app.config['OCR_DET_LIMIT_SIDE_LEN']
+
+            stats = ocr_engines.get_engine_stats()
+            assert stats['engines'][0]['uses'] == 2
+
+    def test_shutdown_releases_engines(self, app, fake_paddle):
+        """Test teardown forces a reload on next use"""
+        with app.app_context():
+            with ocr_engines.paddle_engine():
+                pass
+            assert ocr_engines.shutdown_engines() == 1
+            with ocr_engines.paddle_engine():
+                pass
+
+            assert fake_paddle.instances == 2
+
+    def test_engines_endpoint(self, client, auth_headers):
+        """Test engine stats endpoint"""
+        response = client.get('/api/ocr/engines', headers=auth_headers)
+
+        assert response.status_code == 200
+        assert 'total_seconds_saved' in response.get_json()
+
+    def test_preload_warms_engines(self, app, fake_paddle, monkeypatch):
+        """Test preloading loads and warms the model before any upload"""
+        monkeypatch.setattr(ocr_engines, '_readiness', dict(ocr_engines._readiness))
+        with app.app_context():
+            readiness = ocr_engines.preload_engines()
+            with ocr_engines.paddle_engine() as engine:
+                pass
+
+        assert readiness['ready'] is True
+        assert readiness['mode'] == 'preload'
+        assert readiness['engines'] == ['paddle']
+        assert fake_paddle.instances == 1
+        assert engine.predictions == 1
+
+    def test_ready_endpoint(self, client, monkeypatch):
+        """Test readiness is 503 while preloading and 200 in lazy mode"""
+        monkeypatch.setattr(ocr_engines, '_readiness', dict(ocr_engines._readiness))
+
+        response = client.get('/ready')
+        assert response.status_code == 200
+        assert response.get_json()['mode'] == 'lazy'
+        assert 'rss_mb' in response.get_json()['memory']
+
+        ocr_engines._readiness.update(mode='preload', state='warming')
+        assert client.get('/ready').status_code == 503
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    """Replace PaddleOCR recognition with a fixed catalog result"""
+    calls = []
+
+    def recognize(image_path):
+        calls.append(image_path)
+        return 'Solar Panel 300W $199.99\nCharge Controller $49.50', 0.95, []
+
+    monkeypatch.setattr(ocr_jobs, 'process_with_paddleocr', recognize)
+    return calls
+
+
+def upload(client, auth_headers, **form):
+    """POST a small PNG to the OCR upload endpoint"""
+    data = dict(form)
+    data['file'] = (io.BytesIO(b'\x89PNG\r\n\x1a\n' + b'\x00' * 64), 'catalog.png')
+    return client.post('/api/ocr/upload', headers=auth_headers, data=data,
+                       content_type='multipart/form-data')
+
+
+class TestUploadStreaming:
+    """Test uploads are size-limited and hashed while streamed to disk"""
+
+    def test_oversized_stream_aborted(self, app, client, auth_headers, tmp_path, monkeypatch):
+        """Test the write stops at MAX_FILE_SIZE while the body is parsed and leaves no partial file"""
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setitem(app.config, 'MAX_FILE_SIZE', 100000)
+        monkeypatch.setitem(app.config, 'UPLOAD_FORM_OVERHEAD', 10 ** 7)
+        written = []
+        close = file_upload.UploadSpool.close
+
+        def record(self):
+            written.append(self.size)
+            close(self)
+
+        monkeypatch.setattr(file_upload.UploadSpool, 'close', record)
+
+        response = client.post('/api/ocr/upload', headers=auth_headers, content_type='multipart/form-data',
+                               data={'file': (io.BytesIO(b'x' * 10 ** 6), 'big.png')})
+
+        assert response.status_code == 413
+        assert response.get_json()['error'] == 'File size exceeds maximum allowed size'
+        assert written and max(written) <= 100000
+        assert list((tmp_path / 'ocr').iterdir()) == []
+
+    def test_batch_parts_stop_at_max_file_size(self, app, client, auth_headers, tmp_path, monkeypatch):
+        """Test each image of a batch is limited while parsed, though the request may be larger"""
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setitem(app.config, 'MAX_FILE_SIZE', 100000)
+
+        response = client.post('/api/ocr/batch', headers=auth_headers, content_type='multipart/form-data',
+                               data={'files': [(io.BytesIO(b'x' * 10 ** 6), 'big.png')]})
+
+        assert response.status_code == 413
+        assert list((tmp_path / 'ocr').iterdir()) == []
+
+    def test_other_routes_not_spooled(self, app):
+        """Test only OCR routes spool file parts under UPLOAD_FOLDER"""
+        with app.test_request_context('/api/listings/import', method='POST'):
+            stream = app.request_class._get_file_stream(flask_request._get_current_object(), 10, 'text/csv', 'a.csv')
+
+        assert not isinstance(stream, file_upload.UploadSpool)
+
+    def test_content_length_checked_first(self, app, client, auth_headers, monkeypatch):
+        """Test a declared body over the limit is refused before parsing"""
+        monkeypatch.setitem(app.config, 'MAX_FILE_SIZE', 10)
+        monkeypatch.setitem(app.config, 'UPLOAD_FORM_OVERHEAD', 0)
+
+        response = upload(client, auth_headers)
+
+        assert response.status_code == 413
+
+    def test_size_and_hash_in_one_pass(self, app, tmp_path, monkeypatch):
+        """Test the saved file's size and sha256 come from the streaming write"""
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        body = b'x' * (file_upload.UPLOAD_CHUNK_SIZE * 2 + 5)
+        storage = FileStorage(io.BytesIO(body), filename='big.png')
+
+        with app.test_request_context():
+            file_path, file_size, content_hash = file_upload.save_upload_stream(storage, 'ocr')
+
+        assert file_size == len(body)
+        assert content_hash == hashlib.sha256(body).hexdigest()
+        assert open(file_path, 'rb').read() == body
+
+    def test_parsed_upload_moved_not_reread(self, app, client, auth_headers, fake_ocr, tmp_path, monkeypatch):
+        """Test a request's file part is hashed while parsed, then moved in place without being read again"""
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        body = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+        def read(self, *args):
+            raise AssertionError('upload read again after parsing')
+
+        monkeypatch.setattr(file_upload.UploadSpool, 'read', read, raising=False)
+
+        data = upload(client, auth_headers).get_json()['ocr_scan']
+
+        assert data['content_hash'] == hashlib.sha256(body).hexdigest()
+        assert [path.read_bytes() for path in (tmp_path / 'ocr').iterdir()] == [body]
+
+    def test_rejected_part_spool_removed(self, app, client, auth_headers, tmp_path, monkeypatch):
+        """Test the spooled part of a rejected upload does not stay on disk"""
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+
+        response = client.post('/api/ocr/upload', headers=auth_headers, content_type='multipart/form-data',
+                               data={'file': (io.BytesIO(b'x' * 100), 'notes.txt')})
+
+        assert response.status_code == 400
+        assert list((tmp_path / 'ocr').iterdir()) == []
+
+
+class TestOCRJobs:
+    """Test asynchronous OCR job mode"""
+
+    def test_async_upload_returns_pending(self, client, auth_headers, ocr_queue, monkeypatch):
+        """Test async upload takes its queue slot, queues the scan and returns 202"""
+        queued = []
+        monkeypatch.setattr(ocr_routes, 'enqueue_scan', queued.append)
+
+        response = upload(client, auth_headers, **{'async': 'true'})
+
+        assert response.status_code == 202
+        data = response.get_json()
+        assert data['ocr_scan']['status'] == 'pending'
+        assert queued == [data['ocr_scan']['id']]
+        assert data['status_url'].endswith(data['ocr_scan']['id'])
+        assert ocr_queue.pool_metrics()['depth'] == 1
+
+    def test_async_uploads_refused_at_limit(self, app, client, auth_headers, ocr_queue, monkeypatch):
+        """Test async uploads are admitted against the queue limit when they arrive"""
+        monkeypatch.setattr(ocr_routes, 'enqueue_scan', lambda scan_id: None)
+        monkeypatch.setitem(app.config, 'OCR_POOL_QUEUE_LIMIT', 1)
+
+        first = client.post('/api/ocr/upload', headers=auth_headers, content_type='multipart/form-data',
+                            data={'async': 'true', 'file': (io.BytesIO(b'a'), 'a.png')})
+        second = client.post('/api/ocr/upload', headers=auth_headers, content_type='multipart/form-data',
+                             data={'async': 'true', 'file': (io.BytesIO(b'b'), 'b.png')})
+
+        assert first.status_code == 202
+        assert second.status_code == 503
+        assert ocr_queue.pool_metrics()['depth'] == 1
+
+    def test_worker_completes_scan(self, app, client, auth_headers, monkeypatch, fake_ocr, ocr_queue):
+        """Test the worker claims a pending scan and stores results"""
+        monkeypatch.setattr(ocr_routes, 'enqueue_scan', lambda scan_id: None)
+        scan_id = upload(client, auth_headers, **{'async': 'true'}).get_json()['ocr_scan']['id']
+
+        ocr_jobs._run_job(app, scan_id)
+
+        response = client.get(f'/api/ocr/scans/{scan_id}', headers=auth_headers)
+        data = response.get_json()
+        assert data['status'] == 'completed'
+        assert data['items_extracted'] == 2
+        assert ocr_queue.pool_metrics()['depth'] == 0
+
+    def test_recover_requeues_stale_scans(self, app, db_session, test_user, ocr_queue, monkeypatch):
+        """Test scans left behind by a dead worker are re-queued"""
+        stale = OCRScan(user_id=test_user.id, filename='a.png', status='processing',
+                        updated_at=datetime.utcnow() - timedelta(hours=1))
+        fresh = OCRScan(user_id=test_user.id, filename='b.png', status='processing')
+        pending = OCRScan(user_id=test_user.id, filename='c.png', status='pending')
+        db_session.add_all([stale, fresh, pending])
+        db_session.commit()
+
+        queued = []
+        monkeypatch.setattr(ocr_jobs, 'enqueue_scan', lambda scan_id, app=None: queued.append(scan_id))
+
+        assert ocr_jobs.recover_scans(app) == 2
+        assert set(queued) == {stale.id, pending.id}
+        assert ocr_queue.pool_metrics()['depth'] == 2
+        assert not ocr_jobs.claim_scan(fresh.id)
+
+    def test_only_server_start_recovers(self, monkeypatch):
+        """Test building the app (CLI, scripts, tests) never recovers scans; worker start does, after starting the pool"""
+        started = []
+        monkeypatch.setattr('app.start_pool', lambda: started.append('pool'))
+        monkeypatch.setattr('app.recover_scans', lambda app: started.append(app))
+        monkeypatch.setattr('app.start_retention_sweeper', lambda app: None)
+
+        built = create_app()
+        assert started == []
+
+        start_worker(built)
+        assert started == ['pool', built]
+
+
+@pytest.fixture
+def catalog_image(tmp_path):
+    """Write a small RGBA catalog image to disk"""
+    path = tmp_path / 'catalog.png'
+    Image.new('RGBA', (400, 300), (255, 255, 255, 255)).save(path)
+    return str(path)
+
+
+def write_jpeg(path, size, orientation=None):
+    """Write a white JPEG with a black bar along its top edge"""
+    img = Image.new('RGB', size, (255, 255, 255))
+    img.paste((0, 0, 0), (0, 0, size[0], 10))
+    exif = Image.Exif()
+    if orientation:
+        exif[ocr_image.EXIF_ORIENTATION] = orientation
+    img.save(path, 'JPEG', exif=exif.tobytes())
+    return str(path)
+
+
+class TestImageDecoding:
+    """Test reduced-scale JPEG decoding, EXIF orientation and the pixel budget"""
+
+    def test_large_jpeg_decoded_at_reduced_scale(self, app, tmp_path, monkeypatch):
+        """Test DCT scaling halves a JPEG while its long side stays above the limit"""
+        monkeypatch.setitem(app.config, 'OCR_DECODE_MAX_SIDE', 1000)
+        path = write_jpeg(tmp_path / 'photo.jpg', (3000, 2000))
+
+        with app.app_context():
+            decoded = ocr_image.decode_image(path)
+            monkeypatch.setitem(app.config, 'OCR_DECODE_MAX_SIDE', 0)
+            native = ocr_image.decode_image(path)
+
+        assert (decoded.width, decoded.height) == (1500, 1000)
+        assert (native.width, native.height) == (3000, 2000)
+
+    def test_exif_orientation_applied(self, app, tmp_path):
+        """Test a photo taken rotated (orientation 6) is decoded upright"""
+        path = write_jpeg(tmp_path / 'rotated.jpg', (300, 200), orientation=6)
+
+        with app.app_context():
+            decoded = ocr_image.decode_image(path)
+
+        assert (decoded.width, decoded.height) == (200, 300)
+        assert decoded.rgb[:, -5].mean() < 50  # the top bar is now the right edge
+
+    def test_pixel_budget(self, app, tmp_path, monkeypatch):
+        """Test images over the budget are refused before their pixels are read"""
+        monkeypatch.setitem(app.config, 'OCR_MAX_IMAGE_PIXELS', 10000)
+        path = write_jpeg(tmp_path / 'bomb.jpg', (300, 200))
+
+        with app.app_context(), ocr_image.count_decodes() as decodes:
+            with pytest.raises(ocr_image.ImageTooLarge, match='over the 0.01 MP limit'):
+                ocr_image.decode_image(path)
+
+        assert decodes == [1]
+
+    def test_upload_over_budget_rejected(self, app, client, auth_headers, tmp_path, monkeypatch):
+        """Test an upload over the pixel budget gets 400 and is not kept"""
+        monkeypatch.setitem(app.config, 'OCR_MAX_IMAGE_PIXELS', 10000)
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+        path = write_jpeg(tmp_path / 'bomb.jpg', (300, 200))
+
+        with open(path, 'rb') as f:
+            response = client.post('/api/ocr/upload', headers=auth_headers, content_type='multipart/form-data',
+                                   data={'file': (f, 'bomb.jpg')})
+
+        assert response.status_code == 400
+        assert 'MP limit' in response.get_json()['error']
+        assert OCRScan.query.count() == 0
+        assert list((tmp_path / 'uploads' / 'ocr').iterdir()) == []
+
+
+class TestOCRPreprocessing:
+    """Test in-memory preprocessing pipeline"""
+
+    def test_variants_stay_in_memory(self, tmp_path, catalog_image):
+        """Test variants are returned as RGB arrays without temp files"""
+        out_dir = tmp_path / 'variants'
+        out_dir.mkdir()
+
+        variants = ocr_processor.preprocess_image_enhanced(catalog_image, str(out_dir))
+
+        names = [name for name, _ in variants]
+        assert names == ['original', 'sharpened', 'enhanced_sharp', 'contrast_sharp',
+                         '150pct_sharp', '200pct_sharp']
+        assert variants[0][1].shape == (300, 400, 3)
+        assert variants[-1][1].shape == (600, 800, 3)
+        assert list(out_dir.iterdir()) == []
+
+    def test_decoded_image_is_not_read_again(self, catalog_image):
+        """Test preprocessing and Tesseract reuse one decode and its PIL view"""
+        with ocr_image.count_decodes() as decodes:
+            decoded = ocr_image.decode_image(catalog_image)
+            variants = ocr_processor.preprocess_image_enhanced(decoded)
+            ocr_processor.preprocess_image_enhanced(decoded)
+
+        assert decodes == [1]
+        assert variants[0][1] is decoded.rgb
+        assert decoded.pil is decoded.pil
+        assert decoded.bgr[0, 0].tolist() == decoded.rgb[0, 0, ::-1].tolist()
+
+    def test_only_requested_variants_built(self, catalog_image):
+        """Test methods builds (and times) only the named variants"""
+        with ocr_timing.collect_timings() as timings:
+            variants = ocr_processor.preprocess_image_enhanced(catalog_image, methods=['enhanced_sharp', '200pct_sharp'])
+
+        assert [name for name, _ in variants] == ['enhanced_sharp', '200pct_sharp']
+        assert sorted(timings) == ['decode', 'preprocess.200pct_sharp', 'preprocess.enhanced_sharp']
+
+    def test_keep_variants_writes_debug_files(self, tmp_path, catalog_image):
+        """Test debug flag keeps variant PNGs on disk"""
+        variants = ocr_processor.preprocess_image_enhanced(catalog_image, str(tmp_path), keep_variants=True)
+
+        assert len(list(tmp_path.glob('catalog_*.png'))) == len(variants)
+
+
+class TestOCRMultiMethod:
+    """Test multi-method variant evaluation"""
+
+    def test_best_variant_by_score(self, app, catalog_image, monkeypatch):
+        """Test the highest confidence * length variant wins and timings are recorded"""
+        def recognize(image):
+            # Larger variants read more text
+            return 'x' * (image.shape[1] // 100), 0.9, []
+
+        monkeypatch.setitem(app.config, 'OCR_VARIANT_WORKERS', 1)
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'TESSERACT_AVAILABLE', False)
+        monkeypatch.setattr(ocr_processor, 'process_with_paddleocr', recognize)
+
+        with app.app_context():
+            result = ocr_processor.process_image_multi_method(catalog_image)
+
+        assert result['method_used'] == 'paddleocr_200pct_sharp'
+        assert len(result['variants']) == 6
+        assert all(variant['seconds'] >= 0 for variant in result['variants'])
+
+    def test_all_methods_failed(self, app, catalog_image, monkeypatch):
+        """Test an error is raised when no variant produces text"""
+        monkeypatch.setitem(app.config, 'OCR_VARIANT_WORKERS', 1)
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'TESSERACT_AVAILABLE', False)
+        monkeypatch.setattr(ocr_processor, 'process_with_paddleocr', lambda image: ('', 0.0, []))
+
+        with app.app_context():
+            with pytest.raises(RuntimeError):
+                ocr_processor.process_image_multi_method(catalog_image)
+
+    def test_early_exit_tries_preferred_variant_first(self, app, catalog_image, monkeypatch):
+        """Test a confident first variant stops the search"""
+        monkeypatch.setitem(app.config, 'OCR_VARIANT_WORKERS', 1)
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'TESSERACT_AVAILABLE', False)
+        monkeypatch.setattr(ocr_processor, 'process_with_paddleocr',
+                            lambda image: ('Solar Panel 300W $199.99', 0.97, []))
+
+        with app.app_context():
+            result = ocr_processor.process_image_multi_method(catalog_image, variant_order=['contrast_sharp'])
+
+        assert result['method_used'] == 'paddleocr_contrast_sharp'
+        assert result['early_exit'] is True
+        assert len(result['variants']) == 1
+
+    def test_variant_stats(self, client, auth_headers, db_session, test_user):
+        """Test winning variant statistics and ranking"""
+        for method_used in ['paddleocr_sharpened', 'paddleocr_sharpened', 'paddleocr_original']:
+            db_session.add(OCRScan(user_id=test_user.id, filename='a.png', status='completed',
+                                   method_used=method_used))
+        db_session.commit()
+
+        response = client.get('/api/ocr/stats/variants', headers=auth_headers)
+
+        assert response.status_code == 200
+        variants = response.get_json()['variants']
+        assert variants[0] == {'method_used': 'paddleocr_sharpened', 'wins': 2,
+                               'avg_confidence': None, 'avg_processing_time': None}
+
+        ocr_stats.clear_variant_ranking()
+        assert ocr_stats.preferred_variant_order()[:2] == ['sharpened', 'original']
+
+
+class TestOCRCache:
+    """Test content-addressed OCR result cache"""
+
+    def test_repeat_upload_uses_cache(self, client, auth_headers, fake_ocr):
+        """Test identical bytes are OCRed once"""
+        first = upload(client, auth_headers)
+        second = upload(client, auth_headers)
+
+        assert first.status_code == 201
+        assert second.status_code == 201
+        assert second.get_json()['cached'] is True
+        assert second.get_json()['ocr_scan']['items_extracted'] == 2
+        assert second.get_json()['ocr_scan']['id'] != first.get_json()['ocr_scan']['id']
+        assert len(fake_ocr) == 1
+
+    def test_cache_hits_not_variant_wins(self, app, client, auth_headers, fake_ocr):
+        """Test a scan completed from the cache does not count as another win for the cached method"""
+        first = upload(client, auth_headers)
+        second = upload(client, auth_headers)
+
+        with app.app_context():
+            variants = ocr_stats.get_variant_wins()
+
+        assert second.get_json()['ocr_scan']['method_used'] is None
+        assert [(row['method_used'], row['wins']) for row in variants] == [
+            (first.get_json()['ocr_scan']['method_used'], 1)]
+
+    def test_config_change_invalidates_cache(self, app, client, auth_headers, fake_ocr, monkeypatch):
+        """Test changing OCR settings bypasses and evicts old entries"""
+        upload(client, auth_headers)
+        monkeypatch.setitem(app.config, 'OCR_DET_THRESH', 0.4)
+
+        response = upload(client, auth_headers)
+
+        assert 'cached' not in response.get_json()
+        assert len(fake_ocr) == 2
+        assert OCRResultCache.query.count() == 1
+
+    def test_recognition_settings_change_version(self, app, monkeypatch):
+        """Test every setting that changes recognized text or boxes is part of the cache key"""
+        changes = {'OCR_TILING': False, 'OCR_TILE_SIZE': 1200, 'OCR_TILE_OVERLAP': 80,
+                   'OCR_MAX_VARIANT_PIXELS': 1000000, 'OCR_DECODE_MAX_SIDE': 2000,
+                   'OCR_CELL_SEGMENTATION': False, 'OCR_CELL_GAP_LINES': 3.0, 'OCR_CELL_MIN_CELLS': 8}
+        with app.app_context():
+            baseline = ocr_cache.ocr_config_version()
+            for key, value in changes.items():
+                with monkeypatch.context() as patch:
+                    patch.setitem(app.config, key, value)
+                    assert ocr_cache.ocr_config_version() != baseline, key
+
+    def test_lru_eviction(self, app, db_session, monkeypatch):
+        """Test least recently used entries are evicted beyond the size cap"""
+        monkeypatch.setitem(app.config, 'OCR_CACHE_MAX_ENTRIES', 2)
+        for i in range(3):
+            scan = OCRScan(user_id='u', filename='a.png', content_hash=f'hash{i}', ocr_text='x')
+            ocr_cache.store_result(scan)
+
+        assert ocr_cache.get_cached_result('hash0') is None
+        assert ocr_cache.get_cached_result('hash2') is not None
+
+
+@pytest.fixture
+def catalog_pdf():
+    """Build a PDF with one digital (text layer) page and one image-only page"""
+    fitz = pytest.importorskip('fitz')
+    doc = fitz.open()
+    page = doc.new_page(width=300, height=200)
+    page.insert_text((20, 50), 'Solar Panel 300W $199.99')
+    page = doc.new_page(width=300, height=200)
+    page.draw_rect(fitz.Rect(20, 20, 200, 80), fill=(0, 0, 0))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class TestOCRPdf:
+    """Test page-streaming PDF OCR"""
+
+    def test_pages_rasterized_one_at_a_time(self, app, tmp_path, catalog_pdf):
+        """Test pages are yielded as RGB arrays at the configured DPI"""
+        path = tmp_path / 'catalog.pdf'
+        path.write_bytes(catalog_pdf)
+
+        with app.app_context():
+            pages = [(number, image.shape) for number, image in pdf_processor.iter_pdf_pages(str(path), dpi=144)]
+
+        assert pages == [(1, (400, 600, 3)), (2, (400, 600, 3))]
+
+    def test_pdf_upload_records_pages(self, client, auth_headers, catalog_pdf, monkeypatch):
+        """Test text-layer pages skip OCR and every page records its source"""
+        ocr_calls = []
+
+        def recognize(image):
+            ocr_calls.append(image.shape)
+            return 'Charge Controller $49.50', 0.9, [{'text': 'x', 'confidence': 0.9, 'box': []}]
+
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'process_with_paddleocr', recognize)
+
+        response = client.post('/api/ocr/upload', headers=auth_headers, content_type='multipart/form-data',
+                               data={'file': (io.BytesIO(catalog_pdf), 'catalog.pdf')})
+
+        assert response.status_code == 201
+        scan = response.get_json()['ocr_scan']
+        assert scan['status'] == 'completed'
+        assert scan['method_used'] == 'pdf_mixed'
+        assert scan['extracted_data']['page_count'] == 2
+        pages = scan['extracted_data']['pages']
+        assert [(page['page'], page['source']) for page in pages] == [(1, 'text_layer'), (2, 'ocr')]
+        assert [page['engine'] for page in pages] == [None, 'paddleocr']
+        assert pages[0]['blocks'][0]['text'] == 'Solar Panel 300W $199.99'
+        assert len(ocr_calls) == 1
+        assert [product['name'] for product in scan['extracted_data']['products']] == [
+            'Solar Panel 300W', 'Charge Controller']
+
+    def test_image_pages_fall_back_to_tesseract(self, app, tmp_path, catalog_pdf, monkeypatch):
+        """Test image-only pages use Tesseract when PaddleOCR is not installed, like image uploads"""
+        path = tmp_path / 'catalog.pdf'
+        path.write_bytes(catalog_pdf)
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', False)
+        monkeypatch.setattr(ocr_processor, 'TESSERACT_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'process_with_tesseract',
+                            lambda image: ('Charge Controller $49.50', 0.8, []))
+
+        with app.app_context():
+            pages = list(pdf_processor.ocr_pdf_pages(str(path)))
+
+        assert [(page['source'], page['engine']) for page in pages] == [('text_layer', None), ('ocr', 'tesseract')]
+        assert pages[1]['text'] == 'Charge Controller $49.50'
+
+
+def make_zip(members):
+    """Build a zip archive from {name: bytes}"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+class TestOCRBatch:
+    """Test batch OCR uploads"""
+
+    def test_batch_upload_zip_and_files(self, client, auth_headers, ocr_queue, monkeypatch):
+        """Test files and zip members each get a scan under one batch id"""
+        queued = []
+        monkeypatch.setattr(ocr_routes, 'enqueue_batch', queued.extend)
+        archive = make_zip({'shelf/a.png': b'png-a', 'shelf/b.jpg': b'jpg-b', 'notes.txt': b'x'})
+
+        response = client.post('/api/ocr/batch', headers=auth_headers, content_type='multipart/form-data',
+                               data={'files': [(io.BytesIO(b'png-c'), 'c.png'), (archive, 'shelf.zip')]})
+
+        assert response.status_code == 202
+        data = response.get_json()
+        assert sorted(scan['filename'] for scan in data['ocr_scans']) == ['a.png', 'b.jpg', 'c.png']
+        assert {scan['batch_id'] for scan in data['ocr_scans']} == {data['batch_id']}
+        assert data['skipped'] == [{'filename': 'notes.txt', 'reason': 'File type not allowed'}]
+        assert len(queued) == 3
+
+        status = client.get(f"/api/ocr/batches/{data['batch_id']}", headers=auth_headers).get_json()
+        assert status['status'] == 'processing'
+        assert status['counts'] == {'pending': 3}
+
+    def test_batch_job_uses_one_engine_call(self, app, client, auth_headers, ocr_queue, monkeypatch):
+        """Test a chunk of images is recognized in a single batched call"""
+        monkeypatch.setattr(ocr_routes, 'enqueue_batch', lambda scan_ids: None)
+        calls = []
+
+        def recognize_batch(paths):
+            calls.append(len(paths))
+            return [('Solar Panel 300W $199.99', 0.9, [])] * len(paths)
+
+        monkeypatch.setattr(ocr_jobs, 'process_batch_with_paddleocr', recognize_batch)
+        data = client.post('/api/ocr/batch', headers=auth_headers, content_type='multipart/form-data',
+                           data={'files': [(io.BytesIO(b'a'), 'a.png'), (io.BytesIO(b'b'), 'b.png')]}).get_json()
+
+        ocr_jobs._run_batch_job(app, [scan['id'] for scan in data['ocr_scans']])
+
+        status = client.get(f"/api/ocr/batches/{data['batch_id']}", headers=auth_headers).get_json()
+        assert calls == [2]
+        assert status['status'] == 'completed'
+        assert status['counts'] == {'completed': 2}
+
+    def test_batch_reserves_one_slot_per_chunk(self, app, client, auth_headers, ocr_queue, monkeypatch):
+        """Test a batch takes one queue slot per OCR_BATCH_SIZE chunk"""
+        monkeypatch.setattr(ocr_routes, 'enqueue_batch', lambda scan_ids: None)
+        monkeypatch.setitem(app.config, 'OCR_BATCH_SIZE', 2)
+
+        response = client.post('/api/ocr/batch', headers=auth_headers, content_type='multipart/form-data',
+                               data={'files': [(io.BytesIO(name.encode()), f'{name}.png') for name in 'abc']})
+
+        assert response.status_code == 202
+        assert ocr_queue.pool_metrics()['depth'] == 2
+
+    def test_batch_admitted_whole(self, app, client, auth_headers, ocr_queue, tmp_path, monkeypatch):
+        """Test a batch whose chunks do not all fit gets 503 and queues nothing"""
+        monkeypatch.setattr(ocr_routes, 'enqueue_batch', lambda scan_ids: None)
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setitem(app.config, 'OCR_BATCH_SIZE', 1)
+        monkeypatch.setitem(app.config, 'OCR_POOL_QUEUE_LIMIT', 2)
+        ocr_queue.reserve()
+
+        response = client.post('/api/ocr/batch', headers=auth_headers, content_type='multipart/form-data',
+                               data={'files': [(io.BytesIO(b'a'), 'a.png'), (io.BytesIO(b'b'), 'b.png')]})
+
+        assert response.status_code == 503
+        assert 'Retry-After' in response.headers
+        assert ocr_queue.pool_metrics()['depth'] == 1
+        assert OCRScan.query.count() == 0
+        assert list((tmp_path / 'ocr').iterdir()) == []
+
+    def test_refused_batch_with_cache_hit_leaves_nothing(self, app, client, auth_headers, fake_ocr, ocr_queue,
+                                                         tmp_path, monkeypatch):
+        """Test a cache hit inside a refused batch does not commit the batch's other scans"""
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setattr(ocr_routes, 'enqueue_batch', lambda scan_ids: None)
+        upload(client, auth_headers)
+        monkeypatch.setitem(app.config, 'OCR_BATCH_SIZE', 1)
+        monkeypatch.setitem(app.config, 'OCR_POOL_QUEUE_LIMIT', 2)
+        ocr_queue.reserve()
+        cached = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+        response = client.post('/api/ocr/batch', headers=auth_headers, content_type='multipart/form-data',
+                               data={'files': [(io.BytesIO(b'a'), 'a.png'), (io.BytesIO(b'b'), 'b.png'),
+                                               (io.BytesIO(cached), 'c.png')]})
+
+        assert response.status_code == 503
+        assert [scan.filename for scan in OCRScan.query] == ['catalog.png']
+        assert len(list((tmp_path / 'ocr').iterdir())) == 1
+
+    def test_failed_batch_removes_uploads(self, app, client, auth_headers, ocr_queue, tmp_path, monkeypatch):
+        """Test a batch whose scans cannot be saved leaves no files and no queue slots behind"""
+        monkeypatch.setattr(ocr_routes, 'enqueue_batch', lambda scan_ids: None)
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+
+        def fail():
+            raise RuntimeError('database is gone')
+
+        monkeypatch.setattr(ocr_routes.db.session, 'commit', fail)
+
+        response = client.post('/api/ocr/batch', headers=auth_headers, content_type='multipart/form-data',
+                               data={'files': [(io.BytesIO(b'a'), 'a.png'), (io.BytesIO(b'b'), 'b.png')]})
+
+        assert response.status_code == 500
+        assert list((tmp_path / 'ocr').iterdir()) == []
+        assert ocr_queue.pool_metrics()['depth'] == 0
+
+    def test_batch_larger_than_queue_refused(self, app, client, auth_headers, ocr_queue, monkeypatch):
+        """Test a batch needing more chunks than the queue limit is refused outright"""
+        monkeypatch.setitem(app.config, 'OCR_BATCH_SIZE', 1)
+        monkeypatch.setitem(app.config, 'OCR_POOL_QUEUE_LIMIT', 2)
+
+        response = client.post('/api/ocr/batch', headers=auth_headers, content_type='multipart/form-data',
+                               data={'files': [(io.BytesIO(name.encode()), f'{name}.png') for name in 'abc']})
+
+        assert response.status_code == 400
+        assert 'at most 2 new files' in response.get_json()['error']
+        assert ocr_queue.pool_metrics()['depth'] == 0
+        assert OCRScan.query.count() == 0
+
+
+class FakeTesseract:
+    """pytesseract stand-in exposing only image_to_data, so a second pass would fail"""
+
+    class Output:
+        DICT = 'dict'
+
+    def __init__(self):
+        self.calls = 0
+
+    def image_to_data(self, img, output_type=None):
+        self.calls += 1
+        return {
+            'text': ['', 'Solar', 'Panel', '$199.99', 'Inverter'],
+            'conf': [-1, 90, 80, 70, 60],
+            'left': [0, 10, 60, 120, 10],
+            'top': [0, 10, 10, 10, 40],
+            'width': [0, 40, 50, 60, 70],
+            'height': [0, 20, 20, 20, 20],
+            'block_num': [1, 1, 1, 1, 1],
+            'par_num': [1, 1, 1, 1, 1],
+            'line_num': [0, 1, 1, 1, 2],
+        }
+
+
+class TestOCRTesseract:
+    """Test single-pass Tesseract fallback"""
+
+    def test_single_pass_text_confidence_and_boxes(self, monkeypatch):
+        """Test text, confidence and word boxes come from one image_to_data call"""
+        fake = FakeTesseract()
+        monkeypatch.setattr(ocr_processor, 'TESSERACT_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'pytesseract', fake, raising=False)
+
+        raw_text, confidence, blocks = ocr_processor.process_with_tesseract(np.zeros((60, 200, 3), np.uint8))
+
+        assert fake.calls == 1
+        assert raw_text == 'Solar Panel $199.99\nInverter'
+        assert confidence == pytest.approx(0.75)
+        assert blocks[0] == {'text': 'Solar', 'confidence': 0.9, 'box': [[10, 10], [50, 10], [50, 30], [10, 30]]}
+
+    def test_tesseract_pool_reuses_warm_instances(self, app, monkeypatch):
+        """Test pooled APIs are created once and handed back for reuse"""
+        created = []
+
+        class FakeAPI:
+            def __init__(self, lang=None, path=None):
+                created.append(lang)
+
+            def Clear(self):
+                pass
+
+            def End(self):
+                pass
+
+        class FakeTesserocr:
+            PyTessBaseAPI = FakeAPI
+
+        monkeypatch.setattr(ocr_engines, 'TESSEROCR_AVAILABLE', True)
+        monkeypatch.setattr(ocr_engines, 'tesserocr', FakeTesserocr, raising=False)
+        monkeypatch.setitem(app.config, 'OCR_TESSERACT_POOL_SIZE', 2)
+        ocr_engines.shutdown_engines()
+
+        with app.app_context():
+            with ocr_engines.tesseract_engine() as first:
+                with ocr_engines.tesseract_engine() as second:
+                    assert first is not second
+            with ocr_engines.tesseract_engine() as third:
+                assert third in (first, second)
+
+        assert created == ['eng', 'eng']
+        ocr_engines.shutdown_engines()
+
+    def test_tesseract_pool_close_ends_every_instance(self, app, monkeypatch):
+        """Test closing the pool ends idle instances at once and the one in use when it is released"""
+        ended = []
+
+        class FakeAPI:
+            def __init__(self, lang=None, path=None):
+                pass
+
+            def Clear(self):
+                pass
+
+            def End(self):
+                ended.append(self)
+
+        class FakeTesserocr:
+            PyTessBaseAPI = FakeAPI
+
+        monkeypatch.setattr(ocr_engines, 'TESSEROCR_AVAILABLE', True)
+        monkeypatch.setattr(ocr_engines, 'tesserocr', FakeTesserocr, raising=False)
+        monkeypatch.setitem(app.config, 'OCR_TESSERACT_POOL_SIZE', 2)
+        ocr_engines.shutdown_engines()
+
+        with app.app_context():
+            with ocr_engines.tesseract_engine() as first:
+                with ocr_engines.tesseract_engine() as second:
+                    pass
+                assert ocr_engines.shutdown_engines() == 1
+                assert ended == [second]
+
+        assert ended == [second, first]
+
+
+def box(x0, y0, x1, y1):
+    """Four-point box like PaddleOCR's dt_polys"""
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+class TestOCRTiling:
+    """Test tiled OCR for large images"""
+
+    def test_plan_tiles_covers_image(self):
+        """Test tiles overlap and reach every edge"""
+        tiles = ocr_tiling.plan_tiles(3000, 1000, 1600, 200)
+
+        assert tiles == [(0, 0, 1600, 1000), (1400, 0, 3000, 1000)]
+
+    def test_merge_prefers_complete_copy_across_seam(self):
+        """Test a word cut by the seam is replaced by the neighbour's complete copy"""
+        left = ((0, 0, 1600, 1000), [
+            {'text': 'Solar Pan', 'confidence': 0.95, 'box': box(1450, 100, 1598, 130)},
+            {'text': 'Inverter $89.00', 'confidence': 0.9, 'box': box(100, 500, 400, 530)},
+        ])
+        right = ((1400, 0, 3000, 1000), [
+            {'text': 'Solar Panel $199.99', 'confidence': 0.9, 'box': box(1450, 100, 1750, 130)},
+            {'text': 'Battery $59.00', 'confidence': 0.9, 'box': box(2000, 100, 2300, 130)},
+        ])
+
+        blocks = ocr_tiling.merge_tile_blocks([left, right], 3000, 1000)
+
+        assert [block['text'] for block in blocks] == ['Solar Panel $199.99', 'Battery $59.00', 'Inverter $89.00']
+
+    def test_large_image_is_tiled(self, app, monkeypatch):
+        """Test images above the detector limit are recognized tile by tile"""
+        calls = []
+
+        def predict(tile):
+            calls.append(tile.shape)
+            return 'Solar Panel', 0.9, [{'text': 'Solar Panel', 'confidence': 0.9, 'box': box(10, 10, 200, 40)}]
+
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, '_predict_paddle', predict)
+        monkeypatch.setitem(app.config, 'OCR_VARIANT_WORKERS', 1)
+
+        with app.app_context():
+            raw_text, confidence, blocks = ocr_processor.process_with_paddleocr(np.zeros((1000, 3000, 3), np.uint8))
+
+        assert calls == [(1000, 1600, 3), (1000, 1600, 3)]
+        assert [block['box'][0] for block in blocks] == [[10, 10], [1410, 10]]
+        assert raw_text == 'Solar Panel\nSolar Panel'
+
+
+def text_block(text, x0, y0, x1, y1):
+    """OCR block with a rectangular box"""
+    return {'text': text, 'confidence': 0.9, 'box': box(x0, y0, x1, y1)}
+
+
+class TestCatalogLayout:
+    """Test the layout-aware catalog parser"""
+
+    def test_grid_joins_name_price_description(self):
+        """Test a 2x2 product grid yields one product per cell in reading order"""
+        blocks = [text_block('Spring Catalog', 50, 0, 950, 40)]
+        for column, x in enumerate((50, 550)):
+            for row, y in enumerate((100, 400)):
+                number = row * 2 + column + 1
+                blocks += [
+                    text_block(f'Product {number}', x, y, x + 200, y + 30),
+                    text_block(f'${number}9.99', x, y + 35, x + 100, y + 65),
+                    text_block('Like new condition', x, y + 70, x + 300, y + 100),
+                ]
+
+        products = catalog_layout.parse_product_layout(blocks)
+
+        assert [(p['name'], p['price']) for p in products] == [
+            ('Product 1', 19.99), ('Product 2', 29.99), ('Product 3', 39.99), ('Product 4', 49.99)]
+        assert products[0]['description'] == 'Product 1 $19.99 Like new condition'
+        assert products[0]['box'] == [50, 100, 350, 200]
+
+    def test_list_with_price_column(self):
+        """Test prices aligned in their own column join the name on their row"""
+        blocks = []
+        for i, name in enumerate(['Solar Panel 300W', 'Charge Controller', 'Inverter 1kW']):
+            y = i * 45
+            blocks += [text_block(name, 0, y, 300, y + 30), text_block(f'${i + 1}0.00', 800, y, 900, y + 30)]
+
+        products = catalog_layout.parse_product_layout(blocks)
+
+        assert [(p['name'], p['price']) for p in products] == [
+            ('Solar Panel 300W', 10.0), ('Charge Controller', 20.0), ('Inverter 1kW', 30.0)]
+
+    def test_words_join_into_lines(self):
+        """Test word-level boxes (Tesseract) are joined before parsing"""
+        blocks = [
+            text_block('Solar', 0, 0, 60, 20), text_block('Panel', 70, 0, 130, 20),
+            text_block('$199.99', 140, 0, 220, 20),
+        ]
+
+        products = catalog_layout.parse_product_layout(blocks)
+
+        assert [(p['name'], p['price']) for p in products] == [('Solar Panel', 199.99)]
+
+    def test_falls_back_without_boxes(self, app):
+        """Test text without boxes uses the line-based parser"""
+        with app.app_context():
+            products = catalog_layout.extract_products('Solar Panel 300W $199.99', [{'text': 'x', 'box': []}])
+
+        assert [product['name'] for product in products] == ['Solar Panel 300W']
+
+    def test_large_grid_is_fast(self):
+        """Test thousands of blocks parse without pairwise comparisons"""
+        blocks = []
+        for column in range(40):
+            for row in range(40):
+                x, y = column * 250, row * 150
+                blocks += [text_block(f'Item {column}-{row}', x, y, x + 150, y + 30),
+                           text_block('$9.99', x, y + 35, x + 80, y + 65)]
+
+        products = catalog_layout.parse_product_layout(blocks)
+
+        assert len(products) == 1600
+        assert products[1]['name'] == 'Item 1-0'
+
+
+def read_events(response):
+    """Parse a Server-Sent Events body into (stage, data) pairs"""
+    events = []
+    for message in response.get_data(as_text=True).split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in message.split('\n') if line and not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class TestOCRProgress:
+    """Test OCR progress events and the SSE stream"""
+
+    def test_stream_reports_stages(self, client, auth_headers, catalog_image, fake_ocr):
+        """Test a finished scan streams every recorded stage and its products"""
+        with open(catalog_image, 'rb') as f:
+            response = client.post('/api/ocr/upload', headers=auth_headers, content_type='multipart/form-data',
+                                   data={'file': (f, 'catalog.png')})
+        scan_id = response.get_json()['ocr_scan']['id']
+
+        response = client.get(f'/api/ocr/scans/{scan_id}/events', headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        events = read_events(response)
+        assert [stage for stage, _ in events] == ['decode', 'recognition', 'parse', 'products', 'completed']
+        assert events[0][1]['width'] == 400
+        assert events[1][1]['decodes'] == 1
+        assert [product['name'] for product in events[3][1]['products']] == ['Solar Panel 300W', 'Charge Controller']
+
+    def test_stream_resumes_after_last_event(self, client, auth_headers, fake_ocr):
+        """Test Last-Event-ID skips events the client already has"""
+        scan_id = upload(client, auth_headers).get_json()['ocr_scan']['id']
+        headers = dict(auth_headers, **{'Last-Event-ID': '2'})
+
+        events = read_events(client.get(f'/api/ocr/scans/{scan_id}/events', headers=headers))
+
+        assert [(stage, data['seq']) for stage, data in events] == [('products', 3), ('completed', 4)]
+
+    def test_cache_hit_gets_final_event(self, client, auth_headers, fake_ocr):
+        """Test scans completed without recorded events still end the stream"""
+        upload(client, auth_headers)
+        scan_id = upload(client, auth_headers).get_json()['ocr_scan']['id']
+
+        events = read_events(client.get(f'/api/ocr/scans/{scan_id}/events', headers=auth_headers))
+
+        assert events == [('completed', {'seq': 1, 'stage': 'completed', 'status': 'completed',
+                                         'items_extracted': 2})]
+
+    def test_variants_reported(self, app, catalog_image, monkeypatch):
+        """Test the multi-method pipeline reports decode and each variant"""
+        monkeypatch.setitem(app.config, 'OCR_VARIANT_WORKERS', 1)
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'TESSERACT_AVAILABLE', False)
+        monkeypatch.setattr(ocr_processor, 'process_with_paddleocr', lambda image: ('Solar Panel', 0.5, []))
+        events = []
+
+        with app.app_context():
+            ocr_processor.process_image_multi_method(
+                catalog_image, on_progress=lambda stage, **data: events.append((stage, data)))
+
+        assert events[0] == ('decode', {'width': 400, 'height': 300, 'variants': 6})
+        assert [data['method'] for stage, data in events[1:]] == [
+            'paddleocr_original', 'paddleocr_sharpened', 'paddleocr_enhanced_sharp',
+            'paddleocr_contrast_sharp', 'paddleocr_150pct_sharp', 'paddleocr_200pct_sharp']
+
+    def test_stream_releases_connection_between_polls(self, app, client, auth_headers, ocr_queue, monkeypatch):
+        """Test the stream is outside any transaction while it sleeps, and sees the worker's commits"""
+        monkeypatch.setattr(ocr_routes, 'enqueue_scan', lambda scan_id: None)
+        monkeypatch.setitem(app.config, 'OCR_PROGRESS_POLL_INTERVAL', 0)
+        scan_id = upload(client, auth_headers, **{'async': 'true'}).get_json()['ocr_scan']['id']
+        in_transaction = []
+
+        def sleep(seconds):
+            in_transaction.append(db.session().in_transaction())
+            # The worker finishes the scan while the stream waits
+            OCRScan.query.filter_by(id=scan_id).update({'status': 'completed', 'items_extracted': 0})
+            db.session.commit()
+
+        monkeypatch.setattr(ocr_routes.time, 'sleep', sleep)
+
+        events = read_events(client.get(f'/api/ocr/scans/{scan_id}/events', headers=auth_headers))
+
+        assert in_transaction == [False]
+        assert [stage for stage, _ in events] == ['completed']
+
+    def test_stream_requires_owner(self, client, auth_headers):
+        """Test unknown scans return 404"""
+        response = client.get('/api/ocr/scans/missing/events', headers=auth_headers)
+
+        assert response.status_code == 404
+
+
+class TestOCRBenchmark:
+    """Test synthetic catalog benchmark"""
+
+    def test_corpus_is_reproducible(self, app):
+        """Test the same seed renders the same images and ground truth"""
+        with app.app_context():
+            first = ocr_benchmark.build_corpus([400], ['sans'], [0, 20], seed=1)
+            second = ocr_benchmark.build_corpus([400], ['sans'], [0, 20], seed=1)
+
+        assert [case['name'] for case in first] == ['w400_sans_n0', 'w400_sans_n20']
+        assert [case['products'] for case in first] == [case['products'] for case in second]
+        assert all(case['image'].width == 400 for case in first)
+        assert np.array_equal(np.asarray(first[1]['image']), np.asarray(second[1]['image']))
+
+    def test_score_products(self):
+        """Test titles and prices are scored separately against the truth"""
+        expected = [{'name': 'Solar Panel 300W', 'price': 199.99}, {'name': 'MC4 Connector Pair', 'price': 7.49}]
+        found = [{'name': 'Solar Panel 300W', 'price': 19.99}, {'name': 'Unrelated', 'price': 7.49}]
+
+        score = ocr_benchmark.score_products(expected, found)
+
+        assert score['matched'] == 1
+        assert score['recall'] == 0.5
+        assert score['precision'] == 0.5
+        assert score['title_accuracy'] == 0.5
+        assert score['price_accuracy'] == 0.0
+
+    def test_run_benchmark(self, app, monkeypatch):
+        """Test every variant plus the pipeline is timed and scored"""
+        corpus = ocr_benchmark.build_corpus([400], ['sans'], [0], seed=2)
+        truth = '\n'.join(f"{p['name']} ${p['price']:.2f}" for p in corpus[0]['products'])
+        monkeypatch.setitem(app.config, 'OCR_VARIANT_WORKERS', 1)
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'TESSERACT_AVAILABLE', False)
+        monkeypatch.setattr(ocr_processor, 'process_with_paddleocr', lambda image: (truth, 0.95, []))
+
+        with app.app_context():
+            results = ocr_benchmark.run_benchmark(corpus, repeat=2, warmup=False)
+
+        assert len(results['runs']) == 14
+        assert ('pipeline', 'auto') in [(row['engine'], row['variant']) for row in results['summary']]
+        assert all(row['recall'] == 1.0 and row['price_accuracy'] == 1.0 for row in results['summary'])
+        assert all(row['p50_seconds'] is not None for row in results['summary'])
+
+        saved = json.loads(json.dumps(results))
+        changes = ocr_benchmark.compare_results(saved, results)
+        assert len(changes) == 7
+        assert all(change['recall'] == 0 for change in changes)
+
+    def test_benchmark_recognizes_in_process(self, app, monkeypatch):
+        """Test the benchmark bypasses the OCR pool, so it measures the process running the engines"""
+        corpus = ocr_benchmark.build_corpus([400], ['sans'], [0], seed=2)
+        monkeypatch.setitem(app.config, 'OCR_POOL_WORKERS', 2)
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'TESSERACT_AVAILABLE', False)
+        pool_used = []
+        monkeypatch.setattr(ocr_processor, 'process_with_paddleocr',
+                            lambda image: pool_used.append(ocr_pool.pool_available()) or ('', 0.0, []))
+
+        with app.app_context():
+            results = ocr_benchmark.run_benchmark(corpus, warmup=False)
+            restored = app.config['OCR_POOL_WORKERS']
+
+        assert pool_used and not any(pool_used)
+        assert results['environment']['settings']['OCR_POOL_WORKERS'] == 0
+        assert restored == 2
+
+
+class TestOCRScanHistory:
+    """Test scan history summaries and keyset pagination"""
+
+    def test_summaries_paginate_by_cursor(self, client, auth_headers, db_session, test_user):
+        """Test pages follow next_cursor newest first, including scans created at the same time"""
+        created_at = datetime(2026, 1, 1, 12, 0)
+        for i, offset in enumerate([0, 1, 1, 2, 3]):
+            db_session.add(OCRScan(user_id=test_user.id, filename=f'{i}.png', status='completed',
+                                   ocr_text='x' * 1000, extracted_data={'products': []},
+                                   created_at=created_at + timedelta(minutes=offset)))
+        db_session.commit()
+
+        pages = []
+        url = '/api/ocr/scans?per_page=2'
+        while url:
+            data = client.get(url, headers=auth_headers).get_json()
+            pages.append(data['scans'])
+            url = f"/api/ocr/scans?per_page=2&cursor={data['next_cursor']}" if data['has_more'] else None
+
+        assert [len(page) for page in pages] == [2, 2, 1]
+        filenames = [scan['filename'] for page in pages for scan in page]
+        assert filenames[0] == '4.png' and filenames[-1] == '0.png'
+        assert sorted(filenames) == ['0.png', '1.png', '2.png', '3.png', '4.png']
+        assert all(set(OCRScan.DETAIL_COLUMNS).isdisjoint(scan) for page in pages for scan in page)
+
+    def test_invalid_cursor(self, client, auth_headers):
+        """Test a malformed cursor is rejected"""
+        response = client.get('/api/ocr/scans?cursor=not-a-cursor', headers=auth_headers)
+
+        assert response.status_code == 400
+
+
+@pytest.fixture
+def ocr_queue():
+    """Start each test with an empty OCR queue"""
+    ocr_pool._state.update(ocr_pool._new_state())
+    yield ocr_pool
+    ocr_pool._state.update(ocr_pool._new_state())
+
+
+@pytest.fixture
+def ocr_pool_processes(app, monkeypatch):
+    """A real two-process OCR pool, stopped after the test"""
+    monkeypatch.setitem(app.config, 'OCR_POOL_WORKERS', 2)
+    ocr_pool.shutdown_pool()
+    yield ocr_pool
+    ocr_pool.shutdown_pool()
+
+
+def wait_for_pool(pool, timeout=60):
+    """Poll pool_readiness() until every pool process is ready"""
+    deadline = time.time() + timeout
+    while not pool.pool_readiness()['ready'] and time.time() < deadline:
+        time.sleep(0.1)
+    return pool.pool_readiness()
+
+
+class TestOCRAdmission:
+    """Test bounded OCR queue and 503 backpressure"""
+
+    def test_full_queue_returns_503(self, app, client, auth_headers, fake_ocr, ocr_queue, tmp_path, monkeypatch):
+        """Test uploads needing OCR are refused with Retry-After and leave nothing behind"""
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setitem(app.config, 'OCR_POOL_QUEUE_LIMIT', 1)
+        ocr_queue.reserve()
+
+        response = upload(client, auth_headers)
+
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(app.config['OCR_POOL_RETRY_AFTER'])
+        assert response.get_json()['queue_depth'] == 1
+        assert OCRScan.query.count() == 0
+        assert list((tmp_path / 'ocr').iterdir()) == []
+        assert fake_ocr == []
+        assert ocr_queue.pool_metrics()['rejected'] == 1
+
+    def test_cache_hits_served_when_full(self, app, client, auth_headers, fake_ocr, ocr_queue, monkeypatch):
+        """Test a repeat upload is answered from the cache while the queue is full"""
+        monkeypatch.setitem(app.config, 'OCR_POOL_QUEUE_LIMIT', 1)
+        assert upload(client, auth_headers).status_code == 201
+        ocr_queue.reserve()
+
+        response = upload(client, auth_headers)
+
+        assert response.status_code == 201
+        assert response.get_json()['cached'] is True
+
+    def test_slot_released_when_save_fails(self, client, auth_headers, fake_ocr, ocr_queue, monkeypatch):
+        """Test a sync upload whose scan cannot be saved after admission frees its slot"""
+        def fail():
+            raise RuntimeError('database is gone')
+
+        monkeypatch.setattr(ocr_routes.db.session, 'commit', fail)
+
+        response = upload(client, auth_headers)
+
+        assert response.status_code == 500
+        assert ocr_queue.pool_metrics()['depth'] == 0
+
+    def test_metrics(self, client, auth_headers, ocr_queue, monkeypatch):
+        """Test recognition is measured and its queue slot released"""
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, '_predict_paddle', lambda img: ('Solar Panel 300W $199.99', 0.95, []))
+        png = io.BytesIO()
+        Image.new('RGB', (200, 100), (255, 255, 255)).save(png, 'PNG')
+        png.seek(0)
+        client.post('/api/ocr/upload', headers=auth_headers, data={'file': (png, 'catalog.png')},
+                    content_type='multipart/form-data')
+
+        metrics = client.get('/api/ocr/pool', headers=auth_headers).get_json()
+
+        assert metrics['depth'] == 0
+        assert metrics['submitted'] == metrics['completed'] == 1
+        assert metrics['mean_wait_seconds'] is not None
+        assert metrics['saturated'] is False
+
+    def test_ready_waits_for_pool(self, app, client, ocr_pool_processes, monkeypatch):
+        """Test /ready is 503 while a preloading worker's OCR pool is not warm"""
+        monkeypatch.setitem(app.config, 'OCR_PRELOAD', True)
+
+        response = client.get('/ready')
+
+        assert response.status_code == 503
+        assert response.get_json()['pool'] == {'workers': 2, 'started': False, 'ready_processes': 0,
+                                               'ready': False}
+
+    def test_spawned_pool_warms_up(self, app, ocr_pool_processes, monkeypatch):
+        """Test pool processes of a worker without preloaded engines load their own before taking jobs"""
+        monkeypatch.setitem(app.config, 'OCR_PRELOAD', True)
+
+        with app.app_context():
+            assert ocr_pool.start_pool()
+            readiness = wait_for_pool(ocr_pool)
+            results = dict(ocr_pool.run_parallel(ocr_engines.engine_readiness, [(), (), ()], 2))
+
+        assert readiness['ready'] is True and readiness['ready_processes'] == 2
+        assert sorted(results) == [0, 1, 2]
+        assert all(result['mode'] == 'preload' and result['state'] == 'ready' for result in results.values())
+        assert all(result['pid'] != os.getpid() for result in results.values())
+
+    def test_parallel_pieces_wait_off_the_hub(self, app, ocr_pool_processes, monkeypatch):
+        """Test run_parallel waits for pool jobs through _blocking (a real thread under gevent)"""
+        blocking = ocr_pool._blocking
+        waited = []
+
+        def record(fn, *args):
+            waited.append(getattr(fn, '__name__', fn))
+            return blocking(fn, *args)
+
+        monkeypatch.setattr(ocr_pool, '_blocking', record)
+
+        with app.app_context():
+            results = dict(ocr_pool.run_parallel(pow, [(2, 3), (3, 2), (2, 5)], 2))
+
+        assert results == {0: 8, 1: 9, 2: 32}
+        assert 'wait' in waited
+
+    def test_preloaded_worker_forks_pool(self, app, ocr_pool_processes, monkeypatch):
+        """Test a preloaded worker forks its pool, so pool processes start with its warm engines"""
+        monkeypatch.setattr(ocr_engines, '_readiness', dict(ocr_engines._readiness, mode='preload',
+                                                            state='ready', seconds=12.5))
+        monkeypatch.setitem(app.config, 'OCR_PRELOAD', True)
+
+        with app.app_context():
+            assert ocr_pool.start_pool()
+            results = dict(ocr_pool.run_parallel(ocr_engines.engine_readiness, [(), ()], 2))
+            readiness = wait_for_pool(ocr_pool)
+
+        assert readiness['ready_processes'] == 2
+        # Inherited, not loaded again
+        assert [result['preload_seconds'] for result in results.values()] == [12.5, 12.5]
+        assert all(result['pid'] != os.getpid() for result in results.values())
+
+
+@pytest.fixture
+def ocr_daemon(app, tmp_path, monkeypatch):
+    """Serve OCR service requests from a thread; tests fill in the handlers"""
+    socket_path = str(tmp_path / 'ocr.sock')
+    monkeypatch.setitem(app.config, 'OCR_SERVICE_SOCKET', socket_path)
+    listener = Listener(socket_path, family='AF_UNIX')
+    handlers = {}
+    threading.Thread(target=ocr_service._accept_loop, args=(listener, handlers, b'daemon-key'),
+                     daemon=True).start()
+    monkeypatch.setitem(app.config, 'OCR_SERVICE_AUTHKEY', 'daemon-key')
+    with app.app_context():
+        yield handlers
+    ocr_service.disconnect()
+    listener.close()
+
+
+class TestOCRService:
+    """Test the shared OCR daemon protocol and the PaddleOCR client backend"""
+
+    def test_large_images_use_shared_memory(self, app, ocr_daemon, monkeypatch):
+        """Test big arrays are read in place from a segment the client removes afterwards"""
+        monkeypatch.setitem(app.config, 'OCR_SERVICE_SHM_MIN_BYTES', 1024)
+        attached = []
+        attach = ocr_service._attach
+
+        def record(spec, segments):
+            attached.append(spec.get('shm'))
+            return attach(spec, segments)
+
+        monkeypatch.setattr(ocr_service, '_attach', record)
+        ocr_daemon['sum'] = lambda images: [int(img.sum()) for img in images]
+        small = np.ones((4, 4), dtype=np.uint8)
+        large = np.ones((64, 64, 3), dtype=np.uint8)
+
+        assert ocr_service.call('sum', [small, large]) == [16, 64 * 64 * 3]
+        assert attached[0] is None and attached[1] is not None
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=attached[1])
+
+    def test_errors_are_reraised(self, ocr_daemon):
+        """Test a failure in the daemon reaches the caller and the connection stays usable"""
+        def fail(images):
+            raise ValueError('model exploded')
+
+        ocr_daemon['fail'] = fail
+        ocr_daemon['ping'] = lambda images: {'ready': True}
+
+        with pytest.raises(RuntimeError, match='model exploded'):
+            ocr_service.call('fail')
+        with pytest.raises(RuntimeError, match='unknown operation'):
+            ocr_service.call('nope')
+        assert ocr_service.service_status() == {'reachable': True, 'ready': True}
+
+    def test_clients_must_know_authkey(self, app, ocr_daemon, monkeypatch):
+        """Test connections without the shared authkey are dropped before any request is read"""
+        called = []
+        ocr_daemon['ping'] = lambda images: called.append(images) or {'ready': True}
+
+        monkeypatch.setitem(app.config, 'OCR_SERVICE_AUTHKEY', 'wrong-key')
+        with pytest.raises(ocr_service.OCRServiceUnavailable):
+            ocr_service.call('ping')
+
+        raw = Client(app.config['OCR_SERVICE_SOCKET'], family='AF_UNIX')
+        raw.send({'op': 'ping', 'images': []})
+        messages = []
+        with pytest.raises((EOFError, OSError)):
+            while True:
+                messages.append(raw.recv_bytes())
+        raw.close()
+        # Only the handshake (challenge, failure), never a reply
+        assert all(message.startswith(b'#') for message in messages)
+        assert called == []
+
+        monkeypatch.setitem(app.config, 'OCR_SERVICE_AUTHKEY', 'daemon-key')
+        assert ocr_service.service_status() == {'reachable': True, 'ready': True}
+
+    def test_unreachable_daemon(self, app, tmp_path, monkeypatch):
+        """Test a missing daemon is reported instead of loading a local model"""
+        monkeypatch.setitem(app.config, 'OCR_SERVICE_SOCKET', str(tmp_path / 'missing.sock'))
+        with app.app_context():
+            status = ocr_service.service_status()
+            with pytest.raises(ocr_service.OCRServiceUnavailable):
+                ocr_processor.process_with_paddleocr(np.zeros((8, 8, 3), dtype=np.uint8))
+
+        assert status['reachable'] is False and status['ready'] is False
+
+    def test_paddle_calls_go_to_daemon(self, ocr_daemon):
+        """Test single and batched PaddleOCR calls are answered by the daemon"""
+        seen = []
+
+        def paddle(images):
+            seen.append(images[0][0, 0].tolist())
+            return ('Solar Panel $199.99', 0.9, [])
+
+        ocr_daemon['paddle'] = paddle
+        ocr_daemon['paddle_batch'] = lambda images: [(f'{len(images)} images', 0.8, [])] * len(images)
+        rgb = np.zeros((8, 8, 3), dtype=np.uint8)
+        rgb[..., 0] = 255
+
+        assert ocr_processor.process_with_paddleocr(rgb) == ('Solar Panel $199.99', 0.9, [])
+        assert seen == [[0, 0, 255]]  # sent in PaddleOCR's BGR order
+        assert ocr_processor.process_batch_with_paddleocr([rgb, rgb]) == [('2 images', 0.8, [])] * 2
+        assert 'paddleocr' in ocr_processor.available_engines()
+
+
+class TestOCRTimings:
+    """Test per-stage OCR timings on scans and their percentiles"""
+
+    def test_scan_records_stage_timings(self, client, auth_headers, catalog_image, fake_ocr):
+        """Test a scan stores the seconds spent decoding, recognizing, parsing and writing"""
+        with open(catalog_image, 'rb') as f:
+            response = client.post('/api/ocr/upload', headers=auth_headers, content_type='multipart/form-data',
+                                   data={'file': (f, 'catalog.png')})
+        scan_id = response.get_json()['ocr_scan']['id']
+
+        timings = client.get(f'/api/ocr/scans/{scan_id}', headers=auth_headers).get_json()['timings']
+
+        assert set(timings) == {'decode', 'recognition', 'parse', 'db_write', 'total'}
+        assert all(seconds >= 0 for seconds in timings.values())
+        assert timings['total'] >= timings['recognition']
+
+    def test_preprocess_steps_timed(self, app, catalog_image, monkeypatch):
+        """Test the multi-method pipeline times each preprocessing step and recognition"""
+        monkeypatch.setitem(app.config, 'OCR_VARIANT_WORKERS', 1)
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'TESSERACT_AVAILABLE', False)
+        monkeypatch.setattr(ocr_processor, 'process_with_paddleocr', lambda image: ('Solar Panel', 0.5, []))
+
+        with app.app_context(), ocr_timing.collect_timings() as timings:
+            ocr_processor.process_image_multi_method(catalog_image)
+
+        assert {stage for stage in timings if stage.startswith('preprocess.')} == {
+            'preprocess.original', 'preprocess.sharpened', 'preprocess.enhanced_sharp',
+            'preprocess.contrast_sharp', 'preprocess.150pct_sharp', 'preprocess.200pct_sharp'}
+        assert timings['decode'] > 0 and 'recognition' in timings
+
+    def test_variant_timings_returned_to_caller(self, app, catalog_image, monkeypatch):
+        """Test stages timed while scoring a variant (in a pool process) come back with its result"""
+        calls = []
+
+        def recognize(image):
+            calls.append(image)
+            ocr_timing.add_timing('segmentation', 0.25)
+            return 'Solar Panel', 0.5, []
+
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'TESSERACT_AVAILABLE', False)
+        monkeypatch.setattr(ocr_processor, 'process_with_paddleocr', recognize)
+
+        with ocr_timing.collect_timings() as outer:
+            result = ocr_processor._evaluate_variant('paddleocr', 'original', None)
+        with app.app_context(), ocr_timing.collect_timings() as timings:
+            ocr_processor.process_image_multi_method(catalog_image)
+
+        assert result['timings'] == {'segmentation': 0.25} and outer == {}
+        assert timings['segmentation'] == pytest.approx(0.25 * (len(calls) - 1))
+
+    def test_timing_percentiles(self, client, auth_headers, catalog_image, fake_ocr):
+        """Test stage timings are aggregated into percentiles over recent scans"""
+        upload(client, auth_headers)
+        with open(catalog_image, 'rb') as f:
+            client.post('/api/ocr/upload', headers=auth_headers, content_type='multipart/form-data',
+                        data={'file': (f, 'catalog.png')})
+
+        response = client.get('/api/ocr/stats/timings', headers=auth_headers)
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['scans'] == 2 and data['scope'] == 'user'
+        stages = {row['stage']: row for row in data['stages']}
+        assert stages['total']['count'] == 2 and stages['total']['share'] == 1.0
+        assert stages['recognition']['p50_seconds'] <= stages['recognition']['p99_seconds']
+        assert client.get('/api/ocr/stats/timings?scope=team', headers=auth_headers).status_code == 400
+
+
+def grid_page(columns=3, rows=2):
+    """White page with a grid of product tiles, each two dark text bars"""
+    img = np.full((600, 900, 3), 255, np.uint8)
+    for row in range(rows):
+        for column in range(columns):
+            x, y = 50 + column * 300, 50 + row * 250
+            img[y:y + 20, x:x + 150] = 0
+            img[y + 30:y + 50, x:x + 80] = 0
+    return img
+
+
+class TestCellSegmentation:
+    """Test catalog grid segmentation and cell-by-cell OCR"""
+
+    def test_line_height_is_text_line_height(self):
+        """Test the line height is measured over whole text lines, not single pixel rows"""
+        ink = ocr_cells.ink_mask(grid_page(), 1)
+
+        assert ocr_cells._line_height(ink) == 20
+
+    def test_grid_cells_in_reading_order(self):
+        """Test gutters split a grid into one padded cell per tile, row by row"""
+        cells = ocr_cells.find_cells(grid_page(), gap_lines=1.5, min_cells=4)
+
+        assert len(cells) == 6
+        assert cells[0] == (35, 35, 215, 115)
+        assert [(x0, y0) for x0, y0, _, _ in cells] == [
+            (35, 35), (335, 35), (635, 35), (35, 285), (335, 285), (635, 285)]
+
+    def test_pages_without_grid_are_whole(self):
+        """Test a single column of paragraphs and a blank page give no cells"""
+        img = np.full((600, 900, 3), 255, np.uint8)
+        for y in (50, 80, 110, 300, 330, 360):
+            img[y:y + 20, 50:600] = 0
+
+        assert ocr_cells.find_cells(img, gap_lines=1.5, min_cells=2) == []
+        assert ocr_cells.find_cells(np.full((600, 900, 3), 255, np.uint8), 1.5, 2) == []
+
+    def test_cells_map_to_products(self, app, monkeypatch):
+        """Test each cell is recognized on its own and becomes one product"""
+        crops = []
+
+        def recognize_batch(images):
+            crops.extend(image.shape for image in images)
+            return [(f'Product {i}', 0.9, [text_block(f'Product {i}', 15, 15, 165, 35),
+                                           text_block(f'${i}9.99', 15, 45, 95, 65)])
+                    for i in range(1, len(images) + 1)]
+
+        monkeypatch.setattr(ocr_processor, 'PADDLE_AVAILABLE', True)
+        monkeypatch.setattr(ocr_processor, 'recognize_paddle_batch', recognize_batch)
+        monkeypatch.setitem(app.config, 'OCR_VARIANT_WORKERS', 1)
+
+        with app.app_context(), ocr_timing.collect_timings() as timings:
+            raw_text, confidence, blocks = ocr_processor.process_with_paddleocr(grid_page()[:, :, ::-1])
+            products = catalog_layout.extract_products(raw_text, blocks)
+
+        assert crops == [(80, 180, 3)] * 6
+        assert [block['cell'] for block in blocks[:4]] == [0, 0, 1, 1]
+        assert blocks[2]['box'][0] == [350, 50]
+        assert [(p['name'], p['price']) for p in products] == [
+            (f'Product {i}', float(f'{i}9.99')) for i in range(1, 7)]
+        assert 'segmentation' in timings
+
+    def test_split_product_falls_back_to_layout(self, app):
+        """Test a price cut off into its own cell is rejoined by the page layout parser"""
+        blocks = [dict(text_block('Solar Panel 300W', 0, 0, 200, 30), cell=0),
+                  dict(text_block('$199.99', 400, 0, 500, 30), cell=1)]
+
+        assert catalog_layout.parse_cell_products(blocks) is None
+        with app.app_context():
+            products = catalog_layout.extract_products('', blocks)
+
+        assert [(p['name'], p['price']) for p in products] == [('Solar Panel 300W', 199.99)]
@@ -0,0 +1,87 @@
+"""
+Data retention tests
+"""
+import os
+from datetime import datetime, timedelta
+from models import AuditLog, Listing, OCRResultCache, OCRScan
+from utils import retention
+
+
+def old_file(path, days):
+    """Write a file and backdate its modification time"""
+    path.write_bytes(b'x' * 100)
+    stamp = (datetime.now() - timedelta(days=days)).timestamp()
+    os.utime(path, (stamp, stamp))
+    return str(path)
+
+
+class TestRetentionSweep:
+    """Test batched removal of expired data"""
+
+    def test_sweep_removes_expired_rows_and_files(self, app, db_session, test_user, tmp_path, monkeypatch):
+        """Test expired scans, files and audit rows go; recent and active ones stay"""
+        upload_dir = tmp_path / 'ocr'
+        upload_dir.mkdir()
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setitem(app.config, 'RETENTION_BATCH_PAUSE', 0)
+        expired = datetime.utcnow() - timedelta(days=40)
+
+        scans = [OCRScan(user_id=test_user.id, filename=f'{i}.png', status='completed', created_at=expired,
+                         file_path=old_file(upload_dir / f'{i}.png', 40)) for i in range(5)]
+        active = OCRScan(user_id=test_user.id, filename='active.png', status='processing', created_at=expired,
+                         file_path=old_file(upload_dir / 'active.png', 40))
+        recent = OCRScan(user_id=test_user.id, filename='recent.png', status='completed')
+        db_session.add_all(scans + [active, recent])
+        db_session.flush()
+        listing = Listing(user_id=test_user.id, title='From scan', price=1.0, condition='New',
+                          ocr_scan_id=scans[0].id)
+        db_session.add(listing)
+        for i in range(3):
+            db_session.add(AuditLog(action='login', created_at=expired))
+        db_session.add(AuditLog(action='login'))
+        db_session.commit()
+        orphan = old_file(upload_dir / 'orphan.png', 40)
+        fresh = old_file(upload_dir / 'fresh.png', 1)
+
+        with app.app_context():
+            report = retention.sweep_expired(days=30, batch_size=2)
+
+        assert report['ocr_scans'] == {'rows': 5, 'files': 5, 'bytes': 500}
+        assert report['upload_files'] == {'files': 1, 'bytes': 100}
+        assert report['audit_logs'] == {'rows': 3}
+        assert report['bytes_reclaimed'] == 600
+        assert {scan.filename for scan in OCRScan.query} == {'active.png', 'recent.png'}
+        assert AuditLog.query.count() == 1
+        assert db_session.get(Listing, listing.id).ocr_scan_id is None
+        assert not os.path.exists(orphan)
+        assert os.path.exists(fresh) and os.path.exists(active.file_path)
+
+    def test_sweep_removes_unused_cache_entries(self, app, db_session, monkeypatch):
+        """Test cache entries not used within the retention period go, in batches; recently hit ones stay"""
+        monkeypatch.setitem(app.config, 'RETENTION_BATCH_PAUSE', 0)
+        expired = datetime.utcnow() - timedelta(days=40)
+        db_session.add_all([OCRResultCache(content_hash=f'{i:064x}', config_version='v1', created_at=expired,
+                                           last_used_at=expired) for i in range(3)])
+        # Created long ago but hit recently
+        db_session.add(OCRResultCache(content_hash='f' * 64, config_version='v1', created_at=expired))
+        db_session.commit()
+
+        with app.app_context():
+            report = retention.sweep_expired(days=30, batch_size=2)
+
+        assert report['ocr_cache'] == {'rows': 3}
+        assert report['rows_deleted'] == 3
+        assert [entry.content_hash for entry in OCRResultCache.query] == ['f' * 64]
+
+    def test_retention_disabled(self, app, db_session):
+        """Test DATA_RETENTION_DAYS=0 keeps everything"""
+        with app.app_context():
+            assert 'skipped' in retention.sweep_expired(days=0)
+
+    def test_cli_reports_reclaimed(self, app, db_session):
+        """Test the flask command prints its report"""
+        result = app.test_cli_runner().invoke(args=['sweep-retention', '--days', '30'])
+
+        assert result.exit_code == 0
+        assert 'OCR cache:    0 rows' in result.output
+        assert 'Reclaimed 0 rows and 0 bytes' in result.output
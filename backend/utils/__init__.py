@@ -2,7 +2,7 @@
 Utility functions
 """
 from .auth import generate_access_token, generate_refresh_token, verify_token, token_required
-from .file_upload import allowed_file, save_upload_file, validate_file_size
+from .file_upload import allowed_file, save_upload_file, save_upload_stream, validate_file_size
 from .audit import log_action
 
 __all__ = [
@@ -12,6 +12,7 @@ __all__ = [
     'token_required',
     'allowed_file',
     'save_upload_file',
+    'save_upload_stream',
     'validate_file_size',
     'log_action'
 ]
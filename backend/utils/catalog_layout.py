@@ -0,0 +1,293 @@
+"""
+Layout-aware catalog parsing
+Groups OCR text boxes into lines, columns and product cells using their
+geometry, so a product's name, price and description are joined even when
+they sit on separate lines or in a grid of products. Pages OCRed cell by
+cell (utils/ocr_cells) map each cell straight to one product.
+Every grouping step is a sort followed by a linear sweep, so a page with
+thousands of boxes costs O(n log n) rather than comparing every pair.
+"""
+
+import statistics
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.ocr_engines import ocr_setting
+from utils.ocr_processor import extract_price, parse_product_catalog
+from utils.ocr_tiling import box_bounds
+
+BBox = Tuple[float, float, float, float]
+
+
+class _Line:
+    """Text boxes that sit side by side on one baseline"""
+
+    def __init__(self, bbox: BBox, text: str, confidence: float):
+        self.x0, self.y0, self.x1, self.y1 = bbox
+        self.texts = [text]
+        self.confidences = [confidence]
+        self._price = None
+
+    @property
+    def text(self) -> str:
+        return ' '.join(self.texts)
+
+    @property
+    def center(self) -> float:
+        return (self.y0 + self.y1) / 2
+
+    def extend(self, bbox: BBox, text: str, confidence: float) -> None:
+        self.x0, self.y0 = min(self.x0, bbox[0]), min(self.y0, bbox[1])
+        self.x1, self.y1 = max(self.x1, bbox[2]), max(self.y1, bbox[3])
+        self.texts.append(text)
+        self.confidences.append(confidence)
+        self._price = None
+
+    def price(self) -> Tuple[Optional[float], str]:
+        if self._price is None:
+            self._price = extract_price(self.text)
+        return self._price
+
+    @property
+    def has_price(self) -> bool:
+        return self.price()[0] is not None
+
+    @property
+    def price_only(self) -> bool:
+        price, rest = self.price()
+        return price is not None and len(rest) < 3
+
+
+def has_layout(blocks: Optional[List[Dict[str, Any]]]) -> bool:
+    """True when the blocks carry boxes the layout parser can use"""
+    return bool(blocks) and any(block.get('box') for block in blocks)
+
+
+def _build_lines(items: List[Tuple[BBox, Dict[str, Any]]], line_height: float) -> List[_Line]:
+    """Group boxes into rows by vertical center, then join neighbours within a row"""
+    items = sorted(items, key=lambda item: (item[0][1] + item[0][3]) / 2)
+
+    rows = []
+    row_center = None
+    for bbox, block in items:
+        center = (bbox[1] + bbox[3]) / 2
+        if row_center is None or center - row_center > line_height / 2:
+            rows.append([])
+            row_center = center
+        rows[-1].append((bbox, block))
+
+    lines = []
+    for row in rows:
+        line = None
+        for bbox, block in sorted(row, key=lambda item: item[0][0]):
+            text = block['text'].strip()
+            if line is not None and bbox[0] - line.x1 <= line_height:
+                line.extend(bbox, text, block.get('confidence', 0.0))
+            else:
+                line = _Line(bbox, text, block.get('confidence', 0.0))
+                lines.append(line)
+    return lines
+
+
+def _sweep_columns(lines: List[_Line], gap: float) -> List[List[_Line]]:
+    """Merge overlapping horizontal extents left to right into columns"""
+    columns = []
+    right = None
+    for line in sorted(lines, key=lambda line: line.x0):
+        if right is None or line.x0 > right + gap:
+            columns.append([])
+            right = line.x1
+        else:
+            right = max(right, line.x1)
+        columns[-1].append(line)
+    return columns
+
+
+def _build_columns(lines: List[_Line], line_height: float) -> List[List[_Line]]:
+    """
+    Split lines into product columns. Lines spanning most of the page
+    (headings, banners) are kept out of the sweep so they do not bridge
+    columns, and a column holding only prices belongs to the column on its left.
+    """
+    left = min(line.x0 for line in lines)
+    page_width = max(line.x1 for line in lines) - left
+    wide = [line for line in lines if line.x1 - line.x0 > page_width / 2]
+    narrow = [line for line in lines if line.x1 - line.x0 <= page_width / 2]
+
+    columns = _sweep_columns(narrow, line_height)
+    if len(columns) < 2:
+        return [lines]
+
+    merged = []
+    for column in columns:
+        if merged and all(line.price_only for line in column):
+            merged[-1].extend(column)
+        else:
+            merged.append(column)
+
+    # Wide lines stand alone: each becomes its own single-line column
+    return merged + [[line] for line in wide]
+
+
+def _build_cells(column: List[_Line], line_height: float) -> List[List[_Line]]:
+    """Split a column into cells wherever the vertical gap exceeds normal line spacing"""
+    column = sorted(column, key=lambda line: (line.center, line.x0))
+    cells = []
+    bottom = None
+    for line in column:
+        if bottom is None or line.y0 - bottom > line_height * 0.8:
+            cells.append([])
+            bottom = line.y1
+        else:
+            bottom = max(bottom, line.y1)
+        cells[-1].append(line)
+    return cells
+
+
+def _split_cell(cell: List[_Line]) -> List[List[_Line]]:
+    """
+    Split a cell holding several prices into one group per price. Each
+    boundary falls at the widest vertical gap between consecutive prices.
+    """
+    price_indexes = [i for i, line in enumerate(cell) if line.has_price]
+    if len(price_indexes) < 2:
+        return [cell]
+
+    starts = [0]
+    for previous, current in zip(price_indexes, price_indexes[1:]):
+        boundary = max(
+            range(previous + 1, current + 1),
+            key=lambda k: (cell[k].y0 - cell[k - 1].y1, k)
+        )
+        starts.append(boundary)
+    ends = starts[1:] + [len(cell)]
+    return [cell[start:end] for start, end in zip(starts, ends)]
+
+
+def _make_product(lines: List[_Line]) -> Optional[Dict[str, Any]]:
+    """Join a group of lines into one product: name, first price, all text as description"""
+    price = None
+    name = ''
+    for line in lines:
+        line_price, rest = line.price()
+        if price is None:
+            price = line_price
+        if not name and len(rest) >= 3:
+            name = rest
+
+    if not name:
+        return None
+
+    confidences = [confidence for line in lines for confidence in line.confidences]
+    return {
+        'name': name,
+        'price': price,
+        'description': ' '.join(line.text for line in lines),
+        'condition': 'New',  # Default
+        'category': '',  # To be filled by user
+        'box': [
+            round(min(line.x0 for line in lines), 1),
+            round(min(line.y0 for line in lines), 1),
+            round(max(line.x1 for line in lines), 1),
+            round(max(line.y1 for line in lines), 1),
+        ],
+        'confidence': sum(confidences) / len(confidences) if confidences else 0.0,
+    }
+
+
+def parse_product_layout(blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Parse products from OCR blocks using their boxes.
+    Blocks are joined into lines, lines into columns, columns into cells
+    separated by whitespace, and each cell into one product per price.
+    Cells without a price are only kept when the page has no prices at all.
+    Products come back in reading order: cell rows top to bottom, then left to right.
+    """
+    items = [
+        (box_bounds(block['box']), block)
+        for block in blocks
+        if block.get('box') and block.get('text', '').strip()
+    ]
+    if not items:
+        return []
+
+    line_height = statistics.median(bbox[3] - bbox[1] for bbox, _ in items) or 1
+    lines = _build_lines(items, line_height)
+
+    groups = []
+    for column in _build_columns(lines, line_height):
+        for cell in _build_cells(column, line_height):
+            groups.extend(_split_cell(cell))
+
+    priced = any(line.has_price for group in groups for line in group)
+    products = []
+    for group in groups:
+        if priced and not any(line.has_price for line in group):
+            continue
+        product = _make_product(group)
+        if product:
+            products.append(product)
+
+    # Cells in the same grid row share a top edge within a line height
+    products.sort(key=lambda product: (product['box'][1], product['box'][0]))
+    rows = []
+    for product in products:
+        if rows and product['box'][1] - rows[-1][0]['box'][1] <= line_height:
+            rows[-1].append(product)
+        else:
+            rows.append([product])
+    return [product for row in rows for product in sorted(row, key=lambda product: product['box'][0])]
+
+
+def _cell_lines(blocks: List[Dict[str, Any]]) -> List[_Line]:
+    items = [(box_bounds(block['box']), block) for block in blocks]
+    line_height = statistics.median(bbox[3] - bbox[1] for bbox, _ in items) or 1
+    return sorted(_build_lines(items, line_height), key=lambda line: (line.center, line.x0))
+
+
+def parse_cell_products(blocks: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    One product per segmented cell, in cell (reading) order. A cell holding
+    several prices was not split by the segmenter and is parsed by layout.
+    Returns None when a priced cell has no name, meaning the segmenter cut a
+    product apart; the caller then parses the whole page by layout instead.
+    """
+    cells: Dict[int, List[Dict[str, Any]]] = {}
+    for block in blocks:
+        if block.get('box') and block.get('text', '').strip():
+            cells.setdefault(block['cell'], []).append(block)
+
+    groups = []
+    for index in sorted(cells):
+        lines = _cell_lines(cells[index])
+        if sum(line.has_price for line in lines) > 1:
+            groups.extend(_split_cell(lines))
+        else:
+            groups.append(lines)
+
+    priced = any(line.has_price for group in groups for line in group)
+    products = []
+    for group in groups:
+        if priced and not any(line.has_price for line in group):
+            continue
+        product = _make_product(group)
+        if product is None:
+            return None
+        products.append(product)
+    return products
+
+
+def extract_products(raw_text: str, blocks: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Products for one image or page: one per cell for pages OCRed cell by
+    cell, the layout parser when boxes are available and OCR_LAYOUT_PARSER
+    is on, otherwise the line-based parser
+    """
+    if ocr_setting('OCR_LAYOUT_PARSER') and has_layout(blocks):
+        products = None
+        if any('cell' in block for block in blocks):
+            products = parse_cell_products(blocks)
+        if not products:
+            products = parse_product_layout(blocks)
+        if products:
+            return products
+    return parse_product_catalog(raw_text)
@@ -3,8 +3,11 @@ File upload utilities
 """
 import os
 import uuid
+import hashlib
+import tempfile
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from flask import current_app
+from flask import Request, current_app, request
 
 
 def allowed_file(filename):
@@ -23,16 +26,104 @@ def validate_file_size(file):
     return size <= current_app.config['MAX_FILE_SIZE']
 
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class FileTooLarge(RequestEntityTooLarge):
+    """An uploaded file part crossed MAX_FILE_SIZE while the request was parsed"""
+
+
+class UploadSpool:
+    """
+    Where Werkzeug writes one multipart file part while it parses the request
+    body: a file under UPLOAD_FOLDER/ocr, counted and hashed as each chunk
+    arrives. Parsing is aborted (FileTooLarge) and the file removed before a
+    chunk would take it past max_size. Saving the upload then moves it in
+    place (keep()) instead of reading and copying it again. Removed on
+    close() unless kept; spools a crashed worker leaves behind are swept as
+    orphan upload files.
+    """
+
+    def __init__(self, directory, max_size=None):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix='.upload-', dir=directory)
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self._kept = False
+        self.max_size = max_size
+        self.size = 0
+
+    def write(self, data):
+        if self.max_size is not None and self.size + len(data) > self.max_size:
+            self.close()
+            raise FileTooLarge()
+        self.size += len(data)
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def keep(self, file_path):
+        """Move the spooled file to file_path; it is no longer removed on close()"""
+        self._file.close()
+        os.replace(self.path, file_path)
+        self._kept = True
+
+    def close(self):
+        self._file.close()
+        if not self._kept:
+            self._kept = True
+            delete_upload_file(self.path)
+
+    def __getattr__(self, name):
+        # read, seek, tell, ... for code reading the part (zip archives)
+        return getattr(self._file, name)
+
+    def __del__(self):
+        # Parts of a request whose parsing failed are never closed by the request
+        if '_file' in self.__dict__:
+            self.close()
+
+
+class UploadRequest(Request):
+    """
+    Request class whose OCR upload parts are spooled, counted and hashed
+    while the body is parsed. Each part stops at MAX_FILE_SIZE, except zip
+    archives of a batch (bounded by MAX_REQUEST_SIZE; their members are
+    checked one by one). Other routes keep Werkzeug's default spooling.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.blueprint != 'ocr':
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        archive = self.endpoint == 'ocr.upload_batch' and (filename or '').lower().endswith('.zip')
+        return UploadSpool(os.path.join(current_app.config['UPLOAD_FOLDER'], 'ocr'),
+                           max_size=None if archive else current_app.config['MAX_FILE_SIZE'])
+
+
 def save_upload_file(file, subfolder=''):
     """Save uploaded file and return path"""
+    saved = save_upload_stream(file, subfolder)
+    return saved[0] if saved else None
+
+
+def save_upload_stream(file, subfolder=''):
+    """
+    Save uploaded file, counting and hashing it in the same pass
+    A part spooled by UploadRequest was counted and hashed while the request
+    was parsed, so it is only moved in place. Other streams (zip members) are
+    copied in chunks, stopping and removing the partial file as soon as
+    MAX_FILE_SIZE is crossed
+    Returns (file_path, file_size, sha256 hex digest)
+    """
     if not file:
         return None
     
     if not allowed_file(file.filename):
         raise ValueError('File type not allowed')
     
-    if not validate_file_size(file):
-        raise ValueError('File size exceeds maximum allowed size')
+    max_size = current_app.config['MAX_FILE_SIZE']
     
     # Generate unique filename
     filename = secure_filename(file.filename)
@@ -42,11 +133,42 @@ def save_upload_file(file, subfolder=''):
     upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], subfolder)
     os.makedirs(upload_path, exist_ok=True)
     
-    # Save file
     file_path = os.path.join(upload_path, unique_filename)
-    file.save(file_path)
+    spool = file.stream
+    if isinstance(spool, UploadSpool):
+        if spool.size > max_size:
+            spool.close()
+            raise ValueError('File size exceeds maximum allowed size')
+        spool.keep(file_path)
+        return file_path, spool.size, spool.hexdigest()
+    
+    # Save file, hashing each chunk as it is written
+    digest = hashlib.sha256()
+    file_size = 0
+    try:
+        with open(file_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if file_size > max_size:
+                    raise ValueError('File size exceeds maximum allowed size')
+                digest.update(chunk)
+                out.write(chunk)
+    except Exception:
+        delete_upload_file(file_path)
+        raise
     
-    return file_path
+    return file_path, file_size, digest.hexdigest()
+
+
+def request_too_large(limit):
+    """
+    True when the declared request body is larger than limit, checked from
+    Content-Length before the multipart body is parsed or buffered
+    """
+    return request.content_length is not None and request.content_length > limit
 
 
 def delete_upload_file(file_path):
@@ -0,0 +1,398 @@
+"""
+OCR benchmark and accuracy suite
+Renders synthetic product-catalog images with known titles and prices, runs
+every installed engine on every preprocessing variant through
+process_image_multi_method, parses them like an upload, and reports latency
+percentiles, memory and field-level accuracy against the ground truth.
+Needs no network; results are saved as JSON so runs can be compared.
+
+    cd backend
+    python -m utils.ocr_benchmark --output bench.json
+    python -m utils.ocr_benchmark --output after.json --compare bench.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import difflib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app, has_app_context
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from config import get_config
+from utils.catalog_layout import extract_products
+from utils.ocr_engines import ocr_setting, preload_engines, process_memory
+from utils.ocr_processor import available_engines, preprocess_image_enhanced, process_image_multi_method
+
+RESULTS_VERSION = 1
+
+# Titles and prices the corpus is drawn from
+CATALOG_PRODUCTS: List[Dict[str, Any]] = [
+    {'name': 'Solar Panel 300W', 'price': 199.99},
+    {'name': 'Charge Controller 40A', 'price': 89.50},
+    {'name': 'Deep Cycle Battery 100Ah', 'price': 249.00},
+    {'name': 'Pure Sine Inverter 2000W', 'price': 329.95},
+    {'name': 'MC4 Connector Pair', 'price': 7.49},
+    {'name': 'Mounting Rail Kit', 'price': 54.20},
+    {'name': 'Battery Cable Set', 'price': 32.75},
+    {'name': 'Portable Power Station', 'price': 499.00},
+    {'name': 'Folding Solar Blanket', 'price': 159.80},
+    {'name': 'Inline Fuse Holder', 'price': 12.30},
+    {'name': 'Roof Junction Box', 'price': 41.60},
+    {'name': 'Shunt Battery Monitor', 'price': 68.15},
+]
+
+# Font names resolved through PIL; missing fonts fall back to PIL's default font
+FONTS: Dict[str, List[str]] = {
+    'sans': ['DejaVuSans.ttf', 'LiberationSans-Regular.ttf', 'Arial.ttf'],
+    'serif': ['DejaVuSerif.ttf', 'LiberationSerif-Regular.ttf', 'Times New Roman.ttf'],
+    'mono': ['DejaVuSansMono.ttf', 'LiberationMono-Regular.ttf', 'Courier New.ttf'],
+}
+
+DEFAULT_WIDTHS = [800, 1600, 3200]  # 3200 exceeds OCR_DET_LIMIT_SIDE_LEN and is tiled
+DEFAULT_FONTS = ['sans', 'serif', 'mono']
+DEFAULT_NOISE = [0.0, 12.0, 30.0]  # std-dev of Gaussian pixel noise
+PRODUCTS_PER_IMAGE = 6
+TITLE_MATCH_RATIO = 0.8  # titles this similar count as the same product
+
+
+def load_font(font: str, size: int) -> Tuple[ImageFont.ImageFont, str]:
+    """Return (font, file actually used); 'default' when no named font is installed"""
+    for filename in FONTS.get(font, [font]):
+        try:
+            return ImageFont.truetype(filename, size), filename
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size), 'default'
+    except TypeError:
+        # Pillow < 10.1 has a single fixed-size bitmap font
+        return ImageFont.load_default(), 'default'
+
+
+def render_catalog(products: List[Dict[str, Any]], width: int, font: str = 'sans',
+                   noise: float = 0.0, columns: int = 2, seed: int = 0) -> Tuple[Image.Image, str]:
+    """
+    Draw products as a grid of cells (title line, price line) on a white page.
+    Text scales with width; noise adds seeded Gaussian pixel noise and a slight blur.
+    Returns (RGB image, font file used).
+    """
+    font_size = max(12, width // 40)
+    face, font_file = load_font(font, font_size)
+    margin = font_size
+    line_height = int(font_size * 1.6)
+    cell_width = (width - 2 * margin) // columns
+    cell_height = line_height * 3
+    rows = (len(products) + columns - 1) // columns
+
+    img = Image.new('RGB', (width, rows * cell_height + 2 * margin), 'white')
+    draw = ImageDraw.Draw(img)
+    for i, product in enumerate(products):
+        x = margin + (i % columns) * cell_width
+        y = margin + (i // columns) * cell_height
+        draw.text((x, y), product['name'], fill='black', font=face)
+        draw.text((x, y + line_height), f"${product['price']:.2f}", fill='black', font=face)
+
+    if noise > 0:
+        img = img.filter(ImageFilter.GaussianBlur(radius=noise / 30))
+        rng = np.random.default_rng(seed)
+        pixels = np.asarray(img, dtype=np.float32) + rng.normal(0.0, noise, (img.height, img.width, 1))
+        img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return img, font_file
+
+
+def build_corpus(widths: Optional[List[int]] = None, fonts: Optional[List[str]] = None,
+                 noise_levels: Optional[List[float]] = None, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    One case per width x font x noise level, each with its own seeded sample
+    of CATALOG_PRODUCTS. The same arguments always render the same images.
+    """
+    rng = random.Random(seed)
+    cases = []
+    for width in widths or DEFAULT_WIDTHS:
+        for font in fonts or DEFAULT_FONTS:
+            for noise in noise_levels if noise_levels is not None else DEFAULT_NOISE:
+                products = rng.sample(CATALOG_PRODUCTS, PRODUCTS_PER_IMAGE)
+                image, font_file = render_catalog(products, width, font, noise, seed=rng.randrange(2 ** 32))
+                cases.append({
+                    'name': f"w{width}_{font}_n{noise:g}",
+                    'width': width,
+                    'height': image.height,
+                    'font': font,
+                    'font_file': font_file,
+                    'noise': noise,
+                    'products': products,
+                    'image': image,
+                })
+    return cases
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+
+def score_products(expected: List[Dict[str, Any]], found: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Field-level accuracy of parsed products against the ground truth.
+    Products are paired greedily by title similarity; a pair counts when the
+    titles are at least TITLE_MATCH_RATIO alike. Title and price accuracy are
+    fractions of the expected products read exactly.
+    """
+    pairs = sorted(
+        ((difflib.SequenceMatcher(None, _normalize(e['name']), _normalize(f.get('name') or '')).ratio(), i, j)
+         for i, e in enumerate(expected) for j, f in enumerate(found)),
+        reverse=True
+    )
+    used_expected, used_found, matches = set(), set(), []
+    for ratio, i, j in pairs:
+        if ratio < TITLE_MATCH_RATIO:
+            break
+        if i in used_expected or j in used_found:
+            continue
+        used_expected.add(i)
+        used_found.add(j)
+        matches.append((ratio, expected[i], found[j]))
+
+    titles = sum(1 for ratio, e, f in matches if _normalize(e['name']) == _normalize(f['name']))
+    prices = sum(1 for ratio, e, f in matches
+                 if f.get('price') is not None and abs(f['price'] - e['price']) < 0.005)
+    total = len(expected) or 1
+    return {
+        'expected': len(expected),
+        'found': len(found),
+        'matched': len(matches),
+        'recall': round(len(matches) / total, 4),
+        'precision': round(len(matches) / len(found), 4) if found else 0.0,
+        'title_accuracy': round(titles / total, 4),
+        'title_similarity': round(sum(ratio for ratio, e, f in matches) / total, 4),
+        'price_accuracy': round(prices / total, 4),
+    }
+
+
+def _run_case(path: str, engines: Optional[List[str]], methods: Optional[List[str]],
+              trace_memory: bool) -> Dict[str, Any]:
+    """OCR and parse one image the way an upload would, timing it end to end"""
+    if trace_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    try:
+        result = process_image_multi_method(path, engines=engines, methods=methods)
+        products = extract_products(result['raw_text'], result['blocks'])
+        error = None
+    except RuntimeError as e:
+        result, products, error = {}, [], str(e)
+    seconds = time.perf_counter() - start_time
+
+    traced_peak = None
+    if trace_memory:
+        traced_peak = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+    return {
+        'seconds': round(seconds, 4),
+        'method_used': result.get('method_used'),
+        'confidence': result.get('confidence'),
+        'early_exit': result.get('early_exit'),
+        'rss_mb': process_memory()['rss_mb'],
+        'traced_peak_mb': traced_peak,
+        'products': products,
+        'error': error,
+    }
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    return round(float(np.percentile(values, pct)), 4) if values else None
+
+
+def summarize(runs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Latency percentiles, memory and mean accuracy per engine/variant combination"""
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for run in runs:
+        groups.setdefault((run['engine'], run['variant']), []).append(run)
+
+    summary = []
+    for (engine, variant), group in groups.items():
+        seconds = [run['seconds'] for run in group]
+        traced = [run['traced_peak_mb'] for run in group if run['traced_peak_mb'] is not None]
+        rss = [run['rss_mb'] for run in group if run['rss_mb'] is not None]
+
+        def mean(field):
+            return round(sum(run['accuracy'][field] for run in group) / len(group), 4)
+
+        summary.append({
+            'engine': engine,
+            'variant': variant,
+            'runs': len(group),
+            'errors': sum(1 for run in group if run['error']),
+            'p50_seconds': percentile(seconds, 50),
+            'p90_seconds': percentile(seconds, 90),
+            'p99_seconds': percentile(seconds, 99),
+            'mean_seconds': round(sum(seconds) / len(seconds), 4),
+            'max_rss_mb': max(rss) if rss else None,
+            'max_traced_peak_mb': max(traced) if traced else None,
+            'recall': mean('recall'),
+            'precision': mean('precision'),
+            'title_accuracy': mean('title_accuracy'),
+            'price_accuracy': mean('price_accuracy'),
+        })
+    return sorted(summary, key=lambda row: (row['engine'], row['variant']))
+
+
+@contextmanager
+def _recognition_in_process() -> Iterator[None]:
+    """
+    Recognize in this process (OCR_POOL_WORKERS=0) while benchmarking, so the
+    warm-up, rss_mb and tracemalloc measure the process that runs the engines
+    instead of a parent whose spawned pool loads cold models on the first case
+    """
+    config = current_app.config if has_app_context() else None
+    previous = config['OCR_POOL_WORKERS'] if config is not None else get_config().OCR_POOL_WORKERS
+    if config is not None:
+        config['OCR_POOL_WORKERS'] = 0
+    else:
+        get_config().OCR_POOL_WORKERS = 0
+    try:
+        yield
+    finally:
+        if config is not None:
+            config['OCR_POOL_WORKERS'] = previous
+        else:
+            get_config().OCR_POOL_WORKERS = previous
+
+
+def run_benchmark(corpus: List[Dict[str, Any]], engines: Optional[List[str]] = None,
+                  repeat: int = 1, warmup: bool = True, trace_memory: bool = False,
+                  image_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run each engine on each preprocessing variant of every case on its own,
+    plus the production pipeline (engine 'pipeline', variant 'auto': all
+    engines and variants with the configured early exit), repeat times each.
+    Recognition runs in this process, one piece at a time (no OCR pool), so
+    warmup loads the engines the runs use and load time is reported apart
+    from latency; rss_mb and trace_memory (Python/numpy peak allocations per
+    run, slower) measure that same process.
+    Images are kept in image_dir when given, otherwise in a temp directory.
+    """
+    with _recognition_in_process():
+        return _run_benchmark(corpus, engines, repeat, warmup, trace_memory, image_dir)
+
+
+def _run_benchmark(corpus: List[Dict[str, Any]], engines: Optional[List[str]], repeat: int, warmup: bool,
+                   trace_memory: bool, image_dir: Optional[str]) -> Dict[str, Any]:
+    engines = engines or available_engines()
+    load = preload_engines(warmup=True) if warmup else None
+
+    runs = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for case in corpus:
+            path = os.path.join(image_dir or temp_dir, f"{case['name']}.png")
+            case['image'].save(path)
+            methods = [method for method, _ in preprocess_image_enhanced(path)]
+            combinations = [(engine, [engine], [method]) for engine in engines for method in methods]
+            combinations.append(('pipeline', None, None))
+
+            for engine, run_engines, run_methods in combinations:
+                for _ in range(repeat):
+                    run = _run_case(path, run_engines, run_methods, trace_memory)
+                    run.update(case=case['name'], engine=engine,
+                               variant=run_methods[0] if run_methods else 'auto',
+                               accuracy=score_products(case['products'], run.pop('products')))
+                    runs.append(run)
+
+    return {
+        'version': RESULTS_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'engines': engines,
+            'engine_load_seconds': load['preload_seconds'] if load else None,
+            'settings': {name: ocr_setting(name) for name in (
+                'OCR_POOL_WORKERS', 'OCR_VARIANT_WORKERS', 'OCR_EARLY_EXIT', 'OCR_EARLY_EXIT_CONFIDENCE',
+                'OCR_DET_LIMIT_SIDE_LEN', 'OCR_TILING', 'OCR_LAYOUT_PARSER')},
+        },
+        'corpus': [{key: value for key, value in case.items() if key != 'image'} for case in corpus],
+        'runs': runs,
+        'summary': summarize(runs),
+    }
+
+
+def compare_results(previous: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per engine/variant change in latency and accuracy between two saved runs"""
+    before = {(row['engine'], row['variant']): row for row in previous.get('summary', [])}
+    fields = ['p50_seconds', 'p90_seconds', 'max_rss_mb', 'recall', 'title_accuracy', 'price_accuracy']
+    changes = []
+    for row in current['summary']:
+        old = before.get((row['engine'], row['variant']))
+        if old is None:
+            continue
+        changes.append({
+            'engine': row['engine'],
+            'variant': row['variant'],
+            **{field: (round(row[field] - old[field], 4)
+                       if row.get(field) is not None and old.get(field) is not None else None)
+               for field in fields},
+        })
+    return changes
+
+
+def _print_table(rows: List[Dict[str, Any]], fields: List[str]) -> None:
+    print('  '.join(f"{field:>16}" for field in fields))
+    for row in rows:
+        print('  '.join(f"{'-' if row.get(field) is None else row[field]!s:>16}" for field in fields))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--output', default='ocr_benchmark.json', help='where to save JSON results')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    parser.add_argument('--widths', type=lambda s: [int(v) for v in s.split(',')], default=DEFAULT_WIDTHS)
+    parser.add_argument('--fonts', type=lambda s: s.split(','), default=DEFAULT_FONTS)
+    parser.add_argument('--noise', type=lambda s: [float(v) for v in s.split(',')], default=DEFAULT_NOISE)
+    parser.add_argument('--engines', type=lambda s: s.split(','), help='default: every installed engine')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per image and combination')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-warmup', action='store_true', help='include engine load in the first run')
+    parser.add_argument('--trace-memory', action='store_true', help='record tracemalloc peaks (slower)')
+    parser.add_argument('--image-dir', help='keep the rendered images here')
+    args = parser.parse_args(argv)
+
+    if not available_engines():
+        print('No OCR engine is installed (PaddleOCR or Tesseract)', file=sys.stderr)
+        return 1
+    if args.image_dir:
+        os.makedirs(args.image_dir, exist_ok=True)
+
+    corpus = build_corpus(args.widths, args.fonts, args.noise, args.seed)
+    results = run_benchmark(corpus, args.engines, args.repeat, not args.no_warmup,
+                            args.trace_memory, args.image_dir)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    _print_table(results['summary'], ['engine', 'variant', 'p50_seconds', 'p90_seconds', 'p99_seconds',
+                                      'max_rss_mb', 'recall', 'title_accuracy', 'price_accuracy'])
+    print(f"\nSaved {len(results['runs'])} runs to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print(f"\nChange since {args.compare} ({previous.get('created_at')}):")
+        _print_table(compare_results(previous, results),
+                     ['engine', 'variant', 'p50_seconds', 'p90_seconds', 'max_rss_mb',
+                      'recall', 'title_accuracy', 'price_accuracy'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Content-addressed OCR result cache
+Maps (upload sha256, OCR config version) to a finished OCR result so a repeat
+upload of the same bytes skips recognition. Entries for an older engine
+configuration never match and are purged on eviction.
+"""
+
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from models.user import db
+from models.ocr_cache import OCRResultCache
+from utils.ocr_engines import paddle_params
+
+logger = logging.getLogger(__name__)
+
+
+def ocr_config_version() -> str:
+    """Short hash of every setting that changes OCR output"""
+    config = current_app.config
+    settings = {
+        'cache_version': config['OCR_CACHE_VERSION'],
+        'paddle': paddle_params(),
+        'languages': config['OCR_LANGUAGES'],
+        'pipeline': config['OCR_PIPELINE'],
+        'early_exit': [config['OCR_EARLY_EXIT'], config['OCR_EARLY_EXIT_CONFIDENCE'],
+                       config['OCR_EARLY_EXIT_MIN_CHARS']],
+        'pdf': [config['OCR_PDF_DPI'], config['OCR_PDF_MAX_PAGES'], config['OCR_PDF_TEXT_LAYER'],
+                config['OCR_PDF_TEXT_MIN_CHARS']],
+        'layout_parser': config['OCR_LAYOUT_PARSER'],
+        'tiling': [config['OCR_TILING'], config['OCR_TILE_SIZE'], config['OCR_TILE_OVERLAP'],
+                   config['OCR_MAX_VARIANT_PIXELS']],
+        'decode_max_side': config['OCR_DECODE_MAX_SIDE'],
+        'cells': [config['OCR_CELL_SEGMENTATION'], config['OCR_CELL_GAP_LINES'],
+                  config['OCR_CELL_MIN_CELLS']],
+    }
+    encoded = json.dumps(settings, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def get_cached_result(content_hash: Optional[str]) -> Optional[OCRResultCache]:
+    """
+    Return the cached result for this upload and mark it recently used.
+    The mark is left in the caller's transaction: a lookup never commits
+    scans the caller has added but may still roll back.
+    """
+    if not content_hash or not current_app.config['OCR_CACHE_ENABLED']:
+        return None
+
+    entry = OCRResultCache.query.filter_by(
+        content_hash=content_hash,
+        config_version=ocr_config_version()
+    ).first()
+    if entry is None:
+        return None
+
+    entry.hits += 1
+    entry.last_used_at = datetime.utcnow()
+    return entry
+
+
+def store_result(ocr_scan) -> None:
+    """Cache a completed scan's OCR output under its content hash"""
+    if not ocr_scan.content_hash or not current_app.config['OCR_CACHE_ENABLED']:
+        return
+
+    entry = OCRResultCache(
+        content_hash=ocr_scan.content_hash,
+        config_version=ocr_config_version(),
+        ocr_text=ocr_scan.ocr_text,
+        extracted_data=ocr_scan.extracted_data,
+        confidence_score=ocr_scan.confidence_score,
+        items_extracted=ocr_scan.items_extracted,
+        method_used=ocr_scan.method_used
+    )
+    try:
+        db.session.add(entry)
+        db.session.commit()
+    except IntegrityError:
+        # Another worker cached the same upload first
+        db.session.rollback()
+        return
+
+    evict_entries()
+
+
+def evict_entries() -> int:
+    """Drop entries from other config versions, then least recently used beyond OCR_CACHE_MAX_ENTRIES"""
+    removed = OCRResultCache.query.filter(
+        OCRResultCache.config_version != ocr_config_version()
+    ).delete(synchronize_session=False)
+
+    overflow = [row.id for row in OCRResultCache.query.with_entities(OCRResultCache.id).order_by(
+        OCRResultCache.last_used_at.desc()
+    ).offset(current_app.config['OCR_CACHE_MAX_ENTRIES'])]
+    if overflow:
+        removed += OCRResultCache.query.filter(
+            OCRResultCache.id.in_(overflow)
+        ).delete(synchronize_session=False)
+
+    db.session.commit()
+    if removed:
+        logger.info(f"Evicted {removed} OCR cache entries")
+    return removed
@@ -0,0 +1,118 @@
+"""
+Catalog cell segmentation
+Supplier catalog pages are usually grids of product tiles. Before such a
+page is OCRed, a recursive XY-cut of its ink profile finds the tiles: the
+page is split along whitespace gutters at least OCR_CELL_GAP_LINES text
+lines wide, rows first, then columns, then rows again inside each piece.
+Each cell is OCRed on its own (small detection passes that run in
+parallel) and parsed as one product. Pages without a grid (fewer than
+OCR_CELL_MIN_CELLS cells, or no column split) come back as no cells and are
+OCRed whole.
+Analysis runs on a strided grayscale copy of at most ANALYSIS_SIDE pixels,
+so it costs a few milliseconds even on large photos.
+"""
+
+import statistics
+from typing import List, Tuple
+
+import numpy as np
+
+Bounds = Tuple[int, int, int, int]
+
+ANALYSIS_SIDE = 1200  # long side of the copy the profiles are taken from
+MAX_DEPTH = 4  # row, column, row, column splits at most
+
+
+def _otsu_threshold(gray: np.ndarray) -> float:
+    """Gray level that best separates ink from background (Otsu)"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    w0 = np.cumsum(hist)
+    w1 = w0[-1] - w0
+    m0 = np.cumsum(hist * levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mu0 = m0 / w0
+        mu1 = (m0[-1] - m0) / w1
+        between = np.nan_to_num(w0 * w1 * (mu0 - mu1) ** 2)
+    return float(np.argmax(between))
+
+
+def ink_mask(img: np.ndarray, step: int) -> np.ndarray:
+    """Boolean ink mask of every step-th pixel; light text on dark pages is inverted"""
+    sample = img[::step, ::step]
+    gray = sample.mean(axis=2).astype(np.uint8) if sample.ndim == 3 else sample.astype(np.uint8)
+    ink = gray <= _otsu_threshold(gray)
+    if ink.mean() > 0.5:
+        ink = ~ink
+    return ink
+
+
+def _spans(profile: np.ndarray, min_gap: int) -> List[Tuple[int, int]]:
+    """[start, end) runs of ink separated by at least min_gap (>= 1) blank positions"""
+    index = np.flatnonzero(profile)
+    if not index.size:
+        return []
+    breaks = np.flatnonzero(np.diff(index) > min_gap)
+    starts = np.concatenate(([index[0]], index[breaks + 1]))
+    ends = np.concatenate((index[breaks], [index[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _line_height(ink: np.ndarray) -> float:
+    """Median height of the ink runs in the page's row profile"""
+    # Adjacent ink rows belong to one line: runs break on any blank row
+    runs = _spans(ink.any(axis=1), 1)
+    return statistics.median(end - start for start, end in runs) if runs else 0.0
+
+
+def _xy_cut(ink: np.ndarray, bounds: Bounds, gap: int, depth: int,
+            cells: List[Bounds], split_columns: List[bool]) -> None:
+    x0, y0, x1, y1 = bounds
+    region = ink[y0:y1, x0:x1]
+    rows = _spans(region.any(axis=1), gap)
+    columns = _spans(region.any(axis=0), gap)
+    if not rows:
+        return
+
+    if depth < MAX_DEPTH and len(rows) > 1:
+        for start, end in rows:
+            _xy_cut(ink, (x0, y0 + start, x1, y0 + end), gap, depth + 1, cells, split_columns)
+    elif depth < MAX_DEPTH and len(columns) > 1:
+        split_columns[0] = True
+        for start, end in columns:
+            _xy_cut(ink, (x0 + start, y0, x0 + end, y1), gap, depth + 1, cells, split_columns)
+    else:
+        # A leaf: trimmed to its ink
+        cells.append((x0 + columns[0][0], y0 + rows[0][0], x0 + columns[-1][1], y0 + rows[-1][1]))
+
+
+def find_cells(img: np.ndarray, gap_lines: float, min_cells: int) -> List[Bounds]:
+    """
+    Product cells of a catalog grid as (x0, y0, x1, y1) in image pixels, in
+    reading order, padded by half a gutter. Empty when the page is not a grid.
+    """
+    height, width = img.shape[:2]
+    step = max(1, -(-max(width, height) // ANALYSIS_SIDE))
+    ink = ink_mask(img, step)
+
+    line_height = _line_height(ink)
+    if not line_height:
+        return []
+    gap = max(2, int(round(gap_lines * line_height)))
+
+    cells: List[Bounds] = []
+    split_columns = [False]
+    _xy_cut(ink, (0, 0, ink.shape[1], ink.shape[0]), gap, 0, cells, split_columns)
+
+    # Specks smaller than half a text line are noise, not products
+    cells = [cell for cell in cells
+             if cell[2] - cell[0] >= line_height / 2 and cell[3] - cell[1] >= line_height / 2]
+    if len(cells) < min_cells or not split_columns[0]:
+        return []
+
+    pad = gap // 2
+    return [
+        (max(0, (cx0 - pad) * step), max(0, (cy0 - pad) * step),
+         min(width, (cx1 + pad) * step), min(height, (cy1 + pad) * step))
+        for cx0, cy0, cx1, cy1 in cells
+    ]
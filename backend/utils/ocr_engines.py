@@ -0,0 +1,364 @@
+"""
+OCR engine registry
+Loads each OCR model once per worker process and reuses it for every upload.
+With OCR_PRELOAD the gunicorn master loads and warms the engines before
+forking, so every worker starts warm and shares the model pages.
+"""
+
+import atexit
+import gc
+import os
+import sys
+import queue
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+from flask import current_app, has_app_context
+
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+# Try to import PaddleOCR (optional dependency)
+try:
+    from paddleocr import PaddleOCR
+    PADDLE_AVAILABLE = True
+    logger.info("PaddleOCR is available")
+except ImportError:
+    PADDLE_AVAILABLE = False
+    logger.warning("PaddleOCR not available, will use Tesseract fallback")
+
+# Try to import tesserocr (optional: in-process Tesseract API, no subprocess per call)
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+    logger.info("tesserocr is available")
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+
+def ocr_setting(name: str) -> Any:
+    """
+    Read an OCR setting from the active Flask app, or from the environment
+    config when running outside a request (worker threads, CLI, benchmarks)
+    """
+    if has_app_context():
+        return current_app.config[name]
+    return getattr(get_config(), name)
+
+
+def paddle_params(**overrides) -> Dict[str, Any]:
+    """PaddleOCR constructor parameters (receipts-ocr pattern, configurable)"""
+    params = {
+        'lang': ocr_setting('OCR_PADDLE_LANG'),
+        'use_doc_orientation_classify': False,
+        'use_doc_unwarping': False,
+        'use_textline_orientation': False,
+        'text_det_limit_side_len': ocr_setting('OCR_DET_LIMIT_SIDE_LEN'),
+        'text_det_limit_type': 'max',
+        'text_det_thresh': ocr_setting('OCR_DET_THRESH'),
+        'text_det_box_thresh': ocr_setting('OCR_DET_BOX_THRESH'),
+    }
+    params.update(overrides)
+    return params
+
+
+class _EngineEntry:
+    """A loaded engine plus the lock that serializes inference on it"""
+
+    def __init__(self, engine: Any, load_seconds: float):
+        self.engine = engine
+        self.lock = threading.RLock()
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.uses = 0
+
+
+_engines: Dict[Tuple, _EngineEntry] = {}
+_registry_lock = threading.Lock()
+
+
+def _engine_key(kind: str, params: Dict[str, Any]) -> Tuple:
+    return (kind,) + tuple(sorted(params.items()))
+
+
+def _get_entry(kind: str, params: Dict[str, Any], factory) -> _EngineEntry:
+    """Return the cached engine for (kind, params), loading it on first use"""
+    key = _engine_key(kind, params)
+    entry = _engines.get(key)
+    if entry is not None:
+        return entry
+
+    with _registry_lock:
+        # Another thread/greenlet may have loaded it while we waited
+        entry = _engines.get(key)
+        if entry is None:
+            start_time = time.time()
+            engine = factory(params)
+            load_seconds = time.time() - start_time
+            entry = _EngineEntry(engine, load_seconds)
+            _engines[key] = entry
+            logger.info(f"Loaded {kind} engine in {load_seconds:.2f}s")
+    return entry
+
+
+@contextmanager
+def paddle_engine(**overrides):
+    """
+    Borrow the process-wide PaddleOCR engine for the configured parameters.
+    Inference is serialized per engine, so concurrent greenlets/threads in one
+    worker never call predict() on the same model at the same time.
+    """
+    if not PADDLE_AVAILABLE:
+        raise RuntimeError("PaddleOCR is not available")
+
+    entry = _get_entry('paddle', paddle_params(**overrides), lambda params: PaddleOCR(**params))
+    with entry.lock:
+        entry.uses += 1
+        yield entry.engine
+
+
+class _TesseractPool:
+    """
+    Long-lived Tesseract API instances with their language data already loaded.
+    Instances are created on demand up to `size` and handed out one per caller.
+    Closing ends every instance: idle ones at once, ones in use when released.
+    """
+
+    def __init__(self, size: int, lang: str, tessdata_path: str):
+        self.size = max(size, 1)
+        self.lang = lang
+        self.tessdata_path = tessdata_path
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        # Load one instance up front so the first recognition is already warm
+        self._idle.put(self._create())
+        self._created = 1
+
+    def _create(self):
+        if self.tessdata_path:
+            return tesserocr.PyTessBaseAPI(path=self.tessdata_path, lang=self.lang)
+        return tesserocr.PyTessBaseAPI(lang=self.lang)
+
+    def acquire(self):
+        try:
+            return self._checked(self._idle.get_nowait())
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Tesseract pool is closed")
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._create()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._checked(self._idle.get())
+
+    @staticmethod
+    def _checked(api):
+        if api is None:
+            raise RuntimeError("Tesseract pool is closed")
+        return api
+
+    def release(self, api) -> None:
+        with self._lock:
+            if not self._closed:
+                api.Clear()
+                self._idle.put(api)
+                return
+        api.End()
+        # Wake a caller still waiting in acquire() for an instance that is gone
+        self._idle.put(None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle = []
+            while True:
+                try:
+                    idle.append(self._idle.get_nowait())
+                except queue.Empty:
+                    break
+        for api in idle:
+            if api is not None:
+                api.End()
+
+
+def tesseract_params(**overrides) -> Dict[str, Any]:
+    """Tesseract pool parameters"""
+    params = {
+        'lang': ocr_setting('OCR_LANGUAGES'),
+        'tessdata_path': ocr_setting('OCR_TESSDATA_PATH'),
+        'size': ocr_setting('OCR_TESSERACT_POOL_SIZE') or os.cpu_count() or 1,
+    }
+    params.update(overrides)
+    return params
+
+
+@contextmanager
+def tesseract_engine(**overrides):
+    """
+    Borrow a warm tesserocr API from the process-wide pool.
+    Callers get exclusive use of one instance; up to pool size run at once.
+    """
+    if not TESSEROCR_AVAILABLE:
+        raise RuntimeError("tesserocr is not available")
+
+    entry = _get_entry('tesseract', tesseract_params(**overrides), lambda params: _TesseractPool(**params))
+    pool = entry.engine
+    api = pool.acquire()
+    with entry.lock:
+        entry.uses += 1
+    try:
+        yield api
+    finally:
+        pool.release(api)
+
+
+# Preload state of this process; forked workers inherit the master's copy
+_readiness: Dict[str, Any] = {'state': 'cold', 'mode': 'lazy', 'seconds': None, 'error': None}
+
+
+def preload_engines(warmup: bool = True, paddle: bool = True) -> Dict[str, Any]:
+    """
+    Load every available engine now instead of on the first upload, and
+    optionally run one inference on a blank image so lazy allocations
+    (predictor graphs, buffers) also happen here. Called in the gunicorn
+    master with OCR_PRELOAD and by the OCR daemon; failures are reported
+    through engine_readiness(). paddle=False leaves PaddleOCR to the daemon.
+    """
+    _readiness.update(state='warming', mode='preload', error=None)
+    start_time = time.time()
+    blank = np.full((64, 256, 3), 255, dtype=np.uint8)
+    try:
+        if PADDLE_AVAILABLE and paddle:
+            entry = _get_entry('paddle', paddle_params(), lambda params: PaddleOCR(**params))
+            if warmup:
+                with entry.lock:
+                    entry.engine.predict(blank)
+        if TESSEROCR_AVAILABLE:
+            # The pool loads its first instance when it is created
+            pool = _get_entry('tesseract', tesseract_params(), lambda params: _TesseractPool(**params)).engine
+            if warmup:
+                api = pool.acquire()
+                try:
+                    api.SetImageBytes(blank.tobytes(), blank.shape[1], blank.shape[0], 3, blank.shape[1] * 3)
+                    api.GetUTF8Text()
+                finally:
+                    pool.release(api)
+    except Exception as e:
+        _readiness.update(state='failed', error=str(e))
+        logger.error(f"OCR engine preload failed: {e}", exc_info=True)
+        return engine_readiness()
+
+    _readiness.update(state='ready', seconds=round(time.time() - start_time, 3))
+    logger.info(f"Preloaded OCR engines in {_readiness['seconds']:.2f}s")
+    return engine_readiness()
+
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """
+    Resident memory of this process in MB. PSS splits pages shared with other
+    processes (a preloading master and its workers) between them, so summing
+    PSS over workers gives the real total where RSS double counts.
+    """
+    memory = {'rss_mb': None, 'pss_mb': None, 'shared_mb': None}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+        memory['rss_mb'] = round(fields.get('Rss', 0) / 1024, 1)
+        memory['pss_mb'] = round(fields.get('Pss', 0) / 1024, 1)
+        memory['shared_mb'] = round((fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)) / 1024, 1)
+    except OSError:
+        # Not Linux: fall back to peak RSS (KB on Linux, bytes on macOS)
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory['rss_mb'] = round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    return memory
+
+
+def engine_readiness() -> Dict[str, Any]:
+    """
+    Whether this process can OCR without loading a model first.
+    In lazy mode the process is always ready (engines load on first use);
+    in preload mode it is ready once the master finished warming the engines.
+    """
+    loaded = sorted({key[0] for key in _engines})
+    if _readiness['mode'] == 'preload':
+        ready = _readiness['state'] == 'ready'
+    else:
+        ready = True
+    return {
+        'ready': ready,
+        'mode': _readiness['mode'],
+        'state': _readiness['state'],
+        'warm': bool(loaded),
+        'engines': loaded,
+        'preload_seconds': _readiness['seconds'],
+        'error': _readiness['error'],
+        'pid': os.getpid(),
+        'memory': process_memory(),
+    }
+
+
+def get_engine_stats() -> Dict[str, Any]:
+    """
+    Report loaded engines and the latency saved by reusing them.
+    Before the registry every call built a new model, so each reuse after the
+    first saved one full load of that engine (seconds_saved_per_use). An
+    upload can use several engines, or one engine many times (variants, tiles).
+    """
+    engines = []
+    total_saved = 0.0
+    for key, entry in list(_engines.items()):
+        reuses = max(entry.uses - 1, 0)
+        saved = reuses * entry.load_seconds
+        total_saved += saved
+        engines.append({
+            'engine': key[0],
+            'params': dict(key[1:]),
+            'load_seconds': round(entry.load_seconds, 3),
+            'uses': entry.uses,
+            'seconds_saved': round(saved, 3),
+            'seconds_saved_per_use': round(entry.load_seconds, 3) if reuses else 0.0,
+        })
+    return {
+        'engines': engines,
+        'total_seconds_saved': round(total_saved, 3),
+    }
+
+
+def shutdown_engines(kind: Optional[str] = None) -> int:
+    """Release loaded engines (all, or only one kind) and free their memory"""
+    with _registry_lock:
+        keys = [key for key in _engines if kind is None or key[0] == kind]
+        for key in keys:
+            entry = _engines.pop(key)
+            with entry.lock:
+                if hasattr(entry.engine, 'close'):
+                    entry.engine.close()
+                entry.engine = None
+    if keys:
+        gc.collect()
+        logger.info(f"Released {len(keys)} OCR engine(s)")
+    return len(keys)
+
+
+atexit.register(shutdown_engines)
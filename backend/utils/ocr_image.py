@@ -0,0 +1,163 @@
+"""
+Decode-once upload images
+An upload is decoded once into a DecodedImage, which is handed to
+preprocessing and to every engine. Each consumer takes the layout it needs
+(RGB array, BGR array for PaddleOCR, PIL image for Tesseract) from that
+object instead of reading the file again; conversions are made on first use
+and cached. Decodes are counted per scan so a regression shows up in the
+scan's progress events.
+
+Uploads are decoded at the scale OCR needs: JPEGs larger than
+OCR_DECODE_MAX_SIDE are downscaled by libjpeg in the DCT domain while they
+are decoded (PIL draft mode), EXIF orientation is applied to the decoded
+pixels, and images that would decode to more than OCR_MAX_IMAGE_PIXELS are
+refused from their header, before any pixel memory is allocated.
+"""
+
+import math
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from utils.ocr_engines import ocr_setting
+from utils.ocr_timing import timed
+
+EXIF_ORIENTATION = 0x0112
+
+# Decode counter of the scan running in this thread (None outside count_decodes)
+_decodes: ContextVar[Optional[List[int]]] = ContextVar('ocr_decodes', default=None)
+
+
+class DecodedImage:
+    """One decoded RGB image and the views engines need, built lazily"""
+
+    def __init__(self, rgb: np.ndarray, source: Optional[str] = None):
+        self.rgb = rgb
+        self.source = source
+        self._bgr = None
+        self._pil = None
+
+    @property
+    def width(self) -> int:
+        return self.rgb.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.rgb.shape[0]
+
+    @property
+    def bgr(self) -> np.ndarray:
+        """Contiguous BGR array (OpenCV/PaddleOCR channel order), built once"""
+        if self._bgr is None:
+            self._bgr = np.ascontiguousarray(self.rgb[:, :, ::-1])
+        return self._bgr
+
+    @property
+    def pil(self) -> Image.Image:
+        """
+        PIL view of the pixels, built once. PIL stores RGB as 4 bytes per
+        pixel, so this is one copy; when the image came from PIL the original
+        object is reused instead.
+        """
+        if self._pil is None:
+            self._pil = Image.fromarray(self.rgb)
+        return self._pil
+
+    @classmethod
+    def from_pil(cls, img: Image.Image, source: Optional[str] = None) -> 'DecodedImage':
+        """Flatten to RGB (RGBA on white) and keep the PIL image as the pil view"""
+        if img.mode == 'RGBA':
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[3])
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        decoded = cls(np.asarray(img), source)
+        decoded._pil = img
+        return decoded
+
+
+ImageSource = Union[str, np.ndarray, Image.Image, DecodedImage]
+
+
+class ImageTooLarge(ValueError):
+    """Raised for images that would decode to more than OCR_MAX_IMAGE_PIXELS"""
+
+
+def open_image(path: str) -> Image.Image:
+    """
+    Open an image for decoding without reading its pixels. A JPEG whose long
+    side exceeds OCR_DECODE_MAX_SIDE is set to decode at the largest 1/2, 1/4
+    or 1/8 reduction that keeps the long side at or above it. Raises
+    ImageTooLarge when the size it would decode to exceeds OCR_MAX_IMAGE_PIXELS.
+    """
+    try:
+        img = Image.open(path)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(f"{os.path.basename(path)}: {e}") from e
+
+    width, height = img.size
+    max_side = ocr_setting('OCR_DECODE_MAX_SIDE')
+    if max_side and max(width, height) > max_side:
+        ratio = max_side / max(width, height)
+        # No-op for formats without DCT scaling; img.size becomes the decoded size
+        img.draft('RGB', (math.ceil(width * ratio), math.ceil(height * ratio)))
+
+    budget = ocr_setting('OCR_MAX_IMAGE_PIXELS')
+    width, height = img.size
+    if budget and width * height > budget:
+        img.close()
+        raise ImageTooLarge(f"{os.path.basename(path)} decodes to {width}x{height} "
+                            f"({width * height / 1e6:.1f} MP), over the {budget / 1e6:g} MP limit")
+    return img
+
+
+def check_image_pixels(path: str) -> None:
+    """
+    Refuse an uploaded image over the pixel budget from its header alone.
+    Files that are not images (PDFs) are left to the OCR path.
+    """
+    try:
+        open_image(path).close()
+    except OSError:
+        pass
+
+
+def decode_image(image: ImageSource) -> DecodedImage:
+    """
+    Return image as a DecodedImage. Only a file path is decoded (and
+    counted), at the scale open_image() picks and upright per its EXIF
+    orientation; arrays and PIL images are wrapped without copying pixels.
+    """
+    if isinstance(image, DecodedImage):
+        return image
+    if isinstance(image, np.ndarray):
+        return DecodedImage(image)
+    if isinstance(image, Image.Image):
+        return DecodedImage.from_pil(image)
+
+    counter = _decodes.get()
+    if counter is not None:
+        counter[0] += 1
+    with timed('decode'):
+        img = open_image(image)
+        img.load()  # reads the pixels and releases the file
+        # Rotating the reduced image is cheap; exif_transpose copies, so only when needed
+        if img.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            img = ImageOps.exif_transpose(img)
+        return DecodedImage.from_pil(img, image)
+
+
+@contextmanager
+def count_decodes() -> Iterator[List[int]]:
+    """Count file decodes made in this thread while the block runs; yields [count]"""
+    counter = [0]
+    token = _decodes.set(counter)
+    try:
+        yield counter
+    finally:
+        _decodes.reset(token)
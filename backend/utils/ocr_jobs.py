@@ -0,0 +1,371 @@
+"""
+Background OCR jobs
+Runs OCR outside the HTTP request and moves OCRScan rows through
+pending -> processing -> completed/failed. The database row is the queue, so
+scans left pending (or stuck processing) by a dead worker are picked up again
+on the next start.
+"""
+
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models.user import db
+from models.ocr_scan import OCRScan
+from utils.ocr_processor import (
+    process_with_paddleocr, process_batch_with_paddleocr, process_image_multi_method
+)
+from utils.catalog_layout import extract_products
+from utils.ocr_image import count_decodes, decode_image
+from utils.ocr_pool import run_ocr, reserve, release
+from utils.ocr_stats import preferred_variant_order
+from utils.ocr_cache import store_result
+from utils.ocr_progress import record_progress, progress_recorder
+from utils.ocr_timing import add_timings, collect_timings, rounded, timed
+from utils.pdf_processor import is_pdf, pdf_page_count, ocr_pdf_pages
+
+logger = logging.getLogger(__name__)
+
+# Under gevent workers, run OCR on real OS threads so it never blocks the hub
+try:
+    from gevent import monkey
+    if monkey.is_module_patched('threading'):
+        from gevent.threadpool import ThreadPoolExecutor
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """Pool threads do not survive fork: a preloaded master's children start their own"""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def recognize_file(file_path, pipeline, variant_order=None, on_progress=None):
+    """
+    Decode an image upload once and recognize it with the configured pipeline.
+    Runs in the thread handling the scan; engine calls go to the OCR process
+    pool, so on_progress is told about each stage as it happens.
+    Returns (raw_text, confidence, method_used, blocks, decodes, timings)
+    """
+    with count_decodes() as decodes, collect_timings() as timings:
+        try:
+            image = decode_image(file_path)
+        except OSError:
+            # The OCR engine reports unreadable images itself
+            image = file_path
+
+        if pipeline == 'multi':
+            # Try preprocessing variants, likely winners first
+            result = process_image_multi_method(image, variant_order=variant_order, on_progress=on_progress)
+            recognized = result['raw_text'], result['confidence'], result['method_used'], result['blocks']
+        else:
+            if image is not file_path and on_progress is not None:
+                on_progress('decode', width=image.width, height=image.height, variants=1)
+            # Process with PaddleOCR directly (receipts-ocr pattern)
+            with timed('recognition'):
+                raw_text, confidence, blocks = process_with_paddleocr(image)
+            recognized = raw_text, confidence, 'paddleocr_original', blocks
+
+    return recognized + (decodes[0], timings)
+
+
+def _recognize_image(ocr_scan):
+    """
+    OCR a single image upload, recording progress as it goes
+    Returns (raw_text, confidence, method_used, blocks, decodes, timings)
+    """
+    pipeline = current_app.config['OCR_PIPELINE']
+    variant_order = preferred_variant_order(ocr_scan.user_id) if pipeline == 'multi' else None
+    return recognize_file(ocr_scan.file_path, pipeline, variant_order, on_progress=progress_recorder(ocr_scan))
+
+
+def _process_pdf(ocr_scan):
+    """
+    OCR a PDF page by page, committing each page's text, blocks and products
+    to the scan as it finishes so pollers see partial results.
+    Returns (raw_text, confidence, method_used, extracted_data)
+    """
+    page_count = pdf_page_count(ocr_scan.file_path)
+    record_progress(ocr_scan, 'decode', page_count=page_count)
+    texts, pages, products = [], [], []
+    confidences = []
+
+    for page in ocr_pdf_pages(ocr_scan.file_path):
+        record_progress(ocr_scan, 'recognition', page=page['page'], source=page['source'],
+                        confidence=page['confidence'], seconds=round(page['processing_time'], 3))
+        with timed('parse'):
+            page_products = extract_products(page['text'], page['blocks'])
+        record_progress(ocr_scan, 'parse', page=page['page'], items=len(page_products))
+        for product in page_products:
+            product['page'] = page['page']
+
+        texts.append(page['text'])
+        products.extend(page_products)
+        if page['text']:
+            confidences.append(page['confidence'])
+        pages.append({
+            'page': page['page'],
+            'source': page['source'],
+            'engine': page['engine'],
+            'text': page['text'],
+            'blocks': page['blocks'],
+            'confidence': page['confidence'],
+            'processing_time': page['processing_time'],
+            'items_extracted': len(page_products),
+        })
+
+        # JSON columns are not mutation-tracked: assign fresh containers
+        ocr_scan.ocr_text = '\n\n'.join(texts)
+        ocr_scan.extracted_data = {'products': list(products), 'pages': list(pages), 'page_count': page_count}
+        ocr_scan.items_extracted = len(products)
+        record_progress(ocr_scan, 'products', page=page['page'],
+                        start=len(products) - len(page_products), count=len(page_products))
+
+    sources = {page['source'] for page in pages}
+    engines = {page['engine'] for page in pages if page['source'] == 'ocr'}
+    if sources == {'text_layer'}:
+        method_used = 'pdf_text_layer'
+    elif sources == {'ocr'} and len(engines) == 1:
+        method_used = f"{engines.pop()}_pdf"
+    else:
+        method_used = 'pdf_mixed'
+
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return ocr_scan.ocr_text or '', confidence, method_used, ocr_scan.extracted_data or {'products': []}
+
+
+def process_scan(ocr_scan, recognized=None):
+    """
+    Run OCR on a saved scan and store the results on the row, recording a
+    progress event as each stage finishes and the seconds spent per stage
+    (ocr_timing) in ocr_scan.timings.
+    recognized: (raw_text, confidence, method_used, blocks, decodes, timings)
+    already produced by a batched engine call, to skip recognition.
+    Marks the scan failed and re-raises if OCR does not succeed.
+    """
+    with collect_timings() as timings:
+        _process_scan(ocr_scan, recognized, timings)
+
+
+def _process_scan(ocr_scan, recognized, timings):
+    start_time = time.time()
+    try:
+        logger.info(f"Processing OCR for {ocr_scan.filename} (scan_id={ocr_scan.id})")
+
+        if is_pdf(ocr_scan.file_path):
+            raw_text, confidence, method_used, extracted_data = _process_pdf(ocr_scan)
+        else:
+            # decodes: times the upload file was decoded (1 unless a step re-reads it)
+            raw_text, confidence, method_used, blocks, decodes, recognition_timings = (
+                recognized or _recognize_image(ocr_scan))
+            add_timings(recognition_timings)
+            record_progress(ocr_scan, 'recognition', method=method_used, confidence=confidence,
+                            blocks=len(blocks), seconds=round(time.time() - start_time, 3),
+                            decodes=decodes)
+
+            # Parse products from the text box layout (or line by line without boxes)
+            with timed('parse'):
+                extracted_data = {'products': extract_products(raw_text, blocks), 'blocks': blocks}
+            record_progress(ocr_scan, 'parse', items=len(extracted_data['products']))
+            ocr_scan.ocr_text = raw_text
+            ocr_scan.extracted_data = extracted_data
+            ocr_scan.items_extracted = len(extracted_data['products'])
+            record_progress(ocr_scan, 'products', start=0, count=len(extracted_data['products']))
+
+        processing_time = time.time() - start_time
+        products = extracted_data['products']
+
+        # Update OCR scan with results
+        ocr_scan.ocr_text = raw_text
+        ocr_scan.extracted_data = extracted_data
+        ocr_scan.confidence_score = confidence
+        ocr_scan.method_used = method_used
+        ocr_scan.processing_time = processing_time
+        ocr_scan.items_extracted = len(products)
+        ocr_scan.status = 'completed'
+        ocr_scan.completed_at = datetime.utcnow()
+        # db_write covers the writes made so far; this last commit lands with the timings
+        ocr_scan.timings = rounded(dict(timings, total=processing_time))
+
+        record_progress(ocr_scan, 'completed', items=len(products), confidence=confidence,
+                        processing_time=round(processing_time, 3))
+
+        try:
+            store_result(ocr_scan)
+        except Exception as cache_error:
+            db.session.rollback()
+            logger.warning(f"Caching OCR result failed: {cache_error}")
+
+        logger.info(f"OCR completed: {len(products)} products extracted (confidence={confidence:.2f}, time={processing_time:.2f}s)")
+    except Exception as ocr_error:
+        logger.error(f"OCR processing failed: {ocr_error}", exc_info=True)
+        db.session.rollback()
+        ocr_scan.status = 'failed'
+        ocr_scan.error_message = str(ocr_error)
+        ocr_scan.timings = rounded(dict(timings, total=time.time() - start_time))
+        record_progress(ocr_scan, 'failed', error=str(ocr_error))
+        raise
+
+
+def claim_scan(scan_id):
+    """
+    Atomically move a scan from pending to processing.
+    Returns False if another worker already claimed it.
+    """
+    claimed = OCRScan.query.filter_by(id=scan_id, status='pending').update(
+        {'status': 'processing', 'updated_at': datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+    return claimed == 1
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=app.config['OCR_JOB_WORKERS'])
+    return _executor
+
+
+def _run_job(app, scan_id):
+    """Worker entry point: claim the scan and process it"""
+    with app.app_context():
+        try:
+            if not claim_scan(scan_id):
+                logger.info(f"OCR scan {scan_id} already claimed, skipping")
+                return
+            ocr_scan = db.session.get(OCRScan, scan_id)
+            if ocr_scan is None:
+                return
+            process_scan(ocr_scan)
+        except Exception:
+            # process_scan has already recorded the failure on the row
+            pass
+        finally:
+            release()
+            db.session.remove()
+
+
+def enqueue_scan(scan_id, app=None):
+    """
+    Queue a pending scan for background OCR. Its OCR queue slot must already
+    be taken (admit() or reserve()); the job releases it.
+    """
+    app = app or current_app._get_current_object()
+    return _get_executor(app).submit(_run_job, app, scan_id)
+
+
+def _run_batch_job(app, scan_ids):
+    """
+    Worker entry point for a chunk of batch uploads: claim the scans and run
+    single-pass image OCR for all of them in one batched engine call.
+    PDFs and the multi-variant pipeline are processed scan by scan.
+    """
+    with app.app_context():
+        try:
+            scans = []
+            for scan_id in scan_ids:
+                if claim_scan(scan_id):
+                    ocr_scan = db.session.get(OCRScan, scan_id)
+                    if ocr_scan is not None:
+                        scans.append(ocr_scan)
+
+            batchable = []
+            if app.config['OCR_PIPELINE'] != 'multi':
+                batchable = [scan for scan in scans if not is_pdf(scan.file_path)]
+
+            recognized = {}
+            if len(batchable) > 1:
+                try:
+                    start_time = time.perf_counter()
+                    results = run_ocr(process_batch_with_paddleocr, [scan.file_path for scan in batchable])
+                    # Each scan is charged an equal share of the batched call
+                    share = {'recognition': (time.perf_counter() - start_time) / len(batchable)}
+                    for scan, (raw_text, confidence, blocks) in zip(batchable, results):
+                        recognized[scan.id] = (raw_text, confidence, 'paddleocr_original', blocks, None, share)
+                except Exception as e:
+                    logger.warning(f"Batched OCR failed ({e}), processing scans individually")
+
+            for ocr_scan in scans:
+                try:
+                    process_scan(ocr_scan, recognized.get(ocr_scan.id))
+                except Exception:
+                    # process_scan has already recorded the failure on the row
+                    pass
+        finally:
+            release()
+            db.session.remove()
+
+
+def batch_slots(count, app=None):
+    """OCR queue slots taken by a batch of count pending scans: one per OCR_BATCH_SIZE chunk"""
+    app = app or current_app._get_current_object()
+    return math.ceil(count / max(app.config['OCR_BATCH_SIZE'], 1))
+
+
+def enqueue_batch(scan_ids, app=None):
+    """
+    Split pending batch scans into OCR_BATCH_SIZE chunks and queue them across
+    the worker pool. Their slots must already be admitted
+    (admit(batch_slots(len(scan_ids)))); each chunk releases its own.
+    """
+    app = app or current_app._get_current_object()
+    size = max(app.config['OCR_BATCH_SIZE'], 1)
+    executor = _get_executor(app)
+    chunks = [scan_ids[i:i + size] for i in range(0, len(scan_ids), size)]
+    return [executor.submit(_run_batch_job, app, chunk) for chunk in chunks]
+
+
+def recover_scans(app):
+    """
+    Re-queue scans a previous worker left behind: pending scans, and
+    processing scans not updated within OCR_JOB_STALE_SECONDS.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=app.config['OCR_JOB_STALE_SECONDS'])
+
+    OCRScan.query.filter(
+        OCRScan.status == 'processing',
+        OCRScan.updated_at < stale_before
+    ).update({'status': 'pending'}, synchronize_session=False)
+    db.session.commit()
+
+    scan_ids = [row.id for row in OCRScan.query.with_entities(OCRScan.id).filter_by(status='pending')]
+    # Already accepted work: counted in the queue depth, but never refused
+    reserve(len(scan_ids))
+    for scan_id in scan_ids:
+        enqueue_scan(scan_id, app)
+
+    if scan_ids:
+        logger.info(f"Re-queued {len(scan_ids)} pending OCR scan(s)")
+    return len(scan_ids)
+
+
+def shutdown_jobs():
+    """Stop accepting jobs; unfinished scans are recovered on next start"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+atexit.register(shutdown_jobs)
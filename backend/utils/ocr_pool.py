@@ -0,0 +1,389 @@
+"""
+OCR admission control
+CPU-bound recognition runs in a bounded pool of OCR_POOL_WORKERS processes
+instead of in the request greenlet or job thread, so a burst of uploads no
+longer starves cheap requests on the same worker. The thread handling a scan
+decodes and preprocesses it, then sends every engine call (the whole image,
+or each preprocessing variant, tile or catalog cell) to the pool; the pieces
+of one scan run in parallel across its processes, up to OCR_VARIANT_WORKERS
+at a time, and progress is recorded live as each one finishes.
+Uploads needing OCR are admitted only while fewer than OCR_POOL_QUEUE_LIMIT
+admitted scans (or batch chunks) are queued or running; beyond that they
+get an immediate 503 with Retry-After. A batch is admitted whole: all of its
+chunks fit, or none are queued. Queue depth, wait and run times are
+exposed by pool_metrics() (GET /api/ocr/pool). Counts are per API worker
+process.
+With OCR_PRELOAD the pool is started at worker start (start_pool()) by
+forking it from the worker, so its processes share the preloaded, warm
+model pages; a pool started later is spawned and each process loads and
+warms its own engines before taking jobs (pool_readiness(), GET /ready).
+"""
+
+import atexit
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+from utils.ocr_engines import engine_readiness, ocr_setting, preload_engines
+from utils.ocr_service import serving
+
+logger = logging.getLogger(__name__)
+
+# Under gevent workers, wait for results on a real OS thread so the hub keeps serving
+try:
+    from gevent import monkey
+    _GEVENT_PATCHED = monkey.is_module_patched('threading')
+except ImportError:
+    _GEVENT_PATCHED = False
+
+METRIC_WINDOW = 200  # recent jobs the wait/run averages are taken over
+
+# Handlers a gunicorn worker installs; a pool process forked from it restores the defaults
+_WORKER_SIGNALS = ('SIGTERM', 'SIGINT', 'SIGQUIT', 'SIGABRT', 'SIGUSR1', 'SIGWINCH')
+
+_pool = None
+_ready = None  # shared counter of pool processes ready to take jobs
+_lock = threading.Lock()
+_state: Dict[str, Any] = {}
+
+
+def _new_state() -> Dict[str, Any]:
+    return {
+        'depth': 0, 'in_pool': 0, 'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+        'waits': deque(maxlen=METRIC_WINDOW), 'runs': deque(maxlen=METRIC_WINDOW),
+    }
+
+
+_state.update(_new_state())
+
+
+class OCRPoolBusy(Exception):
+    """Raised when an upload arrives while the OCR queue is full"""
+
+    def __init__(self, depth: int, retry_after: int):
+        super().__init__(f'OCR queue is full ({depth} jobs), retry in {retry_after}s')
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+def _init_process(ready, preload: bool, warmup: bool, paddle: bool) -> None:
+    """
+    Runs in each pool process before its first job. A process forked from a
+    preloaded worker already holds its warm engines; a spawned one loads and
+    warms its own with OCR_PRELOAD. Ready processes are counted in `ready`.
+    """
+    for name in _WORKER_SIGNALS:
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), signal.SIG_DFL)
+
+    if preload and engine_readiness()['state'] != 'ready':
+        preload_engines(warmup=warmup, paddle=paddle)
+    if engine_readiness()['ready']:
+        with ready.get_lock():
+            ready.value += 1
+
+
+def _get_pool(fork: bool = False) -> Optional[ProcessPoolExecutor]:
+    """
+    Lazily start the OCR process pool. None when OCR_POOL_WORKERS is 0, and
+    inside pool processes and the OCR daemon (no nested pools, no extra
+    model copies): callers then run the work themselves.
+    """
+    global _pool, _ready
+    workers = ocr_setting('OCR_POOL_WORKERS')
+    if workers <= 0 or multiprocessing.parent_process() is not None or serving():
+        return None
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                # fork only from start_pool(), before the worker starts any thread;
+                # otherwise spawn: never fork a worker that already holds threads and locks
+                context = multiprocessing.get_context('fork' if fork else 'spawn')
+                _ready = context.Value('i', 0)
+                _pool = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=context, initializer=_init_process,
+                    initargs=(_ready, ocr_setting('OCR_PRELOAD'), ocr_setting('OCR_PRELOAD_WARMUP'),
+                              not ocr_setting('OCR_SERVICE_SOCKET'))
+                )
+                # Processes start as jobs arrive: one no-op each starts (and warms) them all now
+                for _ in range(workers):
+                    _pool.submit(os.getpid)
+    return _pool
+
+
+def start_pool() -> bool:
+    """
+    Start the OCR pool when a worker starts instead of on its first upload.
+    Call it before the worker starts any thread: with engines preloaded in
+    this process the pool is forked from it, sharing the warm model pages.
+    """
+    readiness = engine_readiness()
+    return _get_pool(fork=readiness['mode'] == 'preload' and readiness['state'] == 'ready') is not None
+
+
+def pool_available() -> bool:
+    """Whether OCR work from this process goes to the OCR pool"""
+    return _get_pool() is not None
+
+
+def shutdown_pool() -> None:
+    """Stop the OCR process pool (engines inside it are released with it)"""
+    global _pool, _ready
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            _ready = None
+
+
+def _reset_after_fork() -> None:
+    """A forked child cannot use its parent's pool processes; it starts its own"""
+    global _pool, _ready, _lock
+    _pool = None
+    _ready = None
+    _lock = threading.Lock()
+    _state.update(_new_state())
+
+
+atexit.register(shutdown_pool)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _mean(values) -> Optional[float]:
+    return round(sum(values) / len(values), 3) if values else None
+
+
+def retry_after() -> int:
+    """Seconds until a slot is likely free: queued jobs x mean run time / workers"""
+    workers = max(ocr_setting('OCR_POOL_WORKERS'), 1)
+    mean_run = _mean(_state['runs']) or ocr_setting('OCR_POOL_RETRY_AFTER')
+    return max(1, min(60, math.ceil(_state['depth'] * mean_run / workers)))
+
+
+def _claim(slots: int, take: bool) -> None:
+    """Raise OCRPoolBusy unless `slots` more jobs fit in the queue; take them when asked"""
+    with _lock:
+        depth = _state['depth']
+        busy = depth + slots > ocr_setting('OCR_POOL_QUEUE_LIMIT')
+        if busy:
+            _state['rejected'] += 1
+        elif take:
+            _state['depth'] += slots
+    if busy:
+        raise OCRPoolBusy(depth, retry_after())
+
+
+def check_capacity(slots: int = 1) -> None:
+    """Raise OCRPoolBusy when `slots` more jobs would not fit in the queue"""
+    _claim(slots, take=False)
+
+
+def reserve(slots: int = 1) -> None:
+    """Count queued OCR work (a scan or batch chunk) until release()"""
+    with _lock:
+        _state['depth'] += slots
+
+
+def release(slots: int = 1) -> None:
+    """Free slots taken by reserve() or admit()"""
+    with _lock:
+        _state['depth'] = max(0, _state['depth'] - slots)
+
+
+def admit(slots: int = 1) -> None:
+    """
+    Admit OCR work (an upload OCRed in the request, or the chunks of a batch):
+    reserve `slots` at once if they fit, else raise OCRPoolBusy
+    """
+    _claim(slots, take=True)
+
+
+def _timed_call(fn: Callable, submitted_at: float, *args, **kwargs):
+    """Runs in the pool process: report when the job started and how long it ran"""
+    started_at = time.time()
+    result = fn(*args, **kwargs)
+    return result, started_at - submitted_at, time.time() - started_at
+
+
+def _record(waited: float, ran: float) -> None:
+    with _lock:
+        _state['completed'] += 1
+        _state['waits'].append(waited)
+        _state['runs'].append(ran)
+
+
+def _finished(future: Future) -> None:
+    """Done callback of a pool job"""
+    with _lock:
+        _state['in_pool'] -= 1
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            _state['failed'] += 1
+            return
+    _, waited, ran = future.result()
+    _record(waited, ran)
+
+
+def _blocking(fn: Callable, *args):
+    """Call fn(*args), which blocks on pool futures; under gevent on a real OS thread"""
+    if _GEVENT_PATCHED:
+        from gevent import get_hub
+        return get_hub().threadpool.spawn(fn, *args).get()
+    return fn(*args)
+
+
+def _wait(future, timeout: float):
+    return _blocking(future.result, timeout)
+
+
+def _wait_first(futures, timeout: float):
+    """Futures finished once at least one of them is (concurrent.futures.wait), off the hub"""
+    finished, _ = _blocking(wait, futures, timeout, FIRST_COMPLETED)
+    if not finished:
+        raise TimeoutError(f"No OCR pool job finished within {timeout}s")
+    return finished
+
+
+def submit(fn: Callable, *args, **kwargs) -> Optional[Future]:
+    """
+    Submit fn(*args, **kwargs) to the OCR pool; read it with result().
+    fn and its arguments must be picklable (top-level functions, arrays).
+    Returns None when there is no pool: the caller runs fn itself.
+    """
+    pool = _get_pool()
+    if pool is None:
+        return None
+    with _lock:
+        _state['in_pool'] += 1
+        _state['submitted'] += 1
+    try:
+        future = pool.submit(_timed_call, fn, time.time(), *args, **kwargs)
+    except Exception:
+        with _lock:
+            _state['in_pool'] -= 1
+            _state['failed'] += 1
+        raise
+    future.add_done_callback(_finished)
+    return future
+
+
+def result(future: Future) -> Any:
+    """Wait (up to OCR_POOL_TIMEOUT) for a submitted job and return fn's result"""
+    value, waited, ran = _wait(future, ocr_setting('OCR_POOL_TIMEOUT'))
+    return value
+
+
+def run_ocr(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Run fn(*args, **kwargs) in the OCR process pool and wait for its result.
+    Admission happens per upload (admit()), so jobs are never rejected here.
+    Without a pool fn runs in the calling thread (still measured).
+    """
+    try:
+        future = submit(fn, *args, **kwargs)
+        if future is not None:
+            return result(future)
+    except BrokenProcessPool as e:
+        logger.warning(f"OCR pool failed ({e}), running in this thread")
+        shutdown_pool()
+
+    with _lock:
+        _state['in_pool'] += 1
+        _state['submitted'] += 1
+    try:
+        value, waited, ran = _timed_call(fn, time.time(), *args, **kwargs)
+    except Exception:
+        with _lock:
+            _state['failed'] += 1
+        raise
+    finally:
+        with _lock:
+            _state['in_pool'] -= 1
+    _record(waited, ran)
+    return value
+
+
+def run_parallel(fn: Callable, pieces: Sequence[Tuple], limit: int) -> Iterator[Tuple[int, Any]]:
+    """
+    Run fn(*args) for each args tuple in pieces (the variants, tiles or cells
+    of one image) and yield (index, result) as each finishes. Pieces run in
+    the OCR pool, at most `limit` at once (1 = one after another); without a
+    pool they run one by one in this thread, in order. Pieces not started yet
+    when the caller stops iterating are cancelled.
+    """
+    done_indexes = set()
+    limit = max(limit, 1)
+    if pool_available():
+        queued = iter(enumerate(pieces))
+        running: Dict[Future, int] = {}
+        try:
+            for index, args in itertools.islice(queued, limit):
+                running[submit(fn, *args)] = index
+            while running:
+                for future in _wait_first(list(running), ocr_setting('OCR_POOL_TIMEOUT')):
+                    index = running.pop(future)
+                    value = result(future)
+                    done_indexes.add(index)
+                    yield index, value
+                    for index, args in itertools.islice(queued, 1):
+                        running[submit(fn, *args)] = index
+            return
+        except BrokenProcessPool as e:
+            logger.warning(f"OCR pool failed ({e}), running the remaining pieces in this thread")
+            shutdown_pool()
+        finally:
+            for future in running:
+                future.cancel()
+
+    for index, args in enumerate(pieces):
+        if index not in done_indexes:
+            yield index, fn(*args)
+
+
+def pool_readiness() -> Dict[str, Any]:
+    """
+    Whether this worker's OCR pool can take jobs without loading a model:
+    with OCR_PRELOAD, once every pool process has warmed up
+    """
+    workers = ocr_setting('OCR_POOL_WORKERS')
+    ready_processes = _ready.value if _ready is not None else 0
+    return {
+        'workers': workers,
+        'started': _pool is not None,
+        'ready_processes': ready_processes,
+        'ready': workers <= 0 or not ocr_setting('OCR_PRELOAD') or ready_processes >= workers,
+    }
+
+
+def pool_metrics() -> Dict[str, Any]:
+    """
+    Queue depth (admitted scans not finished), jobs in the pool, counters and
+    recent wait (submitted to started in a pool process) and run times
+    """
+    waits = sorted(_state['waits'])
+    return {
+        'workers': ocr_setting('OCR_POOL_WORKERS'),
+        'queue_limit': ocr_setting('OCR_POOL_QUEUE_LIMIT'),
+        'depth': _state['depth'],
+        'saturated': _state['depth'] >= ocr_setting('OCR_POOL_QUEUE_LIMIT'),
+        'in_pool': _state['in_pool'],
+        'submitted': _state['submitted'],
+        'completed': _state['completed'],
+        'failed': _state['failed'],
+        'rejected': _state['rejected'],
+        'mean_wait_seconds': _mean(waits),
+        'p95_wait_seconds': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else None,
+        'mean_run_seconds': _mean(_state['runs']),
+        'pid': os.getpid(),
+    }
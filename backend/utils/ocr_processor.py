@@ -4,34 +4,51 @@ Enhanced with PaddleOCR + Tesseract fallback, optimized sharpening, multi-resolu
 """
 
 import os
+import re
 import time
 import logging
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from PIL import Image, ImageFilter, ImageEnhance
 import numpy as np
 
+from utils.ocr_engines import (
+    PADDLE_AVAILABLE, TESSEROCR_AVAILABLE, paddle_engine, tesseract_engine, ocr_setting
+)
+
+from utils.ocr_image import ImageSource, decode_image
+from utils.ocr_pool import pool_available, run_ocr, run_parallel
+from utils.ocr_service import call as service_call, service_enabled
+from utils.ocr_timing import add_timing, add_timings, collect_timings, timed
+from utils.ocr_cells import find_cells
+from utils.ocr_tiling import needs_tiling, plan_tiles, tiles_in_flight, offset_blocks, merge_tile_blocks
+
+if TESSEROCR_AVAILABLE:
+    import tesserocr
+
 logger = logging.getLogger(__name__)
 
-# Try to import PaddleOCR (optional dependency)
+# Try to import pytesseract (fallback when tesserocr is not installed)
 try:
-    from paddleocr import PaddleOCR
-    PADDLE_AVAILABLE = True
-    logger.info("PaddleOCR is available")
+    import pytesseract
+    PYTESSERACT_AVAILABLE = True
 except ImportError:
-    PADDLE_AVAILABLE = False
-    logger.warning("PaddleOCR not available, will use Tesseract fallback")
+    PYTESSERACT_AVAILABLE = False
 
-# Try to import pytesseract (fallback)
-try:
-    import pytesseract
-    TESSERACT_AVAILABLE = True
+TESSERACT_AVAILABLE = TESSEROCR_AVAILABLE or PYTESSERACT_AVAILABLE
+if TESSERACT_AVAILABLE:
     logger.info("Tesseract is available")
-except ImportError:
-    TESSERACT_AVAILABLE = False
+elif not PADDLE_AVAILABLE:
     logger.error("Neither PaddleOCR nor Tesseract is available!")
 
 
-def preprocess_image_enhanced(image_path: str, output_dir: str) -> List[str]:
+def _save_variant(output_dir: str, base_name: str, method_name: str, img: Image.Image) -> None:
+    """Write a preprocessed variant to disk (debug only)"""
+    img.save(os.path.join(output_dir, f"{base_name}_{method_name}.png"))
+
+
+def preprocess_image_enhanced(image: ImageSource, output_dir: Optional[str] = None,
+                              keep_variants: bool = False,
+                              methods: Optional[List[str]] = None) -> List[Tuple[str, np.ndarray]]:
     """
     Enhanced image preprocessing with multiple techniques:
     1. Original (baseline)
@@ -39,101 +56,87 @@ def preprocess_image_enhanced(image_path: str, output_dir: str) -> List[str]:
     3. Multi-resolution (test at 150%, 200% for small text)
     4. Enhanced contrast + sharpening
     
-    Returns list of preprocessed image paths to test
+    Accepts a file path or an already decoded image (DecodedImage), so an
+    upload decoded once is not read again; 'original' is its RGB array as is.
+    Returns list of (method_name, RGB array) pairs, kept in memory.
+    Variants are only written to output_dir when keep_variants is set.
+    methods builds only the named variants (and the steps they need).
+    Each step is timed as preprocess.<method_name> (ocr_timing).
     """
-    img = Image.open(image_path)
-    
-    # Convert RGBA to RGB if needed
-    if img.mode == 'RGBA':
-        background = Image.new('RGB', img.size, (255, 255, 255))
-        background.paste(img, mask=img.split()[3])
-        img = background
-    elif img.mode != 'RGB':
-        img = img.convert('RGB')
+    decoded = decode_image(image)
+    img = decoded.pil
     
-    preprocessed_paths = []
-    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    variants = []
+    base_name = os.path.splitext(os.path.basename(decoded.source or 'image'))[0]
+    save = keep_variants and output_dir is not None
+    step_start = [time.perf_counter()]
+
+    def add(method_name: str, variant: Image.Image, pixels: Optional[np.ndarray] = None) -> None:
+        variants.append((method_name, np.asarray(variant) if pixels is None else pixels))
+        # A step's time runs from the previous variant to this one being ready
+        add_timing(f'preprocess.{method_name}', time.perf_counter() - step_start[0])
+        if save:
+            _save_variant(output_dir, base_name, method_name, variant)
+        step_start[0] = time.perf_counter()
+
+    def wanted(method_name: str) -> bool:
+        return methods is None or method_name in methods
     
-    # 1. Original (baseline)
-    original_path = os.path.join(output_dir, f"{base_name}_original.png")
-    img.save(original_path)
-    preprocessed_paths.append(('original', original_path))
+    # 1. Original (baseline), reusing the decoded pixels
+    if wanted('original'):
+        add('original', img, decoded.rgb)
     
     # 2. Sharpened (Rule 7: OCR Best Practices)
-    sharpened = img.filter(ImageFilter.SHARPEN)
-    sharpened_path = os.path.join(output_dir, f"{base_name}_sharpened.png")
-    sharpened.save(sharpened_path)
-    preprocessed_paths.append(('sharpened', sharpened_path))
+    if wanted('sharpened') or wanted('enhanced_sharp'):
+        sharpened = img.filter(ImageFilter.SHARPEN)
+        if wanted('sharpened'):
+            add('sharpened', sharpened)
     
-    # 3. Enhanced sharpening (apply SHARPEN twice for better results)
-    enhanced_sharp = img.filter(ImageFilter.SHARPEN).filter(ImageFilter.SHARPEN)
-    enhanced_sharp_path = os.path.join(output_dir, f"{base_name}_enhanced_sharp.png")
-    enhanced_sharp.save(enhanced_sharp_path)
-    preprocessed_paths.append(('enhanced_sharp', enhanced_sharp_path))
+        # 3. Enhanced sharpening (apply SHARPEN twice for better results)
+        if wanted('enhanced_sharp'):
+            add('enhanced_sharp', sharpened.filter(ImageFilter.SHARPEN))
     
     # 4. Contrast + Sharpening
-    enhancer = ImageEnhance.Contrast(img)
-    contrasted = enhancer.enhance(1.5)
-    contrast_sharp = contrasted.filter(ImageFilter.SHARPEN)
-    contrast_sharp_path = os.path.join(output_dir, f"{base_name}_contrast_sharp.png")
-    contrast_sharp.save(contrast_sharp_path)
-    preprocessed_paths.append(('contrast_sharp', contrast_sharp_path))
+    if wanted('contrast_sharp'):
+        enhancer = ImageEnhance.Contrast(img)
+        contrasted = enhancer.enhance(1.5)
+        add('contrast_sharp', contrasted.filter(ImageFilter.SHARPEN))
     
     # 5. Multi-resolution: 150% (for small text)
+    # Upscales are skipped when they would exceed OCR_MAX_VARIANT_PIXELS
     width, height = img.size
-    if width < 2000 or height < 2000:  # Only upscale if image is small
+    max_pixels = ocr_setting('OCR_MAX_VARIANT_PIXELS')
+    # Only upscale if image is small
+    if wanted('150pct_sharp') and (width < 2000 or height < 2000) and width * height * 2.25 <= max_pixels:
         upscaled_150 = img.resize((int(width * 1.5), int(height * 1.5)), Image.Resampling.LANCZOS)
-        upscaled_150_sharp = upscaled_150.filter(ImageFilter.SHARPEN)
-        upscaled_150_path = os.path.join(output_dir, f"{base_name}_150pct_sharp.png")
-        upscaled_150_sharp.save(upscaled_150_path)
-        preprocessed_paths.append(('150pct_sharp', upscaled_150_path))
+        add('150pct_sharp', upscaled_150.filter(ImageFilter.SHARPEN))
     
     # 6. Multi-resolution: 200% (for very small text)
-    if width < 1500 or height < 1500:  # Only upscale if image is very small
+    # Only upscale if image is very small
+    if wanted('200pct_sharp') and (width < 1500 or height < 1500) and width * height * 4 <= max_pixels:
         upscaled_200 = img.resize((int(width * 2.0), int(height * 2.0)), Image.Resampling.LANCZOS)
-        upscaled_200_sharp = upscaled_200.filter(ImageFilter.SHARPEN)
-        upscaled_200_path = os.path.join(output_dir, f"{base_name}_200pct_sharp.png")
-        upscaled_200_sharp.save(upscaled_200_path)
-        preprocessed_paths.append(('200pct_sharp', upscaled_200_path))
+        add('200pct_sharp', upscaled_200.filter(ImageFilter.SHARPEN))
     
-    logger.info(f"Created {len(preprocessed_paths)} preprocessed versions for testing")
-    return preprocessed_paths
+    logger.info(f"Created {len(variants)} preprocessed versions for testing")
+    return variants
 
 
-def process_with_paddleocr(image_path: str) -> Tuple[str, float, List[Dict[str, Any]]]:
-    """
-    Process image with PaddleOCR (using receipts-ocr's working code)
-    Returns: (raw_text, confidence, blocks)
-    """
-    if not PADDLE_AVAILABLE:
-        raise RuntimeError("PaddleOCR is not available")
+def _paddle_input(image: ImageSource) -> Optional[np.ndarray]:
+    """BGR array PaddleOCR expects, or None if a file cannot be decoded"""
+    if isinstance(image, np.ndarray):
+        # PaddleOCR expects OpenCV's BGR channel order
+        return np.ascontiguousarray(image[:, :, ::-1]) if image.ndim == 3 else image
 
-    # Initialize PaddleOCR (receipts-ocr pattern)
-    ocr = PaddleOCR(
-        lang="en",
-        use_doc_orientation_classify=False,
-        use_doc_unwarping=False,
-        use_textline_orientation=False,
-        text_det_limit_side_len=2560,
-        text_det_limit_type="max",
-        text_det_thresh=0.3,
-        text_det_box_thresh=0.5,
-    )
-
-    # Read image with OpenCV (receipts-ocr pattern)
-    import cv2
-    img = cv2.imread(image_path)
-    if img is None:
-        return "", 0.0, []
-
-    # Run OCR (receipts-ocr pattern - uses predict(), not ocr())
-    result = ocr.predict(img)
+    try:
+        # A DecodedImage caches its BGR view, so engines share one conversion
+        return decode_image(image).bgr
+    except OSError:
+        return None
 
-    if not result or len(result) == 0:
-        return "", 0.0, []
 
+def _parse_paddle_result(ocr_result: Any) -> Tuple[str, float, List[Dict[str, Any]]]:
+    """Extract (raw_text, confidence, blocks) from one PaddleOCR predict() result"""
     # Extract results from PaddleOCR predict() response (receipts-ocr pattern)
-    ocr_result = result[0]
     rec_texts = ocr_result.get("rec_texts", [])
     rec_scores = ocr_result.get("rec_scores", [])
     dt_polys = ocr_result.get("dt_polys", [])
@@ -164,131 +167,483 @@ def process_with_paddleocr(image_path: str) -> Tuple[str, float, List[Dict[str,
     return raw_text, float(avg_confidence), blocks
 
 
-def process_with_tesseract(image_path: str) -> Tuple[str, float]:
+def _predict_paddle(img: np.ndarray) -> Tuple[str, float, List[Dict[str, Any]]]:
+    """Run the shared per-process engine on one BGR array"""
+    # receipts-ocr pattern - uses predict(), not ocr()
+    with paddle_engine() as ocr:
+        result = ocr.predict(img)
+
+    if not result or len(result) == 0:
+        return "", 0.0, []
+
+    return _parse_paddle_result(result[0])
+
+
+def process_with_paddleocr(image: ImageSource) -> Tuple[str, float, List[Dict[str, Any]]]:
     """
-    Process image with Tesseract
-    Returns: (raw_text, confidence)
+    Process image with PaddleOCR (using receipts-ocr's working code)
+    Accepts a file path, a DecodedImage, or an in-memory RGB array from
+    preprocess_image_enhanced
+    With OCR_SERVICE_SOCKET the image is recognized by the shared OCR daemon
+    instead of an engine loaded in this process
+    Returns: (raw_text, confidence, blocks)
+    """
+    if not (PADDLE_AVAILABLE or service_enabled()):
+        raise RuntimeError("PaddleOCR is not available")
+
+    img = _paddle_input(image)
+    if img is None:
+        return "", 0.0, []
+
+    if service_enabled():
+        return tuple(service_call('paddle', [img]))
+    return recognize_paddle(img)
+
+
+def recognize_paddle(img: np.ndarray) -> Tuple[str, float, List[Dict[str, Any]]]:
+    """
+    Recognize one BGR array with this process's engine, in the OCR process
+    pool when there is one. Catalog grids are OCRed cell by cell
+    (OCR_CELL_SEGMENTATION); other images larger than the detector's side
+    limit are OCRed in tiles instead of being downsampled (OCR_TILING)
+    """
+    if ocr_setting('OCR_CELL_SEGMENTATION'):
+        with timed('segmentation'):
+            cells = find_cells(img, ocr_setting('OCR_CELL_GAP_LINES'), ocr_setting('OCR_CELL_MIN_CELLS'))
+        if cells:
+            return process_cells_paddleocr(img, cells)
+
+    height, width = img.shape[:2]
+    if ocr_setting('OCR_TILING') and needs_tiling(width, height, ocr_setting('OCR_DET_LIMIT_SIDE_LEN')):
+        return process_tiled_paddleocr(img)
+
+    return run_ocr(_predict_paddle, img)
+
+
+def _ocr_tile(tile: np.ndarray, x0: int, y0: int) -> List[Dict[str, Any]]:
+    """Recognize one BGR tile and return its blocks in page coordinates"""
+    raw_text, confidence, blocks = _predict_paddle(np.ascontiguousarray(tile))
+    return offset_blocks(blocks, x0, y0)
+
+
+def process_tiled_paddleocr(img: np.ndarray) -> Tuple[str, float, List[Dict[str, Any]]]:
+    """
+    OCR a large BGR image as overlapping OCR_TILE_SIZE tiles at full resolution.
+    Tiles run in parallel across the OCR process pool when available, at most
+    as many at once as OCR_VARIANT_WORKERS and OCR_TILE_MEMORY_MB allow.
+    Boxes are merged and de-duplicated along the seams.
+    Returns: (raw_text, confidence, blocks)
+    """
+    height, width = img.shape[:2]
+    tile_size = min(ocr_setting('OCR_TILE_SIZE'), ocr_setting('OCR_DET_LIMIT_SIDE_LEN'))
+    tiles = plan_tiles(width, height, tile_size, ocr_setting('OCR_TILE_OVERLAP'))
+
+    in_flight = tiles_in_flight(tile_size, ocr_setting('OCR_TILE_MEMORY_MB'), ocr_setting('OCR_VARIANT_WORKERS'))
+    logger.info(f"Tiling {width}x{height} image into {len(tiles)} tiles ({in_flight} at a time)")
+
+    pieces = [(img[y0:y1, x0:x1], x0, y0) for x0, y0, x1, y1 in tiles]
+    found = dict(run_parallel(_ocr_tile, pieces, in_flight))
+    blocks = merge_tile_blocks([(bounds, found[index]) for index, bounds in enumerate(tiles)], width, height)
+    if not blocks:
+        return "", 0.0, []
+
+    raw_text = '\n'.join(block['text'] for block in blocks)
+    avg_confidence = sum(block['confidence'] for block in blocks) / len(blocks)
+    return raw_text, float(avg_confidence), blocks
+
+
+def process_cells_paddleocr(img: np.ndarray, cells: List[Tuple[int, int, int, int]]
+                            ) -> Tuple[str, float, List[Dict[str, Any]]]:
+    """
+    OCR each catalog cell of a BGR image on its own: in parallel across the
+    OCR process pool (up to OCR_VARIANT_WORKERS at once) when available,
+    otherwise in one batched predict() call.
+    Blocks come back in page coordinates, cell by cell in reading order,
+    each tagged with its 'cell' index so the parser can map cells to products.
+    Returns: (raw_text, confidence, blocks)
+    """
+    logger.info(f"Segmented {img.shape[1]}x{img.shape[0]} image into {len(cells)} catalog cells")
+
+    if pool_available():
+        pieces = [(img[y0:y1, x0:x1], x0, y0) for x0, y0, x1, y1 in cells]
+        found = dict(run_parallel(_ocr_tile, pieces, ocr_setting('OCR_VARIANT_WORKERS')))
+        cell_blocks = [found[index] for index in range(len(cells))]
+    else:
+        crops = [np.ascontiguousarray(img[y0:y1, x0:x1]) for x0, y0, x1, y1 in cells]
+        cell_blocks = [offset_blocks(blocks, x0, y0)
+                       for (_, _, blocks), (x0, y0, _, _) in zip(recognize_paddle_batch(crops), cells)]
+
+    blocks = [dict(block, cell=index) for index, found in enumerate(cell_blocks) for block in found]
+    if not blocks:
+        return "", 0.0, []
+
+    raw_text = '\n'.join(block['text'] for block in blocks)
+    avg_confidence = sum(block['confidence'] for block in blocks) / len(blocks)
+    return raw_text, float(avg_confidence), blocks
+
+
+def process_batch_with_paddleocr(images: List[ImageSource]) -> List[Tuple[str, float, List[Dict[str, Any]]]]:
+    """
+    Process several images with one PaddleOCR predict() call so detection and
+    recognition run batched (in the OCR daemon with OCR_SERVICE_SOCKET).
+    Unreadable images yield an empty result.
+    Returns one (raw_text, confidence, blocks) per input, in order.
+    """
+    if not (PADDLE_AVAILABLE or service_enabled()):
+        raise RuntimeError("PaddleOCR is not available")
+
+    decoded = [_paddle_input(image) for image in images]
+    readable = [i for i, img in enumerate(decoded) if img is not None]
+    outputs = [("", 0.0, [])] * len(images)
+    if not readable:
+        return outputs
+
+    arrays = [decoded[i] for i in readable]
+    if service_enabled():
+        results = [tuple(result) for result in service_call('paddle_batch', arrays)]
+    else:
+        results = recognize_paddle_batch(arrays)
+
+    for i, result in zip(readable, results):
+        outputs[i] = result
+    return outputs
+
+
+def recognize_paddle_batch(images: List[np.ndarray]) -> List[Tuple[str, float, List[Dict[str, Any]]]]:
+    """Recognize BGR arrays in one predict() call on this process's engine"""
+    with paddle_engine() as ocr:
+        results = list(ocr.predict(images))
+    return [_parse_paddle_result(ocr_result) for ocr_result in results]
+
+
+def _tesseract_block(word: str, confidence: float, left: int, top: int, right: int, bottom: int) -> Dict[str, Any]:
+    """Word box in the same shape as PaddleOCR blocks"""
+    return {
+        'text': word,
+        'confidence': confidence / 100.0,  # Normalize to 0-1
+        'box': [[left, top], [right, top], [right, bottom], [left, bottom]]
+    }
+
+
+def _recognize_tesserocr(img: Image.Image) -> Tuple[Dict[Any, List[str]], List[Dict[str, Any]], List[float]]:
+    """One recognition pass on a warm pooled API (no subprocess, no language reload)"""
+    lines = {}
+    blocks = []
+    confidences = []
+    word_level = tesserocr.RIL.WORD
+    line_number = 0
+
+    with tesseract_engine() as api:
+        api.SetImage(img)
+        api.Recognize()
+        for result in tesserocr.iterate_level(api.GetIterator(), word_level):
+            if result.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line_number += 1
+            word = (result.GetUTF8Text(word_level) or '').strip()
+            confidence = result.Confidence(word_level)
+            box = result.BoundingBox(word_level)
+            if not word or confidence < 0 or box is None:
+                continue
+            blocks.append(_tesseract_block(word, confidence, *box))
+            confidences.append(confidence)
+            lines.setdefault(line_number, []).append(word)
+
+    return lines, blocks, confidences
+
+
+def _recognize_pytesseract(img: Image.Image) -> Tuple[Dict[Any, List[str]], List[Dict[str, Any]], List[float]]:
+    """One image_to_data pass through the tesseract binary"""
+    data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+    
+    lines = {}
+    blocks = []
+    confidences = []
+    for i, word in enumerate(data['text']):
+        word = word.strip()
+        confidence = float(data['conf'][i])
+        if not word or confidence < 0:
+            continue
+        
+        left, top = data['left'][i], data['top'][i]
+        blocks.append(_tesseract_block(word, confidence, left, top,
+                                       left + data['width'][i], top + data['height'][i]))
+        confidences.append(confidence)
+        
+        # Rebuild line text in reading order, like image_to_string
+        line_key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(line_key, []).append(word)
+
+    return lines, blocks, confidences
+
+
+def process_with_tesseract(image: ImageSource) -> Tuple[str, float, List[Dict[str, Any]]]:
+    """
+    Process image with Tesseract in a single recognition pass
+    Uses a pooled in-process tesserocr API when installed, otherwise one
+    pytesseract image_to_data call. Text, confidence and word boxes all come
+    from that one pass.
+    Accepts a file path, a DecodedImage (its PIL view is reused) or an
+    in-memory RGB array
+    Returns: (raw_text, confidence, blocks)
     """
     if not TESSERACT_AVAILABLE:
         raise RuntimeError("Tesseract is not available")
     
-    img = Image.open(image_path)
-    raw_text = pytesseract.image_to_string(img)
+    img = decode_image(image).pil
+    if TESSEROCR_AVAILABLE:
+        lines, blocks, confidences = _recognize_tesserocr(img)
+    else:
+        lines, blocks, confidences = _recognize_pytesseract(img)
     
-    # Get confidence from Tesseract
-    try:
-        data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-        confidences = [c for c in data['conf'] if c != -1]
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
-    except:
-        avg_confidence = 0.0
+    raw_text = '\n'.join(' '.join(words) for words in lines.values())
+    avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
     
-    return raw_text, avg_confidence / 100.0  # Normalize to 0-1
+    return raw_text, avg_confidence / 100.0, blocks
+
+
+def available_engines() -> List[str]:
+    """Installed engines in the order they are tried (Tesseract is the fallback)"""
+    engines = []
+    if PADDLE_AVAILABLE or service_enabled():
+        engines.append('paddleocr')
+    if TESSERACT_AVAILABLE:
+        engines.append('tesseract')
+    return engines
+
+
+def process_with_available_engines(image: ImageSource) -> Tuple[str, float, List[Dict[str, Any]], str]:
+    """
+    Recognize one image with the installed engines in available_engines()
+    order, as the multi-method pipeline tries them: Tesseract is used when
+    PaddleOCR is not installed, fails or reads nothing.
+    Returns: (raw_text, confidence, blocks, engine)
+    """
+    engines = available_engines()
+    if not engines:
+        raise RuntimeError("No OCR engine is available")
+
+    empty = None
+    error = None
+    for engine in engines:
+        try:
+            if engine == 'paddleocr':
+                raw_text, confidence, blocks = process_with_paddleocr(image)
+            else:
+                raw_text, confidence, blocks = run_ocr(process_with_tesseract, image)
+        except Exception as e:
+            logger.warning(f"{engine} failed: {e}")
+            error = e
+            continue
+        if raw_text.strip():
+            return raw_text, confidence, blocks, engine
+        empty = empty or (raw_text, confidence, blocks, engine)
 
+    if empty is None:
+        raise error
+    return empty
 
-def process_image_multi_method(image_path: str, temp_dir: str) -> Dict[str, Any]:
+
+def _evaluate_variant(engine: str, method_name: str, image: np.ndarray) -> Dict[str, Any]:
+    """
+    Run one engine on one preprocessed variant and score it.
+    Top-level so it can run inside the OCR process pool; stages timed there
+    (segmentation) are returned under 'timings' for the caller to add.
+    """
+    start_time = time.time()
+    error = None
+    with collect_timings() as timings:
+        try:
+            if engine == 'paddleocr':
+                raw_text, confidence, blocks = process_with_paddleocr(image)
+            else:
+                raw_text, confidence, blocks = process_with_tesseract(image)
+        except Exception as e:
+            raw_text, confidence, blocks, error = '', 0.0, [], str(e)
+
+    return {
+        'engine': engine,
+        'method': method_name,
+        'raw_text': raw_text,
+        'confidence': float(confidence),
+        'blocks': blocks,
+        # Score = confidence * text_length (prefer more text with good confidence)
+        'score': float(confidence) * len(raw_text),
+        'seconds': time.time() - start_time,
+        'error': error,
+        'timings': timings,
+    }
+
+
+def _is_good_enough(result: Dict[str, Any]) -> bool:
+    """Early-exit test: confident enough and long enough to stop searching"""
+    if not ocr_setting('OCR_EARLY_EXIT') or result['error']:
+        return False
+    return (result['confidence'] >= ocr_setting('OCR_EARLY_EXIT_CONFIDENCE')
+            and len(result['raw_text']) >= ocr_setting('OCR_EARLY_EXIT_MIN_CHARS'))
+
+
+def _variant_summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Timing and score of one evaluated variant, without its text and boxes"""
+    return {
+        'method': f"{result['engine']}_{result['method']}",
+        'confidence': result['confidence'],
+        'text_length': len(result['raw_text']),
+        'score': result['score'],
+        'seconds': round(result['seconds'], 3),
+        'error': result['error'],
+    }
+
+
+def _evaluate_variants(engine: str, variants: List[Tuple[str, np.ndarray]],
+                       on_progress: Optional[Callable[..., None]] = None) -> List[Dict[str, Any]]:
+    """
+    Score variants with one engine, in parallel across the OCR process pool
+    (OCR_VARIANT_WORKERS at a time) when there is one.
+    Variants are tried in the given order; once one passes the early-exit
+    threshold, variants that have not started yet are skipped.
+    on_progress('variant', ...) is called in this thread as each one finishes.
+    """
+    def finished(result):
+        if on_progress is not None:
+            on_progress('variant', **_variant_summary(result))
+
+    pieces = [(engine, method_name, image) for method_name, image in variants]
+    results = []
+    for _, result in run_parallel(_evaluate_variant, pieces, ocr_setting('OCR_VARIANT_WORKERS')):
+        add_timings(result.pop('timings'))
+        results.append(result)
+        finished(result)
+        if _is_good_enough(result):
+            # Variants not started yet are cancelled
+            break
+    return results
+
+
+def order_variants(variants: List[Tuple[str, np.ndarray]],
+                   variant_order: Optional[List[str]] = None) -> List[Tuple[str, np.ndarray]]:
+    """Put the likely winners first; unranked variants keep their default order"""
+    if not variant_order:
+        return variants
+    rank = {method_name: i for i, method_name in enumerate(variant_order)}
+    return sorted(variants, key=lambda variant: rank.get(variant[0], len(rank)))
+
+
+def process_image_multi_method(image_path: ImageSource, temp_dir: Optional[str] = None,
+                               variant_order: Optional[List[str]] = None,
+                               on_progress: Optional[Callable[..., None]] = None,
+                               engines: Optional[List[str]] = None,
+                               methods: Optional[List[str]] = None) -> Dict[str, Any]:
     """
     Process image with multiple preprocessing methods and choose best result
+    image_path may also be an upload already decoded with decode_image.
+    Variants stay in memory; they are written to temp_dir only when
+    OCR_KEEP_VARIANTS is enabled for debugging.
     
     Strategy:
-    1. Try PaddleOCR on all preprocessed versions
+    1. Try PaddleOCR on all preprocessed versions (in parallel in the OCR
+       process pool, OCR_VARIANT_WORKERS at a time), most frequent past winners first
+       (variant_order), stopping early once a result clears the
+       OCR_EARLY_EXIT_* thresholds
     2. If PaddleOCR fails, fall back to Tesseract
     3. Choose result with highest confidence and most text
+
+    on_progress(stage, **data) is told when the image is decoded and as
+    each variant finishes.
+
+    engines and methods restrict the run to those engines and preprocessing
+    variants (the benchmark uses them to score each combination on its own);
+    variants not in methods are not built at all.
     """
     start_time = time.time()
     
     # Create preprocessed versions
-    preprocessed_images = preprocess_image_enhanced(image_path, temp_dir)
-    
-    best_result = None
-    best_score = 0.0
-    method_used = None
-    
-    # Try PaddleOCR first
-    if PADDLE_AVAILABLE:
-        for method_name, prep_path in preprocessed_images:
-            try:
-                raw_text, confidence, blocks = process_with_paddleocr(prep_path)
-                # Score = confidence * text_length (prefer more text with good confidence)
-                score = confidence * len(raw_text)
-                
-                logger.info(f"PaddleOCR ({method_name}): confidence={confidence:.2f}, text_len={len(raw_text)}, score={score:.2f}")
-                
-                if score > best_score:
-                    best_score = score
-                    best_result = {
-                        'raw_text': raw_text,
-                        'confidence': confidence,
-                        'blocks': blocks,
-                        'method': f'paddleocr_{method_name}'
-                    }
-                    method_used = f'paddleocr_{method_name}'
-            except Exception as e:
-                logger.warning(f"PaddleOCR failed on {method_name}: {e}")
+    decoded = decode_image(image_path)
+    preprocessed_images = order_variants(
+        preprocess_image_enhanced(decoded, temp_dir, keep_variants=ocr_setting('OCR_KEEP_VARIANTS'),
+                                  methods=methods),
+        variant_order
+    )
+    if on_progress is not None:
+        height, width = decoded.rgb.shape[:2]
+        on_progress('decode', width=width, height=height, variants=len(preprocessed_images))
     
-    # Fall back to Tesseract if PaddleOCR failed or not available
-    if best_result is None and TESSERACT_AVAILABLE:
-        for method_name, prep_path in preprocessed_images:
-            try:
-                raw_text, confidence = process_with_tesseract(prep_path)
-                score = confidence * len(raw_text)
-                
-                logger.info(f"Tesseract ({method_name}): confidence={confidence:.2f}, text_len={len(raw_text)}, score={score:.2f}")
-                
-                if score > best_score:
-                    best_score = score
-                    best_result = {
-                        'raw_text': raw_text,
-                        'confidence': confidence,
-                        'blocks': [],
-                        'method': f'tesseract_{method_name}'
-                    }
-                    method_used = f'tesseract_{method_name}'
-            except Exception as e:
-                logger.warning(f"Tesseract failed on {method_name}: {e}")
+    if engines is None:
+        engines = available_engines()
+
+    best = None
+    evaluated = []
+    for engine in engines:
+        with timed('recognition'):
+            results = _evaluate_variants(engine, preprocessed_images, on_progress)
+        evaluated.extend(results)
+
+        for result in results:
+            if result['error']:
+                logger.warning(f"{engine} failed on {result['method']}: {result['error']}")
+                continue
+            logger.info(f"{engine} ({result['method']}): confidence={result['confidence']:.2f}, "
+                        f"text_len={len(result['raw_text'])}, score={result['score']:.2f}, "
+                        f"time={result['seconds']:.2f}s")
+            if result['score'] > (best['score'] if best else 0.0):
+                best = result
+
+        if best is not None:
+            break
     
     processing_time = time.time() - start_time
     
-    if best_result is None:
+    if best is None:
         raise RuntimeError("All OCR methods failed")
     
-    best_result['processing_time'] = processing_time
-    best_result['method_used'] = method_used
+    method_used = f"{best['engine']}_{best['method']}"
+    best_result = {
+        'raw_text': best['raw_text'],
+        'confidence': best['confidence'],
+        'blocks': best['blocks'],
+        'method': method_used,
+        'processing_time': processing_time,
+        'method_used': method_used,
+        'early_exit': any(_is_good_enough(result) for result in evaluated),
+        # Per-variant timings and scores for every evaluated variant
+        'variants': [_variant_summary(result) for result in evaluated],
+    }
     
-    logger.info(f"Best result: {method_used} (score={best_score:.2f}, time={processing_time:.2f}s)")
+    logger.info(f"Best result: {method_used} (score={best['score']:.2f}, time={processing_time:.2f}s)")
 
     return best_result
 
 
+PRICE_PATTERN = re.compile(r'\$?\d+[.,]\d{2}')
+
+
+def extract_price(text: str) -> Tuple[Optional[float], str]:
+    """Return (price, text with the price removed); price is None if absent"""
+    price_match = PRICE_PATTERN.search(text)
+    price = None
+    if price_match:
+        price_str = price_match.group().replace('$', '').replace(',', '')
+        try:
+            price = float(price_str)
+        except ValueError:
+            pass
+    return price, PRICE_PATTERN.sub('', text).strip()
+
+
 def parse_product_catalog(raw_text: str) -> List[Dict[str, Any]]:
     """
     Parse product catalog from OCR text
     Extracts product information for marketplace listings
     """
-    import re
-
     products = []
     lines = [l.strip() for l in raw_text.split('\n') if l.strip()]
 
-    price_pattern = r'\$?\d+[.,]\d{2}'
-
     for line in lines:
         # Skip very short lines
         if len(line) < 3:
             continue
 
-        # Extract price if present
-        price_match = re.search(price_pattern, line)
-        price = None
-        if price_match:
-            price_str = price_match.group().replace('$', '').replace(',', '')
-            try:
-                price = float(price_str)
-            except:
-                pass
-
-        # Extract product name (remove price from line)
-        name = re.sub(price_pattern, '', line).strip()
+        # Extract price and product name (line without the price)
+        price, name = extract_price(line)
 
         if name and len(name) >= 3:
             product = {
@@ -301,4 +656,3 @@ def parse_product_catalog(raw_text: str) -> List[Dict[str, Any]]:
             products.append(product)
 
     return products
-
@@ -0,0 +1,106 @@
+"""
+OCR progress events
+Workers append stage events to the scan row as OCR runs (decode, variant,
+recognition, parse, products, then completed or failed). The row is shared
+by every worker process, so the SSE stream and status polling read the same
+events no matter which process runs the scan.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+from models.user import db
+from utils.ocr_timing import timed
+
+TERMINAL_STAGES = ('completed', 'failed')
+
+
+def record_progress(ocr_scan, stage: str, **data) -> Dict[str, Any]:
+    """Append a stage event to the scan and commit it (with any pending row changes)"""
+    events = list(ocr_scan.progress or [])
+    event = {'seq': len(events) + 1, 'stage': stage, 'at': datetime.utcnow().isoformat()}
+    event.update(data)
+    events.append(event)
+    # JSON columns are not mutation-tracked: assign a fresh list
+    ocr_scan.progress = events
+    with timed('db_write'):
+        db.session.commit()
+    return event
+
+
+def progress_recorder(ocr_scan):
+    """Callback for processors that report progress as on_progress(stage, **data)"""
+    return lambda stage, **data: record_progress(ocr_scan, stage, **data)
+
+
+def expand_event(ocr_scan, event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Products events only store their slice of extracted_data['products'];
+    attach the products themselves for clients
+    """
+    if event['stage'] != 'products':
+        return event
+    products = (ocr_scan.extracted_data or {}).get('products', [])
+    start = event.get('start', 0)
+    return dict(event, products=products[start:start + event.get('count', 0)])
+
+
+def new_events(ocr_scan, after: int) -> List[Dict[str, Any]]:
+    """Events with seq greater than `after`, ready to send"""
+    return [expand_event(ocr_scan, event) for event in (ocr_scan.progress or []) if event['seq'] > after]
+
+
+def is_finished(ocr_scan) -> bool:
+    """No further events will be recorded for this scan"""
+    return ocr_scan.status not in ('pending', 'processing')
+
+
+def final_event(ocr_scan, after: int) -> Dict[str, Any]:
+    """
+    Terminal event for scans that finished without recording one (cache hits,
+    corrected scans, scans from before progress was recorded)
+    """
+    return {
+        'seq': after + 1,
+        'stage': 'failed' if ocr_scan.status == 'failed' else 'completed',
+        'status': ocr_scan.status,
+        'items_extracted': ocr_scan.items_extracted,
+    }
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """One Server-Sent Events message"""
+    return f"id: {event['seq']}\nevent: {event['stage']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def stream_events(load_scan, after: int, poll_interval: float, timeout: float, sleep) -> Iterator[str]:
+    """
+    Yield SSE messages for a scan until it finishes or `timeout` passes.
+    load_scan() returns a freshly loaded row (or None once it is deleted);
+    a comment line is sent on idle polls to keep proxies from closing the stream.
+    """
+    waited = 0.0
+    while True:
+        ocr_scan = load_scan()
+        if ocr_scan is None:
+            return
+
+        events = new_events(ocr_scan, after)
+        for event in events:
+            yield format_sse(event)
+            after = event['seq']
+
+        if is_finished(ocr_scan):
+            recorded = ocr_scan.progress or []
+            if not recorded or recorded[-1]['stage'] not in TERMINAL_STAGES:
+                yield format_sse(final_event(ocr_scan, after))
+            return
+
+        if waited >= timeout:
+            yield 'event: timeout\ndata: {}\n\n'
+            return
+        if not events:
+            yield ': keep-alive\n\n'
+        sleep(poll_interval)
+        waited += poll_interval
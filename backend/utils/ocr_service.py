@@ -0,0 +1,289 @@
+"""
+Shared OCR service
+An optional daemon that owns the PaddleOCR models for a whole node. API
+workers (and their OCR pool processes) send images to it over a Unix socket
+instead of each loading a model, so OCR memory per node no longer grows with
+the number of API workers. Start it next to the API:
+
+    python -m utils.ocr_service --socket /run/ocr/ocr.sock
+
+and set OCR_SERVICE_SOCKET to the same path for the API. Images of at least
+OCR_SERVICE_SHM_MIN_BYTES are handed over in shared memory: the client copies
+the pixels into a segment once and the daemon reads them in place; smaller
+images travel inline with the request.
+Requests are pickled, so both ends first prove they know
+OCR_SERVICE_AUTHKEY (multiprocessing's HMAC challenge) before the daemon
+reads anything from a connection.
+"""
+
+import argparse
+import logging
+import os
+import signal
+import sys
+import threading
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Connection, Listener, answer_challenge, deliver_challenge
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils.ocr_engines import ocr_setting
+
+logger = logging.getLogger(__name__)
+
+_serving = False  # True inside the daemon process
+_local = threading.local()  # client connection, one per thread
+
+
+class OCRServiceUnavailable(RuntimeError):
+    """Raised when the OCR daemon cannot be reached or does not answer in time"""
+
+
+def serving() -> bool:
+    """Whether this process is the OCR daemon"""
+    return _serving
+
+
+def service_enabled() -> bool:
+    """Whether PaddleOCR recognition is sent to the OCR daemon"""
+    return bool(ocr_setting('OCR_SERVICE_SOCKET')) and not _serving
+
+
+def _authkey() -> bytes:
+    """Shared secret of the API and the daemon (OCR_SERVICE_AUTHKEY)"""
+    return (ocr_setting('OCR_SERVICE_AUTHKEY') or '').encode()
+
+
+# -- client -----------------------------------------------------------------
+
+def _connection() -> Connection:
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        authkey = _authkey()
+        if not authkey:
+            raise OCRServiceUnavailable("OCR_SERVICE_AUTHKEY is not set")
+        try:
+            conn = Client(ocr_setting('OCR_SERVICE_SOCKET'), family='AF_UNIX', authkey=authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise OCRServiceUnavailable(f"OCR service not reachable: {e}") from e
+        _local.conn = conn
+    return conn
+
+
+def disconnect() -> None:
+    """Close this thread's connection to the daemon (reopened on the next call)"""
+    conn = getattr(_local, 'conn', None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+
+def _reset_after_fork() -> None:
+    """A forked child must not share its parent's socket; it connects on its own"""
+    global _local
+    _local = threading.local()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _pack(images: Sequence[np.ndarray], segments: List[SharedMemory]) -> List[Dict[str, Any]]:
+    """Describe each image for the daemon, copying large ones into shared memory"""
+    specs = []
+    for img in images:
+        img = np.ascontiguousarray(img)
+        if img.nbytes < max(ocr_setting('OCR_SERVICE_SHM_MIN_BYTES'), 1):
+            specs.append({'array': img})
+            continue
+        shm = SharedMemory(create=True, size=img.nbytes)
+        segments.append(shm)
+        np.ndarray(img.shape, img.dtype, buffer=shm.buf)[...] = img
+        specs.append({'shm': shm.name, 'shape': img.shape, 'dtype': img.dtype.str})
+    return specs
+
+
+def _exchange(request: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    for attempt in (1, 2):
+        conn = _connection()
+        try:
+            conn.send(request)
+            if not conn.poll(timeout):
+                # A late reply would be read by the next request: start over
+                disconnect()
+                raise OCRServiceUnavailable(f"OCR service did not answer within {timeout}s")
+            return conn.recv()
+        except (EOFError, OSError) as e:
+            # The daemon restarted since this connection was opened: reconnect once
+            disconnect()
+            if attempt == 2:
+                raise OCRServiceUnavailable(f"OCR service connection lost: {e}") from e
+
+
+def call(op: str, images: Sequence[np.ndarray] = (), timeout: Optional[float] = None) -> Any:
+    """
+    Run op on the daemon with images and return its result. Errors raised in
+    the daemon are re-raised as RuntimeError; an unreachable or silent daemon
+    raises OCRServiceUnavailable.
+    """
+    segments: List[SharedMemory] = []
+    try:
+        request = {'op': op, 'images': _pack(images, segments)}
+        reply = _exchange(request, timeout or ocr_setting('OCR_SERVICE_TIMEOUT'))
+    finally:
+        # The daemon is done with the pixels once it has replied (or gone)
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+    if not reply['ok']:
+        raise RuntimeError(f"OCR service: {reply['error']}")
+    return reply['result']
+
+
+def service_status() -> Dict[str, Any]:
+    """Readiness of the daemon as seen from this process"""
+    try:
+        return {'reachable': True, **call('ping', timeout=5)}
+    except RuntimeError as e:
+        return {'reachable': False, 'ready': False, 'error': str(e)}
+
+
+# -- daemon -----------------------------------------------------------------
+
+def _attach(spec: Dict[str, Any], segments: List[SharedMemory]) -> np.ndarray:
+    """The image a client described, read in place when it is in shared memory"""
+    if 'array' in spec:
+        return spec['array']
+    shm = SharedMemory(name=spec['shm'])
+    # The client owns the segment: keep this process's tracker from unlinking it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    segments.append(shm)
+    return np.ndarray(spec['shape'], np.dtype(spec['dtype']), buffer=shm.buf)
+
+
+def _attach_all(specs: List[Dict[str, Any]], segments: List[SharedMemory]) -> List[np.ndarray]:
+    return [_attach(spec, segments) for spec in specs]
+
+
+def _handle(request: Dict[str, Any], handlers: Dict[str, Callable]) -> Dict[str, Any]:
+    segments: List[SharedMemory] = []
+    images = None
+    try:
+        handler = handlers.get(request.get('op'))
+        if handler is None:
+            raise ValueError(f"unknown operation {request.get('op')!r}")
+        images = _attach_all(request.get('images', []), segments)
+        return {'ok': True, 'result': handler(images)}
+    except Exception as e:
+        logger.error(f"OCR service {request.get('op')} failed: {e}", exc_info=True)
+        return {'ok': False, 'error': str(e)}
+    finally:
+        images = None  # drop the views before unmapping the segments
+        for shm in segments:
+            try:
+                shm.close()
+            except BufferError:
+                logger.warning(f"Shared image {shm.name} still referenced, left mapped")
+
+
+def _serve_connection(conn: Connection, handlers: Dict[str, Callable], authkey: bytes) -> None:
+    """Authenticate one client, then answer its requests, in order, until it disconnects"""
+    with conn:
+        # On this client's thread, so a client that never answers cannot stall accept()
+        try:
+            deliver_challenge(conn, authkey)
+            answer_challenge(conn, authkey)
+        except (AuthenticationError, EOFError, OSError) as e:
+            logger.warning(f"OCR service client rejected: {e}")
+            return
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            reply = _handle(request, handlers)
+            try:
+                conn.send(reply)
+            except OSError:
+                return
+
+
+def _accept_loop(listener: Listener, handlers: Dict[str, Callable], authkey: bytes) -> None:
+    """One thread per client; inference is still serialized per engine"""
+    while True:
+        try:
+            conn = listener.accept()
+        except OSError:
+            return  # listener closed
+        threading.Thread(target=_serve_connection, args=(conn, handlers, authkey), daemon=True).start()
+
+
+def _handlers() -> Dict[str, Callable]:
+    from utils.ocr_engines import engine_readiness
+    from utils.ocr_processor import recognize_paddle, recognize_paddle_batch
+    return {
+        'ping': lambda images: engine_readiness(),
+        'paddle': lambda images: recognize_paddle(images[0]),
+        'paddle_batch': recognize_paddle_batch,
+    }
+
+
+def serve(socket_path: str, warmup: bool = True) -> None:
+    """Load the engines, then serve recognition on socket_path until terminated"""
+    global _serving
+    _serving = True
+
+    authkey = _authkey()
+    if not authkey:
+        raise SystemExit("OCR_SERVICE_AUTHKEY is required")
+
+    from utils.ocr_engines import preload_engines
+    readiness = preload_engines(warmup=warmup)
+    if not readiness['ready']:
+        raise SystemExit(f"OCR engines failed to load: {readiness['error']}")
+
+    if os.path.exists(socket_path):
+        try:
+            Client(socket_path, family='AF_UNIX').close()
+        except OSError:
+            os.unlink(socket_path)  # left behind by a daemon that did not shut down
+        else:
+            raise SystemExit(f"An OCR service is already listening on {socket_path}")
+
+    old_umask = os.umask(0o117)  # socket usable by the owner and group only
+    try:
+        # Clients are authenticated with authkey per connection (_serve_connection)
+        listener = Listener(socket_path, family='AF_UNIX')
+    finally:
+        os.umask(old_umask)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    logger.info(f"OCR service listening on {socket_path} (pid {os.getpid()})")
+    try:
+        _accept_loop(listener, _handlers(), authkey)
+    finally:
+        listener.close()  # also removes the socket file
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--socket', help='Unix socket to listen on (default: OCR_SERVICE_SOCKET)')
+    parser.add_argument('--no-warmup', action='store_true', help='skip the warm-up inference')
+    args = parser.parse_args(argv)
+
+    socket_path = args.socket or ocr_setting('OCR_SERVICE_SOCKET')
+    if not socket_path:
+        parser.error('--socket or OCR_SERVICE_SOCKET is required')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    serve(socket_path, warmup=not args.no_warmup)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
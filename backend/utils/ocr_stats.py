@@ -0,0 +1,118 @@
+"""
+OCR variant statistics
+Which preprocessing variant wins most often, read from OCRScan.method_used
+(left unset on scans completed from the OCR result cache).
+Used to try the likely winner first and to find variants that never win.
+Also aggregates the per-stage timings recorded on each scan.
+"""
+
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+
+from models.user import db
+from models.ocr_scan import OCRScan
+
+_ranking_cache: Dict[Optional[str], Tuple[float, List[str]]] = {}
+_ranking_lock = threading.Lock()
+
+
+def get_variant_wins(user_id: Optional[str] = None) -> List[Dict[str, object]]:
+    """Count completed scans per winning method, most wins first"""
+    query = db.session.query(
+        OCRScan.method_used,
+        func.count(OCRScan.id),
+        func.avg(OCRScan.confidence_score),
+        func.avg(OCRScan.processing_time)
+    ).filter(
+        OCRScan.method_used.isnot(None),
+        OCRScan.status.in_(['completed', 'corrected'])
+    )
+    if user_id is not None:
+        query = query.filter(OCRScan.user_id == user_id)
+
+    rows = query.group_by(OCRScan.method_used).order_by(func.count(OCRScan.id).desc()).all()
+    return [
+        {
+            'method_used': method_used,
+            'wins': wins,
+            'avg_confidence': round(avg_confidence, 4) if avg_confidence is not None else None,
+            'avg_processing_time': round(avg_time, 3) if avg_time is not None else None,
+        }
+        for method_used, wins, avg_confidence, avg_time in rows
+    ]
+
+
+def _variant_name(method_used: str) -> str:
+    """paddleocr_150pct_sharp -> 150pct_sharp"""
+    return method_used.split('_', 1)[1] if '_' in method_used else method_used
+
+
+def preferred_variant_order(user_id: Optional[str] = None) -> List[str]:
+    """
+    Variant names ordered by past wins, cached for OCR_VARIANT_STATS_TTL
+    seconds. Per user when OCR_VARIANT_STATS_SCOPE is 'user', otherwise
+    across the whole deployment.
+    """
+    scope = user_id if current_app.config['OCR_VARIANT_STATS_SCOPE'] == 'user' else None
+
+    cached = _ranking_cache.get(scope)
+    if cached and time.time() - cached[0] < current_app.config['OCR_VARIANT_STATS_TTL']:
+        return cached[1]
+
+    order = []
+    for row in get_variant_wins(scope):
+        name = _variant_name(row['method_used'])
+        if name not in order:
+            order.append(name)
+
+    with _ranking_lock:
+        _ranking_cache[scope] = (time.time(), order)
+    return order
+
+
+def clear_variant_ranking() -> None:
+    """Forget cached rankings (e.g. after pruning variants)"""
+    with _ranking_lock:
+        _ranking_cache.clear()
+
+
+def get_stage_timings(user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Latency percentiles per OCR stage over the most recent
+    OCR_TIMING_STATS_WINDOW finished scans that recorded timings, slowest
+    stage first. share is the stage's part of all 'total' seconds.
+    """
+    query = db.session.query(OCRScan.timings).filter(
+        OCRScan.timings.isnot(None),
+        OCRScan.status.in_(['completed', 'corrected', 'failed'])
+    )
+    if user_id is not None:
+        query = query.filter(OCRScan.user_id == user_id)
+
+    rows = query.order_by(OCRScan.created_at.desc()).limit(current_app.config['OCR_TIMING_STATS_WINDOW']).all()
+    samples: Dict[str, List[float]] = {}
+    for (timings,) in rows:
+        for stage, seconds in (timings or {}).items():
+            samples.setdefault(stage, []).append(seconds)
+
+    overall = sum(samples.get('total', [])) or None
+    stages = []
+    for stage, values in samples.items():
+        p50, p90, p99 = (round(float(value), 4) for value in np.percentile(values, [50, 90, 99]))
+        stages.append({
+            'stage': stage,
+            'count': len(values),
+            'mean_seconds': round(sum(values) / len(values), 4),
+            'p50_seconds': p50,
+            'p90_seconds': p90,
+            'p99_seconds': p99,
+            'max_seconds': round(max(values), 4),
+            'share': round(sum(values) / overall, 4) if overall else None,
+        })
+    stages.sort(key=lambda row: row['mean_seconds'] * row['count'], reverse=True)
+    return {'scans': len(rows), 'stages': stages}
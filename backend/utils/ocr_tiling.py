@@ -0,0 +1,137 @@
+"""
+OCR tiling utilities
+Splits very large images into overlapping tiles and merges the per-tile
+text boxes back into one page, de-duplicating text along the seams.
+"""
+
+import statistics
+from typing import Any, Dict, List, Tuple
+
+Bounds = Tuple[int, int, int, int]
+
+# Rough working set of detection + recognition per input pixel (bytes),
+# used to turn OCR_TILE_MEMORY_MB into a number of tiles in flight
+TILE_BYTES_PER_PIXEL = 12
+
+# Grid cell size for the spatial hash used while de-duplicating boxes
+_GRID_CELL = 256
+
+
+def needs_tiling(width: int, height: int, limit_side_len: int) -> bool:
+    """Tile when the detector would otherwise downsample the image"""
+    return max(width, height) > limit_side_len
+
+
+def _starts(length: int, tile: int, step: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def plan_tiles(width: int, height: int, tile_size: int, overlap: int) -> List[Bounds]:
+    """Overlapping (x0, y0, x1, y1) tiles covering the image, row by row"""
+    step = max(tile_size - overlap, 1)
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in _starts(height, tile_size, step)
+        for x0 in _starts(width, tile_size, step)
+    ]
+
+
+def tiles_in_flight(tile_size: int, memory_mb: int, workers: int) -> int:
+    """How many tiles may be recognized at once within the memory cap"""
+    per_tile = tile_size * tile_size * TILE_BYTES_PER_PIXEL
+    return max(1, min(workers, (memory_mb * 1024 * 1024) // per_tile))
+
+
+def offset_blocks(blocks: List[Dict[str, Any]], x0: int, y0: int) -> List[Dict[str, Any]]:
+    """Move tile-local boxes into page coordinates"""
+    return [
+        dict(block, box=[[point[0] + x0, point[1] + y0] for point in block['box']])
+        for block in blocks
+    ]
+
+
+def box_bounds(box: List[List[float]]) -> Tuple[float, float, float, float]:
+    """Axis-aligned (x0, y0, x1, y1) of a polygon box"""
+    xs = [point[0] for point in box]
+    ys = [point[1] for point in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _cells(bbox: Tuple[float, float, float, float]):
+    x0, y0, x1, y1 = bbox
+    for cx in range(int(x0) // _GRID_CELL, int(x1) // _GRID_CELL + 1):
+        for cy in range(int(y0) // _GRID_CELL, int(y1) // _GRID_CELL + 1):
+            yield cx, cy
+
+
+def _overlap_ratio(a, b) -> float:
+    """Intersection over the smaller box's area"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return (width * height) / smaller if smaller > 0 else 0.0
+
+
+def merge_tile_blocks(tile_results: List[Tuple[Bounds, List[Dict[str, Any]]]],
+                      width: int, height: int, edge_margin: int = 4) -> List[Dict[str, Any]]:
+    """
+    Merge page-coordinate blocks from overlapping tiles.
+    A block touching a tile edge that is not the page edge was probably cut
+    by the seam, so complete copies from the neighbouring tile win. Remaining
+    duplicates (mostly overlapping boxes) keep the most confident copy.
+    Uses a spatial hash, so cost grows with the number of blocks, not pairs.
+    """
+    candidates = []
+    for (tx0, ty0, tx1, ty1), blocks in tile_results:
+        for block in blocks:
+            if not block.get('box'):
+                continue
+            bbox = box_bounds(block['box'])
+            truncated = (
+                (tx0 > 0 and bbox[0] - tx0 <= edge_margin)
+                or (ty0 > 0 and bbox[1] - ty0 <= edge_margin)
+                or (tx1 < width and tx1 - bbox[2] <= edge_margin)
+                or (ty1 < height and ty1 - bbox[3] <= edge_margin)
+            )
+            area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+            candidates.append((truncated, -block['confidence'], -area, bbox, block))
+
+    candidates.sort(key=lambda candidate: candidate[:3])
+
+    kept = []
+    grid: Dict[Tuple[int, int], List[Tuple[float, float, float, float]]] = {}
+    for _, _, _, bbox, block in candidates:
+        cells = list(_cells(bbox))
+        if any(_overlap_ratio(bbox, other) > 0.5 for cell in cells for other in grid.get(cell, ())):
+            continue
+        for cell in cells:
+            grid.setdefault(cell, []).append(bbox)
+        kept.append((bbox, block))
+
+    return reading_order(kept)
+
+
+def reading_order(items: List[Tuple[Tuple[float, float, float, float], Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Sort (bbox, block) pairs top-to-bottom in rows, then left-to-right"""
+    if not items:
+        return []
+
+    line_height = statistics.median(bbox[3] - bbox[1] for bbox, _ in items) or 1
+    items = sorted(items, key=lambda item: (item[0][1] + item[0][3]) / 2)
+
+    rows = []
+    row_center = None
+    for bbox, block in items:
+        center = (bbox[1] + bbox[3]) / 2
+        if row_center is None or center - row_center > line_height / 2:
+            rows.append([])
+            row_center = center
+        rows[-1].append((bbox, block))
+
+    return [block for row in rows for _, block in sorted(row, key=lambda item: item[0][0])]
@@ -0,0 +1,63 @@
+"""
+OCR stage timings
+Each scan records how long its stages took in OCRScan.timings (seconds per
+stage): decode, preprocess.<variant> for each preprocessing step,
+recognition, parse, db_write and total. Finding the cells of a catalog grid
+is also reported as segmentation, a part of recognition. Code anywhere in
+the pipeline adds to the timings of the scan running in this thread with
+timed(). Preprocessing variants scored in an OCR pool process collect their
+own timings there and return them with their result, which the scan's
+thread adds back (add_timings).
+
+PaddleOCR runs text detection and recognition in one predict() call, so
+both are timed together as 'recognition'. It is wall time in the scan's
+thread, so it includes waiting for a free OCR pool process (reported on
+its own as the pool's wait times, GET /api/ocr/pool).
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+# Timings of the scan running in this thread (None outside collect_timings)
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('ocr_timings', default=None)
+
+
+def add_timing(stage: str, seconds: float) -> None:
+    """Add seconds to a stage of the scan being timed (no-op outside collect_timings)"""
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def add_timings(timings: Dict[str, float]) -> None:
+    """Add timings collected elsewhere (an OCR pool process) to the current scan"""
+    for stage, seconds in timings.items():
+        add_timing(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time the block as (part of) a stage"""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(stage, time.perf_counter() - start_time)
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """Collect stage timings made in this thread while the block runs; yields the dict"""
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def rounded(timings: Dict[str, float]) -> Dict[str, float]:
+    """Timings as stored on the scan (milliseconds precision)"""
+    return {stage: round(seconds, 3) for stage, seconds in timings.items()}
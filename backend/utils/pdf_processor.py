@@ -0,0 +1,136 @@
+"""
+PDF OCR Utilities
+Rasterizes one page at a time so memory stays bounded by a single page,
+however long the document is. Pages that carry a text layer are read
+directly instead of being OCRed.
+"""
+
+import time
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from utils.ocr_engines import ocr_setting
+from utils.ocr_processor import process_with_available_engines
+from utils.ocr_timing import timed
+
+logger = logging.getLogger(__name__)
+
+# Try to import PyMuPDF (optional dependency for PDF uploads)
+try:
+    import fitz
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+    logger.warning("PyMuPDF not available, PDF uploads cannot be processed")
+
+
+def is_pdf(file_path: Optional[str]) -> bool:
+    """Check whether a saved upload is a PDF"""
+    return bool(file_path) and file_path.lower().endswith('.pdf')
+
+
+def _require_pdf_support() -> None:
+    if not PDF_AVAILABLE:
+        raise RuntimeError("PDF support is not available (install PyMuPDF)")
+
+
+def pdf_page_count(pdf_path: str) -> int:
+    """Number of pages that will be processed (capped at OCR_PDF_MAX_PAGES)"""
+    _require_pdf_support()
+    with fitz.open(pdf_path) as doc:
+        return min(doc.page_count, ocr_setting('OCR_PDF_MAX_PAGES'))
+
+
+def _rasterize(page, dpi: int) -> np.ndarray:
+    """Render one page to an RGB array"""
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+    rows = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+    return rows[:, :pix.width * 3].reshape(pix.height, pix.width, 3)
+
+
+def iter_pdf_pages(pdf_path: str, dpi: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Yield (page_number, RGB array) one page at a time.
+    Only the current page's raster is alive while the caller processes it.
+    """
+    _require_pdf_support()
+    dpi = dpi or ocr_setting('OCR_PDF_DPI')
+    max_pages = ocr_setting('OCR_PDF_MAX_PAGES')
+
+    with fitz.open(pdf_path) as doc:
+        for index in range(min(doc.page_count, max_pages)):
+            yield index + 1, _rasterize(doc.load_page(index), dpi)
+
+
+def extract_text_layer(page, dpi: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Read a page's embedded text as lines, in reading order.
+    Boxes are scaled to the raster's pixel space at dpi, like PaddleOCR's.
+    """
+    scale = dpi / 72.0
+    lines = []
+    blocks = []
+    for block in page.get_text('dict', sort=True)['blocks']:
+        for line in block.get('lines', []):
+            text = ''.join(span['text'] for span in line['spans']).strip()
+            if not text:
+                continue
+            x0, y0, x1, y1 = (round(v * scale, 1) for v in line['bbox'])
+            lines.append(text)
+            blocks.append({
+                'text': text,
+                'confidence': 1.0,
+                'box': [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+            })
+    return '\n'.join(lines), blocks
+
+
+def ocr_pdf_pages(pdf_path: str, dpi: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Process a PDF page by page, yielding each page's result as soon as it is ready.
+    Pages with an extractable text layer skip rasterizing and OCR entirely;
+    only image-only pages are OCRed, with the same engine selection as image
+    uploads (process_with_available_engines). Each result records its
+    'source' and, for OCRed pages, the 'engine' that read it.
+    """
+    _require_pdf_support()
+    dpi = dpi or ocr_setting('OCR_PDF_DPI')
+    max_pages = ocr_setting('OCR_PDF_MAX_PAGES')
+    use_text_layer = ocr_setting('OCR_PDF_TEXT_LAYER')
+    min_chars = ocr_setting('OCR_PDF_TEXT_MIN_CHARS')
+
+    with fitz.open(pdf_path) as doc:
+        for index in range(min(doc.page_count, max_pages)):
+            page = doc.load_page(index)
+            page_number = index + 1
+            start_time = time.time()
+
+            with timed('text_layer'):
+                raw_text, blocks = extract_text_layer(page, dpi) if use_text_layer else ('', [])
+            if len(raw_text.strip()) >= min_chars:
+                source = 'text_layer'
+                confidence = 1.0
+                engine = None
+            else:
+                source = 'ocr'
+                # Recognition (the page, or its tiles or catalog cells) runs in the OCR process pool
+                with timed('decode'):
+                    raster = _rasterize(page, dpi)
+                with timed('recognition'):
+                    raw_text, confidence, blocks, engine = process_with_available_engines(raster)
+            processing_time = time.time() - start_time
+
+            logger.info(f"PDF page {page_number} ({source}): confidence={confidence:.2f}, "
+                        f"text_len={len(raw_text)}, time={processing_time:.2f}s")
+
+            yield {
+                'page': page_number,
+                'source': source,
+                'engine': engine,
+                'text': raw_text,
+                'confidence': confidence,
+                'blocks': blocks,
+                'processing_time': processing_time,
+            }
@@ -0,0 +1,251 @@
+"""
+Data retention sweeper
+Removes OCR scans, their upload files, stray upload files, OCR result cache
+entries and audit log rows older than DATA_RETENTION_DAYS. Rows are deleted RETENTION_BATCH_SIZE at a
+time with a commit after each batch, so no sweep holds locks for long or
+grows the transaction log. Run it with `flask sweep-retention` (cron) or set
+RETENTION_SWEEP_INTERVAL to sweep from a background thread in each worker.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models.user import db
+from models.audit_log import AuditLog
+from models.listing import Listing
+from models.ocr_cache import OCRResultCache
+from models.ocr_scan import OCRScan
+from utils.file_upload import delete_upload_file
+
+logger = logging.getLogger(__name__)
+
+# Scans still queued or running are never swept
+ACTIVE_STATUSES = ('pending', 'processing')
+
+
+def _remove_file(file_path: Optional[str]) -> Optional[int]:
+    """Delete one upload file; returns its size, or None if nothing was deleted"""
+    try:
+        size = os.path.getsize(file_path) if file_path else None
+    except OSError:
+        return None
+    return size if size is not None and delete_upload_file(file_path) else None
+
+
+def _count_file(report: Dict[str, int], file_path: Optional[str]) -> None:
+    reclaimed = _remove_file(file_path)
+    if reclaimed is not None:
+        report['files'] += 1
+        report['bytes'] += reclaimed
+
+
+def _pause() -> None:
+    """Let other transactions in between batches"""
+    pause = current_app.config['RETENTION_BATCH_PAUSE']
+    if pause > 0:
+        time.sleep(pause)
+
+
+def sweep_ocr_scans(cutoff: datetime, batch_size: int) -> Dict[str, int]:
+    """Delete finished scans created before cutoff, then their upload files"""
+    report = {'rows': 0, 'files': 0, 'bytes': 0}
+    while True:
+        batch = OCRScan.query.with_entities(OCRScan.id, OCRScan.file_path).filter(
+            OCRScan.created_at < cutoff,
+            OCRScan.status.notin_(ACTIVE_STATUSES)
+        ).order_by(OCRScan.created_at).limit(batch_size).all()
+        if not batch:
+            return report
+
+        scan_ids = [row.id for row in batch]
+        # Listings keep their data; only the link to the expired scan goes
+        Listing.query.filter(Listing.ocr_scan_id.in_(scan_ids)).update(
+            {'ocr_scan_id': None}, synchronize_session=False)
+        report['rows'] += OCRScan.query.filter(OCRScan.id.in_(scan_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+        # Files go after the commit: a failed batch never leaves rows pointing at missing files
+        for row in batch:
+            _count_file(report, row.file_path)
+
+        if len(batch) < batch_size:
+            return report
+        _pause()
+
+
+def sweep_upload_files(cutoff: datetime, batch_size: int) -> Dict[str, int]:
+    """
+    Delete files under UPLOAD_FOLDER/ocr last modified before cutoff that no
+    scan refers to (uploads whose request failed, scans deleted without
+    their file)
+    """
+    report = {'files': 0, 'bytes': 0}
+    upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'ocr')
+    if not os.path.isdir(upload_dir):
+        return report
+
+    def check(paths):
+        referenced = {row.file_path for row in OCRScan.query.with_entities(OCRScan.file_path).filter(
+            OCRScan.file_path.in_(paths))}
+        for path in paths:
+            if path not in referenced:
+                _count_file(report, path)
+
+    # cutoff is naive UTC, like the created_at columns
+    cutoff_ts = cutoff.replace(tzinfo=timezone.utc).timestamp()
+    candidates = []
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff_ts:
+                    candidates.append(entry.path)
+            except OSError:
+                continue
+            if len(candidates) >= batch_size:
+                check(candidates)
+                candidates = []
+    if candidates:
+        check(candidates)
+    return report
+
+
+def sweep_ocr_cache(cutoff: datetime, batch_size: int) -> Dict[str, int]:
+    """
+    Delete OCR result cache entries last used before cutoff: they hold the
+    text and products of uploads that may themselves have expired
+    """
+    report = {'rows': 0}
+    while True:
+        entry_ids = [row.id for row in OCRResultCache.query.with_entities(OCRResultCache.id).filter(
+            OCRResultCache.last_used_at < cutoff
+        ).order_by(OCRResultCache.last_used_at).limit(batch_size)]
+        if not entry_ids:
+            return report
+
+        report['rows'] += OCRResultCache.query.filter(OCRResultCache.id.in_(entry_ids)).delete(
+            synchronize_session=False)
+        db.session.commit()
+
+        if len(entry_ids) < batch_size:
+            return report
+        _pause()
+
+
+def sweep_audit_logs(cutoff: datetime, batch_size: int) -> Dict[str, int]:
+    """Delete audit log rows created before cutoff"""
+    report = {'rows': 0}
+    while True:
+        log_ids = [row.id for row in AuditLog.query.with_entities(AuditLog.id).filter(
+            AuditLog.created_at < cutoff
+        ).order_by(AuditLog.created_at).limit(batch_size)]
+        if not log_ids:
+            return report
+
+        report['rows'] += AuditLog.query.filter(AuditLog.id.in_(log_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+        if len(log_ids) < batch_size:
+            return report
+        _pause()
+
+
+def sweep_expired(days: Optional[int] = None, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Remove everything older than days (default DATA_RETENTION_DAYS) in
+    batches of batch_size (default RETENTION_BATCH_SIZE). Must run in an app
+    context. Returns rows and bytes reclaimed per kind.
+    """
+    config = current_app.config
+    days = config['DATA_RETENTION_DAYS'] if days is None else days
+    batch_size = max(1, batch_size or config['RETENTION_BATCH_SIZE'])
+    if days <= 0:
+        return {'skipped': 'retention disabled (DATA_RETENTION_DAYS <= 0)'}
+
+    start_time = time.time()
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    scans = sweep_ocr_scans(cutoff, batch_size)
+    files = sweep_upload_files(cutoff, batch_size)
+    cache = sweep_ocr_cache(cutoff, batch_size)
+    audit_logs = sweep_audit_logs(cutoff, batch_size)
+
+    report = {
+        'cutoff': cutoff.isoformat(),
+        'ocr_scans': scans,
+        'upload_files': files,
+        'ocr_cache': cache,
+        'audit_logs': audit_logs,
+        'rows_deleted': scans['rows'] + cache['rows'] + audit_logs['rows'],
+        'bytes_reclaimed': scans['bytes'] + files['bytes'],
+        'seconds': round(time.time() - start_time, 3),
+    }
+    logger.info(f"Retention sweep removed {report['rows_deleted']} rows and "
+                f"{report['bytes_reclaimed']} bytes older than {days} days")
+    return report
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """The sweeper thread does not survive fork; each worker starts its own"""
+    global _sweeper, _sweeper_lock
+    _sweeper = None
+    _sweeper_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _sweep_forever(app, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                sweep_expired()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Retention sweep failed: {e}", exc_info=True)
+            finally:
+                db.session.remove()
+
+
+def start_retention_sweeper(app) -> bool:
+    """Start the background sweep every RETENTION_SWEEP_INTERVAL hours (0 = off)"""
+    global _sweeper
+    interval = app.config['RETENTION_SWEEP_INTERVAL'] * 3600
+    if interval <= 0:
+        return False
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, args=(app, interval),
+                                        name='retention-sweeper', daemon=True)
+            _sweeper.start()
+    return True
+
+
+@click.command('sweep-retention')
+@click.option('--days', type=int, default=None, help='Override DATA_RETENTION_DAYS')
+@click.option('--batch-size', type=int, default=None, help='Override RETENTION_BATCH_SIZE')
+@with_appcontext
+def sweep_retention_command(days, batch_size):
+    """Delete expired OCR scans, upload files, OCR cache entries and audit logs"""
+    report = sweep_expired(days, batch_size)
+    if 'skipped' in report:
+        click.echo(report['skipped'])
+        return
+    click.echo(f"OCR scans:    {report['ocr_scans']['rows']} rows, {report['ocr_scans']['files']} files")
+    click.echo(f"Upload files: {report['upload_files']['files']} unreferenced files")
+    click.echo(f"OCR cache:    {report['ocr_cache']['rows']} rows")
+    click.echo(f"Audit logs:   {report['audit_logs']['rows']} rows")
+    click.echo(f"Reclaimed {report['rows_deleted']} rows and {report['bytes_reclaimed']} bytes "
+               f"in {report['seconds']}s (cutoff {report['cutoff']})")